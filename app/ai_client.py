@@ -0,0 +1,119 @@
+import importlib.util
+import time
+from typing import Any, Dict
+import httpx
+from app.config import settings
+from app.metrics import ai_request_duration
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class AIClient:
+    client: httpx.AsyncClient = None  # type: ignore
+    transport: httpx.AsyncHTTPTransport = None  # type: ignore
+    requests: int = 0
+    errors: int = 0
+    in_flight: int = 0
+
+
+ai_client = AIClient()
+
+
+def _http2_enabled() -> bool:
+    if not settings.AI_HTTP2:
+        return False
+    if importlib.util.find_spec("h2") is None:
+        logger.warning("AI_HTTP2 is enabled but the 'h2' package is missing, using HTTP/1.1")
+        return False
+    return True
+
+
+def _create_client() -> httpx.AsyncClient:
+    limits = httpx.Limits(
+        max_connections=settings.AI_HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.AI_HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=settings.AI_HTTP_KEEPALIVE_EXPIRY,
+    )
+    ai_client.transport = httpx.AsyncHTTPTransport(
+        limits=limits, http2=_http2_enabled(), retries=settings.AI_HTTP_RETRIES
+    )
+    return httpx.AsyncClient(
+        base_url=settings.AI_SERVICE_URL,
+        timeout=settings.AI_SERVICE_TIMEOUT,
+        transport=ai_client.transport,
+    )
+
+
+async def connect_ai_client():
+    ai_client.client = _create_client()
+    print("AI service client ready")
+
+
+async def close_ai_client():
+    if ai_client.client:
+        await ai_client.client.aclose()
+        ai_client.client = None
+        print("AI service client closed")
+
+
+def get_ai_client() -> httpx.AsyncClient:
+    """Shared client for the AI service, created on first use if needed"""
+    if ai_client.client is None:
+        ai_client.client = _create_client()
+    return ai_client.client
+
+
+async def post_to_ai(path: str, payload: Dict[str, Any]) -> httpx.Response:
+    """POST to the AI service through the shared client"""
+    client = get_ai_client()
+    ai_client.requests += 1
+    ai_client.in_flight += 1
+    outcome = "error"
+    start = time.perf_counter()
+    try:
+        response = await client.post(path, json=payload)
+        outcome = str(response.status_code)
+        return response
+    except httpx.HTTPError:
+        ai_client.errors += 1
+        raise
+    finally:
+        ai_client.in_flight -= 1
+        ai_request_duration.observe(time.perf_counter() - start, path, outcome)
+
+
+def get_ai_client_stats() -> Dict[str, Any]:
+    """Request counters and connection pool usage of the shared client"""
+    stats = {
+        "requests": ai_client.requests,
+        "errors": ai_client.errors,
+        "in_flight": ai_client.in_flight,
+        "max_connections": settings.AI_HTTP_MAX_CONNECTIONS,
+        "connections": 0,
+        "idle_connections": 0,
+        "http2_connections": 0,
+        "pool_introspection": False,
+    }
+
+    # httpx does not expose pool state publicly; read it from httpcore when
+    # its private attributes are there, otherwise count requests in flight
+    # (each holds a connection)
+    pool = getattr(ai_client.transport, "_pool", None)
+    connections = getattr(pool, "connections", None)
+    if connections is None:
+        stats["connections"] = ai_client.in_flight
+        return stats
+    try:
+        for connection in connections:
+            stats["connections"] += 1
+            if connection.is_idle():
+                stats["idle_connections"] += 1
+            if "HTTP/2" in connection.info():
+                stats["http2_connections"] += 1
+    except Exception as e:
+        logger.debug(f"AI client pool introspection failed: {str(e)}")
+        stats.update(connections=ai_client.in_flight, idle_connections=0, http2_connections=0)
+        return stats
+    stats["pool_introspection"] = True
+    return stats
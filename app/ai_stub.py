@@ -0,0 +1,62 @@
+"""Local stand-in for the external AI service.
+
+Implements the endpoints the backend calls, with canned suggestions derived
+from the submitted consumption data, so ingestion and the prediction
+pipeline can be exercised without the real service:
+
+    uvicorn app.ai_stub:app --port 8001
+"""
+from typing import Any, Dict, List, Optional
+from fastapi import FastAPI
+from pydantic import BaseModel
+
+app = FastAPI(title="HEMS AI Service Stub")
+
+
+class PredictionRequest(BaseModel):
+    user_id: str
+    consumption_data: List[Dict[str, Any]] = []
+    prediction_type: str = "daily"
+    timestamp: Optional[str] = None
+
+
+class BatchPredictionRequest(BaseModel):
+    requests: List[PredictionRequest]
+
+
+class UsageHistoryRequest(BaseModel):
+    user_id: str
+    usage_data: Dict[str, Any] = {}
+    timestamp: Optional[str] = None
+
+
+def _predict(request: PredictionRequest) -> Dict[str, Any]:
+    total_kwh = sum(item.get("power_usage_kwh") or 0 for item in request.consumption_data)
+    suggestions = [f"Expected usage over the next day: {total_kwh:.2f}kWh"]
+    if total_kwh > 10:
+        suggestions.append("Shift heavy appliances to off-peak hours")
+    return {
+        "user_id": request.user_id,
+        "prediction_type": request.prediction_type,
+        "suggestions": suggestions,
+    }
+
+
+@app.post("/predict")
+async def predict(request: PredictionRequest):
+    return _predict(request)
+
+
+@app.post("/predict/batch")
+async def predict_batch(batch: BatchPredictionRequest):
+    return {"predictions": [_predict(request) for request in batch.requests]}
+
+
+@app.post("/usage-history")
+async def usage_history(request: UsageHistoryRequest):
+    return {"status": "received", "user_id": request.user_id}
+
+
+@app.get("/health")
+async def health():
+    return {"status": "healthy"}
@@ -1,32 +1,129 @@
-from fastapi import Depends, HTTPException, status
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+import logging
+import re
+from datetime import timedelta
+from typing import Optional
+from fastapi import Depends, HTTPException, Query, status
+from fastapi.security import APIKeyHeader, HTTPBearer, HTTPAuthorizationCredentials
+from app.cache import TTLCache
+from app.config import settings
 from app.database import get_collection
-from app.utils import verify_token
-from app.models import User
+from app.state import state
+from app.utils import create_access_token, verify_token
+from app.models import User, PyObjectId
+from app.services.device_service import DeviceKey, DeviceService
 
 security = HTTPBearer()
+optional_security = HTTPBearer(auto_error=False)
+device_key_header = APIKeyHeader(name="X-API-Key", auto_error=False)
+
+# Scope of the short-lived tokens that /alerts/stream accepts in its URL,
+# where they end up in access and proxy logs; they are valid nowhere else
+STREAM_SCOPE = "alerts:stream"
+
+# Resolved users keyed by the "uid" claim, so repeated requests with the same
+# token skip the users lookup. Entries are dropped when the user changes.
+_principal_cache = TTLCache(settings.PRINCIPAL_CACHE_SIZE, settings.PRINCIPAL_CACHE_TTL_SECONDS)
+state.register_cache("principal", _principal_cache)
+
+def invalidate_principal(user_id: PyObjectId):
+    """Forget the cached user after it has been modified"""
+    state.invalidate("principal", str(user_id))
+
+def principal_cache_stats():
+    return _principal_cache.stats()
+
+def create_stream_token(user: User) -> str:
+    """Token for ?access_token= on /alerts/stream, valid for a minute"""
+    return create_access_token(
+        data={"sub": user.email, "uid": str(user.id), "scope": STREAM_SCOPE},
+        expires_delta=timedelta(seconds=settings.ALERT_STREAM_TOKEN_SECONDS),
+    )
+
+class AccessTokenLogFilter(logging.Filter):
+    """Redact ?access_token= from access log lines"""
+
+    _pattern = re.compile(r"(access_token=)[^&\s]*")
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if isinstance(record.args, tuple):
+            record.args = tuple(
+                self._pattern.sub(r"\1[redacted]", arg) if isinstance(arg, str) else arg
+                for arg in record.args
+            )
+        return True
 
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    return await _resolve_user(credentials.credentials)
+
+async def get_stream_user(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security),
+    access_token: Optional[str] = Query(None),
+):
+    """Like get_current_user, also accepting ?access_token= since browsers
+    cannot set headers on EventSource connections; only stream tokens
+    (POST /alerts/stream-token) are accepted there"""
+    if credentials:
+        return await _resolve_user(credentials.credentials)
+    if not access_token:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return await _resolve_user(access_token, scope=STREAM_SCOPE)
+
+async def _resolve_user(token: str, scope: Optional[str] = None) -> User:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
     
-    payload = verify_token(credentials.credentials)
-    if payload is None:
+    payload = verify_token(token)
+    if payload is None or payload.get("scope") != scope:
         raise credentials_exception
         
     email = payload.get("sub")
     if email is None:
         raise credentials_exception
     
+    # Tokens issued before the "uid" claim existed always take the lookup
+    user_key = payload.get("uid")
+    if user_key:
+        user = _principal_cache.get(user_key)
+        if user is not None and user.email == email:
+            return user
+    
     users_collection = get_collection("users")
     user_data = await users_collection.find_one({"email": email})
     if user_data is None:
         raise credentials_exception
         
-    return User(**user_data)
+    user = User(**user_data)
+    if user_key and str(user.id) == user_key:
+        _principal_cache.set(user_key, user)
+    return user
+
+async def get_sensor_device(
+    api_key: Optional[str] = Depends(device_key_header),
+) -> Optional[DeviceKey]:
+    """Device sending sensor readings, from its X-API-Key header
+
+    Readings without a key are accepted (None) unless REQUIRE_DEVICE_API_KEY
+    is set; a key that is given must belong to an active device.
+    """
+    if not api_key:
+        if settings.REQUIRE_DEVICE_API_KEY:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED, detail="Missing device API key"
+            )
+        return None
+    device = await DeviceService.authenticate(api_key)
+    if device is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid device API key"
+        )
+    return device
 
 async def get_current_active_user(current_user: User = Depends(get_current_user)):
-    return current_user
\ No newline at end of file
+    return current_user
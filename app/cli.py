@@ -0,0 +1,145 @@
+"""Maintenance commands for the HEMS backend.
+
+Usage:
+    python -m app.cli indexes            # create missing indexes, report drift
+    python -m app.cli indexes --check    # only report drift, exit 1 if any
+    python -m app.cli rollups [--since YYYY-MM-DD] [--user USER_ID]
+                                         # rebuild consumption rollups from raw data
+    python -m app.cli unread-counts      # recompute the unread alert counters
+    python -m app.cli archive COLLECTION [--since YYYY-MM-DD] [--before YYYY-MM-DD]
+                              [--dir DIR] [--delete]
+                                         # archive alerts, predictions or consumptions
+                                         # to gzip-compressed ndjson before they expire
+    python -m app.cli timeseries-migrate [--drop-legacy]
+                                         # move consumptions to a time-series collection
+"""
+import argparse
+import asyncio
+import json
+import sys
+from datetime import datetime
+from bson import ObjectId
+from app.database import connect_to_mongo, close_mongo_connection, get_database
+from app.indexes import ensure_indexes, has_drift
+from app.services.alert_service import AlertService
+from app.services.consumption_service import ConsumptionService
+from app.services.retention_service import RetentionService
+from app.services.rollup_service import RollupService
+
+
+async def run_indexes(args: argparse.Namespace) -> int:
+    report = await ensure_indexes(get_database(), create=not args.check)
+    print(json.dumps(report, indent=2))
+    return 1 if args.check and has_drift(report) else 0
+
+
+async def run_rollups(args: argparse.Namespace) -> int:
+    # The rebuild merges on (user_id, period_start), which needs the unique indexes
+    await ensure_indexes(get_database())
+    since = datetime.strptime(args.since, "%Y-%m-%d") if args.since else None
+    user_id = ObjectId(args.user) if args.user else None
+    rebuilt = await RollupService.rebuild(since=since, user_id=user_id)
+    print(json.dumps(rebuilt, indent=2))
+    return 0
+
+
+async def run_unread_counts(args: argparse.Namespace) -> int:
+    reconciled = await AlertService.reconcile_unread_counts()
+    print(json.dumps(reconciled, indent=2))
+    return 0
+
+
+async def run_archive(args: argparse.Namespace) -> int:
+    since = datetime.strptime(args.since, "%Y-%m-%d") if args.since else None
+    before = datetime.strptime(args.before, "%Y-%m-%d") if args.before else None
+    try:
+        archived = await RetentionService.archive(
+            args.collection, before=before, since=since, directory=args.dir, delete=args.delete
+        )
+    except ValueError as e:
+        print(str(e), file=sys.stderr)
+        return 2
+    print(json.dumps(archived, indent=2))
+    return 0
+
+
+async def run_timeseries_migrate(args: argparse.Namespace) -> int:
+    try:
+        migrated = await ConsumptionService.migrate_to_timeseries(
+            batch_size=args.batch_size, drop_legacy=args.drop_legacy
+        )
+    except ValueError as e:
+        print(str(e), file=sys.stderr)
+        return 2
+    print(json.dumps(migrated, indent=2))
+    return 0
+
+
+async def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.cli")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    indexes_parser = commands.add_parser(
+        "indexes", help="Create or verify the declared MongoDB indexes"
+    )
+    indexes_parser.add_argument(
+        "--check", action="store_true", help="Report drift without creating indexes"
+    )
+    indexes_parser.set_defaults(handler=run_indexes)
+
+    rollups_parser = commands.add_parser(
+        "rollups", help="Rebuild the hourly/daily/monthly consumption rollups"
+    )
+    rollups_parser.add_argument(
+        "--since", help="Only rebuild from this date (YYYY-MM-DD, start of its month)"
+    )
+    rollups_parser.add_argument("--user", help="Only rebuild this user id")
+    rollups_parser.set_defaults(handler=run_rollups)
+
+    unread_parser = commands.add_parser(
+        "unread-counts", help="Recompute the unread alert counters from the alerts"
+    )
+    unread_parser.set_defaults(handler=run_unread_counts)
+
+    archive_parser = commands.add_parser(
+        "archive", help="Archive documents to a gzip-compressed ndjson file"
+    )
+    archive_parser.add_argument(
+        "collection", choices=["alerts", "predictions", "consumptions"]
+    )
+    archive_parser.add_argument(
+        "--since", help="Start of the range (default: end of the previous archive)"
+    )
+    archive_parser.add_argument(
+        "--before",
+        help="End of the range (default: ARCHIVE_AHEAD_DAYS past the retention horizon)",
+    )
+    archive_parser.add_argument("--dir", help="Output directory (default: ARCHIVE_DIR)")
+    archive_parser.add_argument(
+        "--delete", action="store_true", help="Delete the archived documents afterwards"
+    )
+    archive_parser.set_defaults(handler=run_archive)
+
+    timeseries_parser = commands.add_parser(
+        "timeseries-migrate",
+        help="Move consumptions to a time-series collection (CONSUMPTIONS_TIMESERIES=true)",
+    )
+    timeseries_parser.add_argument("--batch-size", type=int, default=5000)
+    timeseries_parser.add_argument(
+        "--drop-legacy",
+        action="store_true",
+        help="Drop consumptions_legacy once every reading is copied",
+    )
+    timeseries_parser.set_defaults(handler=run_timeseries_migrate)
+
+    args = parser.parse_args(argv)
+
+    await connect_to_mongo(create_indexes=False)
+    try:
+        return await args.handler(args)
+    finally:
+        await close_mongo_connection()
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -11,21 +11,162 @@ class Settings(BaseSettings):
     # MongoDB
     MONGODB_URL: str = os.getenv("MONGODB_URL", "mongodb://localhost:27017")
     MONGODB_DB_NAME: str = os.getenv("MONGODB_DB_NAME", "HEMS")
+    MONGODB_CREATE_INDEXES: bool = True  # Create missing indexes on startup
+    # Connection pool: a named profile (see app.database.POOL_PROFILES),
+    # with any of the options below overriding it
+    MONGODB_POOL_PROFILE: str = "default"
+    MONGODB_MAX_POOL_SIZE: Optional[int] = None
+    MONGODB_MIN_POOL_SIZE: Optional[int] = None
+    MONGODB_MAX_IDLE_TIME_MS: Optional[int] = None
+    MONGODB_COMPRESSORS: Optional[str] = None  # e.g. "zstd,snappy,zlib"
+    MONGODB_READ_PREFERENCE: Optional[str] = None
+    # Separate pool for sensor ingestion, so bulk writes never hold the
+    # connections billing and API reads need (0 = share the main pool)
+    MONGODB_INGEST_POOL_SIZE: int = 0
+    MONGODB_WARM_POOL: bool = True  # Open minPoolSize connections on startup
+    # Write concern per operation class
+    MONGODB_INGEST_WRITE_CONCERN: str = "1"
+    MONGODB_INGEST_JOURNAL: bool = False
+    MONGODB_BILLING_WRITE_CONCERN: str = "majority"
+    MONGODB_BILLING_JOURNAL: bool = True
+    MONGODB_ANALYTICS_READ_PREFERENCE: str = "primary"
 
     # JWT
     SECRET_KEY: str = os.getenv("SECRET_KEY", "your-secret-key-change-in-production")
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 1440
+    PRINCIPAL_CACHE_SIZE: int = 10000
+    PRINCIPAL_CACHE_TTL_SECONDS: float = 30
+
+    # Password hashing (bcrypt runs on a bounded thread pool)
+    BCRYPT_ROUNDS: int = 12
+    PASSWORD_POOL_WORKERS: int = 4
+    PASSWORD_POOL_MAX_PENDING: int = 64
+    PASSWORD_POOL_USE_PROCESSES: bool = False
 
     # External AI Service
     AI_SERVICE_URL: str = os.getenv("AI_SERVICE_URL", "http://localhost:8001")
     AI_SERVICE_TIMEOUT: int = 30
+    AI_HTTP_MAX_CONNECTIONS: int = 50
+    AI_HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    AI_HTTP_KEEPALIVE_EXPIRY: float = 60
+    AI_HTTP_RETRIES: int = 1  # Connection retries only
+    AI_HTTP2: bool = False  # Requires the 'h2' package
+
+    # Predictions triggered by sensor readings
+    PREDICTION_COALESCE_SECONDS: float = 60
+    PREDICTION_MAX_CONCURRENCY: int = 8
+    PREDICTION_QUEUE_SIZE: int = 10000
+    PREDICTION_BATCH_SIZE: int = 50  # Users per request to /predict/batch
+    FEATURE_WINDOW_HOURS: int = 24
+    FEATURE_WINDOW_MAX_USERS: int = 50000
+    # With a shared state backend (several workers) a window misses readings
+    # ingested by the other workers, so it is rebuilt once it is older than
+    # this. Keep it well above PREDICTION_COALESCE_SECONDS, or every
+    # prediction rebuilds its window.
+    FEATURE_WINDOW_MAX_AGE_SECONDS: float = 600
 
     # Alert Thresholds
     WARNING_THRESHOLD: float = 0.2  # 20%
     CRITICAL_THRESHOLD: float = 0.1  # 10%
     FINAL_THRESHOLD: float = 0.05  # 5%
 
+    # Server-sent alert streams (/alerts/stream)
+    ALERT_STREAM_QUEUE_SIZE: int = 100  # Events buffered per stream
+    ALERT_STREAM_DROP_POLICY: str = "drop_oldest"  # or drop_newest, disconnect
+    ALERT_STREAM_MAX_SUBSCRIBERS: int = 10000  # Per worker
+    ALERT_STREAM_HEARTBEAT_SECONDS: float = 15
+    # Lifetime of the stream-only tokens passed as ?access_token=
+    ALERT_STREAM_TOKEN_SECONDS: int = 60
+
+    # Materialised unread alert counts
+    ALERT_UNREAD_CACHE_SIZE: int = 10000
+    ALERT_UNREAD_CACHE_TTL_SECONDS: float = 30
+    ALERT_UNREAD_RECONCILE_SECONDS: float = 3600  # 0 disables the periodic job
+
+    # Sensor ingestion
+    SENSOR_BATCH_MAX_SIZE: int = 5000
+    # Store readings in a time-series collection (MongoDB 7.0+, checked on
+    # connect: archive --delete removes readings by _id, which earlier
+    # versions only allow by meta fields); existing data is moved with
+    # `python -m app.cli timeseries-migrate`
+    CONSUMPTIONS_TIMESERIES: bool = False
+    CONSUMPTIONS_TIMESERIES_GRANULARITY: str = "minutes"  # or seconds, hours
+
+    # Raw consumption export (documents fetched per cursor batch)
+    EXPORT_BATCH_SIZE: int = 5000
+
+    # Retention: documents expire through a TTL index this many days after
+    # their timestamp (0 keeps them forever). The TTL deletes whether or not
+    # anything was archived, so only enable it together with a scheduled
+    # `python -m app.cli archive` run; readiness reports the archive lag.
+    # Consumptions live on in the rollups, which are kept.
+    ALERT_RETENTION_DAYS: int = 0
+    PREDICTION_RETENTION_DAYS: int = 0
+    CONSUMPTION_RETENTION_DAYS: int = 0
+    ARCHIVE_DIR: str = "archive"
+    ARCHIVE_AHEAD_DAYS: int = 7  # Default archive run covers what expires this soon
+
+    # meter_id -> user cache used by sensor ingestion
+    METER_CACHE_SIZE: int = 100000
+    METER_CACHE_TTL_SECONDS: float = 3600
+    METER_CACHE_NEGATIVE_TTL_SECONDS: float = 30
+
+    # Device API keys (X-API-Key on sensor ingestion)
+    REQUIRE_DEVICE_API_KEY: bool = False  # Reject readings sent without a key
+    DEVICE_CACHE_SIZE: int = 100000
+    DEVICE_CACHE_TTL_SECONDS: float = 3600
+    # Unknown keys, kept apart so guessing keys cannot evict valid ones
+    DEVICE_NEGATIVE_CACHE_SIZE: int = 10000
+    DEVICE_NEGATIVE_CACHE_TTL_SECONDS: float = 30
+
+    # Active subscription cache (entries never outlive the subscription end date)
+    SUBSCRIPTION_CACHE_SIZE: int = 100000
+    SUBSCRIPTION_CACHE_TTL_SECONDS: float = 15
+
+    # Write-behind buffering of consumptions (acknowledge once queued)
+    INGEST_WRITE_BEHIND: bool = False
+    INGEST_BATCH_SIZE: int = 500
+    INGEST_FLUSH_INTERVAL_MS: int = 200
+    INGEST_MAX_PENDING: int = 20000
+    INGEST_DRAIN_TIMEOUT_SECONDS: float = 30
+    # Failed flushes are retried with exponential backoff; documents that
+    # still fail, or are left queued at shutdown, go to dead-letter files
+    INGEST_RETRY_ATTEMPTS: int = 3
+    INGEST_RETRY_BACKOFF_MS: int = 500
+    INGEST_DEAD_LETTER_DIR: str = "dead_letter"
+
+    # Server (python -m app.serve)
+    SERVER_HOST: str = "0.0.0.0"
+    SERVER_PORT: int = 8000
+    SERVER_WORKERS: int = 0  # 0 = one worker per CPU core
+    SERVER_BACKLOG: int = 2048
+    SERVER_KEEPALIVE_SECONDS: int = 5
+    SERVER_GRACEFUL_TIMEOUT_SECONDS: int = 30
+    SERVER_LIMIT_CONCURRENCY: Optional[int] = None
+
+    # Event loop monitor: lag sampling and stacks of callbacks blocking the loop
+    LOOP_MONITOR_ENABLED: bool = True
+    LOOP_MONITOR_INTERVAL_SECONDS: float = 0.1
+    LOOP_MONITOR_WINDOW: int = 600  # Recent samples used for the percentiles
+    LOOP_SLOW_CALLBACK_SECONDS: float = 0.1
+
+    # Readiness probe (/ready); results are cached so probes add no load
+    HEALTH_CACHE_SECONDS: float = 2
+    HEALTH_MONGO_TIMEOUT_SECONDS: float = 2
+    HEALTH_AI_CACHE_SECONDS: float = 30
+    HEALTH_AI_TIMEOUT_SECONDS: float = 2
+    HEALTH_MAX_LOOP_LAG_SECONDS: float = 0.5
+    HEALTH_MAX_INGEST_QUEUE_RATIO: float = 0.9
+
+    # Prometheus-style metrics at /metrics
+    METRICS_ENABLED: bool = True
+
+    # State shared between workers: "memory" (single worker) or "redis"
+    STATE_BACKEND: str = "memory"
+    REDIS_URL: str = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+    STATE_KEY_PREFIX: str = "hems:"
+
     class Config:
         case_sensitive = True
 
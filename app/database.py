@@ -1,18 +1,214 @@
+import asyncio
+import importlib.util
+from typing import Any, Dict, Optional, Tuple
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import WriteConcern
+from pymongo.monitoring import ConnectionPoolListener
+from pymongo.read_preferences import make_read_preference, read_pref_mode_from_name
+from app import timeseries
 from app.config import settings
+from app.indexes import ensure_indexes
+from app.metrics import CommandMetrics
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Connection pool options by profile name; MONGODB_* settings override them
+POOL_PROFILES: Dict[str, Dict[str, Any]] = {
+    "default": {"maxPoolSize": 100, "minPoolSize": 0, "maxIdleTimeMS": None},
+    # Sustained sensor ingestion with many concurrent requests per worker
+    "ingest": {"maxPoolSize": 200, "minPoolSize": 20, "maxIdleTimeMS": 300000},
+    # Several workers per host against a small cluster
+    "small": {"maxPoolSize": 20, "minPoolSize": 2, "maxIdleTimeMS": 60000},
+}
+
+# Modules that implement each wire compressor
+_COMPRESSOR_MODULES = {"zstd": "zstandard", "snappy": "snappy", "zlib": "zlib"}
+
+
+class PoolStats(ConnectionPoolListener):
+    """Connection pool counters of one client, updated from driver threads"""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.created = 0
+        self.closed = 0
+        self.checked_out = 0
+        self.waiting = 0
+        self.checkout_failed = 0
+        self.cleared = 0
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self.cleared += 1
+
+    def connection_created(self, event):
+        self.created += 1
+
+    def connection_closed(self, event):
+        self.closed += 1
+
+    def connection_check_out_started(self, event):
+        self.waiting += 1
+
+    def connection_check_out_failed(self, event):
+        self.waiting -= 1
+        self.checkout_failed += 1
+
+    def connection_checked_out(self, event):
+        self.waiting -= 1
+        self.checked_out += 1
+
+    def connection_checked_in(self, event):
+        self.checked_out -= 1
+
+    def as_dict(self) -> Dict[str, int]:
+        return {
+            "open": self.created - self.closed,
+            "in_use": self.checked_out,
+            "waiting": self.waiting,
+            "max_size": self.max_size,
+            "saturation": self.checked_out / self.max_size if self.max_size else 0.0,
+            "created": self.created,
+            "closed": self.closed,
+            "checkout_failed": self.checkout_failed,
+            "cleared": self.cleared,
+        }
+
 
 class Database:
     client: AsyncIOMotorClient = None # type: ignore
     database = None
+    # Separate client for ingestion writes, when configured
+    ingest_client: AsyncIOMotorClient = None # type: ignore
+    pool_options: Dict[str, Any] = {}
+    pool_stats: Dict[str, PoolStats] = {}
+    collections: Dict[Tuple[str, str], Any] = {}
 
 db = Database()
 
-async def connect_to_mongo():
-    db.client = AsyncIOMotorClient(settings.MONGODB_URL)
+
+def _parse_w(value: str):
+    return int(value) if value.isdigit() else value
+
+
+# Write concern and read preference per operation class. Ingest favours
+# throughput (a lost reading is tolerable), billing favours durability
+# (a lost deduction is not), analytics may read from secondaries.
+OPERATION_CLASSES: Dict[str, Dict[str, Any]] = {
+    "default": {},
+    "ingest": {
+        "write_concern": WriteConcern(
+            w=_parse_w(settings.MONGODB_INGEST_WRITE_CONCERN),
+            j=settings.MONGODB_INGEST_JOURNAL,
+        )
+    },
+    "billing": {
+        "write_concern": WriteConcern(
+            w=_parse_w(settings.MONGODB_BILLING_WRITE_CONCERN),
+            j=settings.MONGODB_BILLING_JOURNAL,
+        )
+    },
+    "analytics": {
+        "read_preference": make_read_preference(
+            read_pref_mode_from_name(settings.MONGODB_ANALYTICS_READ_PREFERENCE), None
+        )
+    },
+}
+
+
+def _compressors() -> Optional[str]:
+    if not settings.MONGODB_COMPRESSORS:
+        return None
+    available = []
+    for name in settings.MONGODB_COMPRESSORS.split(","):
+        name = name.strip()
+        module = _COMPRESSOR_MODULES.get(name)
+        if module is None or importlib.util.find_spec(module) is None:
+            logger.warning(f"MongoDB compressor '{name}' is not available, skipping it")
+            continue
+        available.append(name)
+    return ",".join(available) or None
+
+
+def get_pool_options() -> Dict[str, Any]:
+    """Client options from the pool profile and the MONGODB_* overrides"""
+    if settings.MONGODB_POOL_PROFILE not in POOL_PROFILES:
+        raise ValueError(f"Unknown MONGODB_POOL_PROFILE: {settings.MONGODB_POOL_PROFILE}")
+    options = dict(POOL_PROFILES[settings.MONGODB_POOL_PROFILE])
+    overrides = {
+        "maxPoolSize": settings.MONGODB_MAX_POOL_SIZE,
+        "minPoolSize": settings.MONGODB_MIN_POOL_SIZE,
+        "maxIdleTimeMS": settings.MONGODB_MAX_IDLE_TIME_MS,
+        "compressors": _compressors(),
+        "readPreference": settings.MONGODB_READ_PREFERENCE,
+    }
+    options.update({key: value for key, value in overrides.items() if value is not None})
+    return {key: value for key, value in options.items() if value is not None}
+
+
+def _create_client(name: str, options: Dict[str, Any]) -> AsyncIOMotorClient:
+    db.pool_stats[name] = PoolStats(options.get("maxPoolSize", 100))
+    listeners = [db.pool_stats[name]]
+    if settings.METRICS_ENABLED:
+        listeners.append(CommandMetrics())
+    return AsyncIOMotorClient(settings.MONGODB_URL, event_listeners=listeners, **options)
+
+
+async def _warm_pool(client: AsyncIOMotorClient, connections: int) -> None:
+    """Open connections up front so the first requests do not pay for them"""
+    if connections <= 0:
+        return
+    # Concurrent commands each need their own connection
+    await asyncio.gather(*(client.admin.command("ping") for _ in range(connections)))
+
+async def connect_to_mongo(create_indexes: Optional[bool] = None):
+    db.pool_options = get_pool_options()
+    db.collections = {}
+    db.client = _create_client("default", db.pool_options)
     db.database = db.client[settings.MONGODB_DB_NAME]
-    print("Connected to MongoDB")
+    if settings.MONGODB_INGEST_POOL_SIZE:
+        ingest_pool_size = settings.MONGODB_INGEST_POOL_SIZE
+        db.ingest_client = _create_client(
+            "ingest",
+            {
+                **db.pool_options,
+                "maxPoolSize": ingest_pool_size,
+                "minPoolSize": min(db.pool_options.get("minPoolSize", 0), ingest_pool_size),
+            },
+        )
+    print(f"Connected to MongoDB ({settings.MONGODB_POOL_PROFILE} pool profile)")
+    if settings.CONSUMPTIONS_TIMESERIES:
+        await timeseries.check_server(db.client)
+
+    if settings.MONGODB_WARM_POOL:
+        min_pool_size = db.pool_options.get("minPoolSize", 0)
+        await _warm_pool(db.client, min_pool_size)
+        if db.ingest_client:
+            await _warm_pool(
+                db.ingest_client, min(min_pool_size, settings.MONGODB_INGEST_POOL_SIZE)
+            )
+
+    if create_indexes is None:
+        create_indexes = settings.MONGODB_CREATE_INDEXES
+    if create_indexes:
+        await ensure_indexes(db.database)
 
 async def close_mongo_connection():
+    if db.ingest_client:
+        db.ingest_client.close()
+        db.ingest_client = None
     if db.client:
         db.client.close()
         print("Disconnected from MongoDB")
@@ -20,5 +216,24 @@ async def close_mongo_connection():
 def get_database():
     return db.database
 
-def get_collection(collection_name: str):
-    return db.database[collection_name]
\ No newline at end of file
+def get_collection(collection_name: str, operation_class: str = "default"):
+    """Collection with the write concern and read preference of an operation class"""
+    if operation_class == "default":
+        return db.database[collection_name]
+
+    key = (collection_name, operation_class)
+    collection = db.collections.get(key)
+    if collection is None:
+        client = db.ingest_client if operation_class == "ingest" and db.ingest_client else db.client
+        collection = client[settings.MONGODB_DB_NAME].get_collection(
+            collection_name, **OPERATION_CLASSES[operation_class]
+        )
+        db.collections[key] = collection
+    return collection
+
+def get_pool_stats() -> Dict[str, Any]:
+    """Connection pool counters per client, with the options in use"""
+    return {
+        "options": db.pool_options,
+        "pools": {name: stats.as_dict() for name, stats in db.pool_stats.items()},
+    }
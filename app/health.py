@@ -0,0 +1,214 @@
+import asyncio
+import os
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+from app.ai_client import get_ai_client
+from app.config import settings
+from app.database import db, get_pool_stats
+from app.loop_monitor import loop_monitor
+from app.indexes import RETENTION_DAYS
+from app.services.ingest_buffer import consumption_buffer
+from app.services.retention_service import RetentionService
+import logging
+
+logger = logging.getLogger(__name__)
+
+_STARTED = time.monotonic()
+
+# Reported, and shown as "degraded", but never make the worker unready
+INFORMATIONAL_CHECKS = ("ai_service", "retention")
+
+
+def liveness() -> Dict[str, Any]:
+    """The process is up and its event loop answers; checks no dependencies"""
+    return {
+        "status": "alive",
+        "timestamp": datetime.utcnow().isoformat() + "Z",
+        "pid": os.getpid(),
+        "uptime_seconds": round(time.monotonic() - _STARTED, 1),
+    }
+
+
+async def _timed(check) -> Tuple[Optional[float], Optional[str]]:
+    """Run a probe; returns (latency in ms, error)"""
+    start = time.perf_counter()
+    try:
+        await check
+        return round((time.perf_counter() - start) * 1000, 2), None
+    except Exception as e:
+        return None, f"{type(e).__name__}: {str(e)[:200]}"
+
+
+async def _loop_lag() -> float:
+    """Seconds a callback waits before the event loop runs it"""
+    loop = asyncio.get_running_loop()
+    scheduled = loop.time()
+    ran = loop.create_future()
+    loop.call_soon(lambda: ran.done() or ran.set_result(loop.time()))
+    return await ran - scheduled
+
+
+class ReadinessProbe:
+    """Whether this worker should receive traffic
+
+    Not ready when MongoDB does not answer a ping, a connection pool is
+    exhausted with requests waiting for a connection, the ingest buffer is
+    nearly full or the event loop is lagging; and from the moment the worker
+    starts shutting down.
+    The AI service is reported but never makes the worker unready, since
+    predictions run in the background; neither does the archive lag of the
+    retained collections, which is positive once documents expire before
+    they were archived. Results are cached for
+    HEALTH_CACHE_SECONDS (the AI probe for HEALTH_AI_CACHE_SECONDS) and
+    concurrent probes share one evaluation.
+    """
+
+    def __init__(self):
+        self.draining = False
+        self._result: Optional[Dict[str, Any]] = None
+        self._checked_at = 0.0
+        self._ai: Optional[Dict[str, Any]] = None
+        self._ai_checked_at = 0.0
+        self._running: Optional[asyncio.Task] = None
+
+    async def check(self) -> Dict[str, Any]:
+        if self.draining:
+            return {
+                "status": "draining",
+                "ready": False,
+                "timestamp": datetime.utcnow().isoformat() + "Z",
+                "pid": os.getpid(),
+            }
+        if self._result and time.monotonic() - self._checked_at < settings.HEALTH_CACHE_SECONDS:
+            return self._result
+        if self._running is None or self._running.done():
+            self._running = asyncio.create_task(self._evaluate())
+        return await asyncio.shield(self._running)
+
+    async def _check_mongo(self) -> Dict[str, Any]:
+        if db.client is None:
+            return {"ok": False, "error": "not connected"}
+        latency, error = await _timed(
+            asyncio.wait_for(
+                db.client.admin.command("ping"), settings.HEALTH_MONGO_TIMEOUT_SECONDS
+            )
+        )
+        pools = get_pool_stats()["pools"]
+        exhausted = [
+            name
+            for name, pool in pools.items()
+            if pool["in_use"] >= pool["max_size"] and pool["waiting"] > 0
+        ]
+        check = {
+            "ok": error is None and not exhausted,
+            "latency_ms": latency,
+            "pools": pools,
+        }
+        if error:
+            check["error"] = error
+        if exhausted:
+            check["error"] = f"Connection pool exhausted: {', '.join(exhausted)}"
+        return check
+
+    async def _check_ai(self) -> Dict[str, Any]:
+        if self._ai and time.monotonic() - self._ai_checked_at < settings.HEALTH_AI_CACHE_SECONDS:
+            return self._ai
+
+        async def ping():
+            response = await get_ai_client().get(
+                "/health", timeout=settings.HEALTH_AI_TIMEOUT_SECONDS
+            )
+            response.raise_for_status()
+
+        latency, error = await _timed(ping())
+        self._ai = {
+            "ok": error is None,
+            "latency_ms": latency,
+            "checked_at": datetime.utcnow().isoformat() + "Z",
+        }
+        if error:
+            self._ai["error"] = error
+        self._ai_checked_at = time.monotonic()
+        return self._ai
+
+    def _check_ingest(self) -> Dict[str, Any]:
+        stats = consumption_buffer.stats()
+        limit = stats["max_pending"] * settings.HEALTH_MAX_INGEST_QUEUE_RATIO
+        check = {
+            "ok": stats["depth"] < limit and not stats["died"],
+            "depth": stats["depth"],
+            "max_pending": stats["max_pending"],
+        }
+        if stats["died"]:
+            check["error"] = "Ingest buffer flusher died"
+        elif not check["ok"]:
+            check["error"] = "Ingest buffer nearly full"
+        return check
+
+    async def _check_retention(self) -> Dict[str, Any]:
+        check: Dict[str, Any] = {"ok": True, "collections": {}}
+        try:
+            for collection_name in RETENTION_DAYS:
+                lag = await RetentionService.archive_lag(collection_name)
+                if lag is None:
+                    continue
+                check["collections"][collection_name] = lag
+                if lag["lag_seconds"] is None or lag["lag_seconds"] > 0:
+                    check["ok"] = False
+        except Exception as e:
+            return {"ok": False, "error": f"{type(e).__name__}: {str(e)[:200]}"}
+        if not check["ok"] and "error" not in check:
+            check["error"] = "Documents expire before they are archived"
+        return check
+
+    async def _check_loop(self) -> Dict[str, Any]:
+        lag = await _loop_lag()
+        check = {
+            "ok": lag <= settings.HEALTH_MAX_LOOP_LAG_SECONDS,
+            "lag_ms": round(lag * 1000, 2),
+        }
+        if loop_monitor.running:
+            stats = loop_monitor.stats()
+            check["p99_ms"] = round(stats["lag_p99"] * 1000, 2)
+            check["stalls"] = stats["stalls"]
+        if not check["ok"]:
+            check["error"] = "Event loop lagging"
+        return check
+
+    async def _evaluate(self) -> Dict[str, Any]:
+        mongo, ai, loop, retention = await asyncio.gather(
+            self._check_mongo(), self._check_ai(), self._check_loop(), self._check_retention()
+        )
+        checks = {
+            "mongodb": mongo,
+            "ai_service": ai,
+            "ingest": self._check_ingest(),
+            "event_loop": loop,
+            "retention": retention,
+        }
+
+        ready = all(
+            check["ok"] for name, check in checks.items() if name not in INFORMATIONAL_CHECKS
+        )
+        if ready:
+            informational_ok = all(checks[name]["ok"] for name in INFORMATIONAL_CHECKS)
+            status = "ready" if informational_ok else "degraded"
+        else:
+            status = "not_ready"
+
+        self._result = {
+            "status": status,
+            "ready": ready,
+            "timestamp": datetime.utcnow().isoformat() + "Z",
+            "pid": os.getpid(),
+            "checks": checks,
+        }
+        self._checked_at = time.monotonic()
+        if not ready:
+            failing = [name for name, check in checks.items() if not check["ok"]]
+            logger.warning(f"Worker {os.getpid()} not ready: {status} {failing}")
+        return self._result
+
+
+readiness = ReadinessProbe()
@@ -0,0 +1,282 @@
+from typing import Any, Dict, List
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+from app import timeseries
+from app.config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Options that make two indexes on the same keys behave differently
+INDEX_OPTIONS = ("unique", "sparse", "expireAfterSeconds", "partialFilterExpression")
+
+
+# Declared indexes per collection. Each one backs a query on a hot path:
+# meter lookups on ingestion, login and token resolution by email, and the
+# per-user range scans behind the dashboard endpoints. The unique rollup
+# indexes also back the upserts done on ingest.
+INDEXES: Dict[str, List[IndexModel]] = {
+    "users": [
+        IndexModel([("email", ASCENDING)], unique=True),
+        IndexModel([("meter_id", ASCENDING)], unique=True),
+    ],
+    "consumptions": [
+        # _id breaks timestamp ties, so exports can resume after any reading
+        IndexModel(
+            [
+                (timeseries.field("user_id"), ASCENDING),
+                ("timestamp", ASCENDING),
+                ("_id", ASCENDING),
+            ]
+        ),
+    ],
+    "subscriptions": [
+        IndexModel(
+            [("user_id", ASCENDING), ("status", ASCENDING), ("end_date", ASCENDING)]
+        ),
+    ],
+    "alerts": [
+        IndexModel(
+            [("user_id", ASCENDING), ("read", ASCENDING), ("timestamp", DESCENDING)]
+        ),
+        # Covers the unread count per user of the counter reconciliation
+        IndexModel([("read", ASCENDING), ("user_id", ASCENDING)]),
+    ],
+    "predictions": [
+        IndexModel([("user_id", ASCENDING), ("timestamp", DESCENDING)]),
+    ],
+    "devices": [
+        # Partial, so devices without a key do not collide on null
+        IndexModel(
+            [("api_key_hash", ASCENDING)],
+            unique=True,
+            partialFilterExpression={"api_key_hash": {"$type": "string"}},
+        ),
+        IndexModel([("user_id", ASCENDING), ("device_id", ASCENDING)], unique=True),
+    ],
+    "consumption_hourly": [
+        IndexModel([("user_id", ASCENDING), ("period_start", ASCENDING)], unique=True),
+    ],
+    "consumption_daily": [
+        IndexModel([("user_id", ASCENDING), ("period_start", ASCENDING)], unique=True),
+    ],
+    "consumption_monthly": [
+        IndexModel([("user_id", ASCENDING), ("period_start", ASCENDING)], unique=True),
+    ],
+    "archives": [
+        IndexModel([("collection", ASCENDING), ("before", DESCENDING)]),
+    ],
+}
+
+# Retention horizon in days per collection, enforced by a TTL index on
+# timestamp, or by the collection's own expiry for time-series consumptions
+# (0 keeps documents forever)
+RETENTION_DAYS: Dict[str, int] = {
+    "alerts": settings.ALERT_RETENTION_DAYS,
+    "predictions": settings.PREDICTION_RETENTION_DAYS,
+    "consumptions": settings.CONSUMPTION_RETENTION_DAYS,
+}
+
+for _collection_name, _days in RETENTION_DAYS.items():
+    _timeseries = _collection_name == "consumptions" and settings.CONSUMPTIONS_TIMESERIES
+    if _days > 0 and not _timeseries:
+        INDEXES[_collection_name].append(
+            IndexModel([("timestamp", ASCENDING)], expireAfterSeconds=_days * 86400)
+        )
+
+
+# Indexes the server creates by itself: _id, and the meta/time index of
+# time-series collections
+IMPLICIT_INDEX_KEYS = {
+    (("_id", 1),),
+    ((timeseries.META_FIELD, 1), (timeseries.TIME_FIELD, 1)),
+}
+
+
+def _key(spec) -> tuple:
+    """Normalise an index key spec to a comparable tuple"""
+    if hasattr(spec, "items"):
+        spec = spec.items()
+    # The server may report directions as floats (1.0 instead of 1)
+    return tuple(
+        (field, int(direction) if isinstance(direction, float) else direction)
+        for field, direction in spec
+    )
+
+
+def _options(spec: Dict[str, Any]) -> Dict[str, Any]:
+    return {option: spec[option] for option in INDEX_OPTIONS if option in spec}
+
+
+async def _ensure_timeseries(database, create: bool) -> Dict[str, List[str]]:
+    """Create the time-series consumptions collection or report how it differs"""
+    entry = {"created": [], "modified": [], "mismatched": [], "errors": []}
+    retention_days = RETENTION_DAYS["consumptions"]
+    info = await timeseries.collection_info(database, "consumptions")
+
+    if info is None:
+        if not create:
+            entry["mismatched"].append("timeseries")
+            return entry
+        try:
+            await database.create_collection(
+                "consumptions", **timeseries.collection_options(retention_days)
+            )
+            entry["created"].append("timeseries")
+        except OperationFailure as e:
+            logger.error(f"Failed to create time-series consumptions: {str(e)}")
+            entry["errors"].append("timeseries")
+        return entry
+
+    if info.get("type") != "timeseries":
+        # Existing readings have to be moved by the migration command
+        entry["mismatched"].append("timeseries")
+        return entry
+
+    expiry = info.get("options", {}).get("expireAfterSeconds")
+    declared = retention_days * 86400 if retention_days > 0 else None
+    if expiry != declared:
+        if not create:
+            entry["mismatched"].append("expireAfterSeconds")
+            return entry
+        try:
+            await database.command(
+                "collMod", "consumptions", expireAfterSeconds=declared or "off"
+            )
+            entry["modified"].append("expireAfterSeconds")
+        except OperationFailure as e:
+            logger.error(f"Failed to change expiry of consumptions: {str(e)}")
+            entry["errors"].append("expireAfterSeconds")
+    return entry
+
+
+async def ensure_indexes(database, create: bool = True) -> Dict[str, Dict[str, List[str]]]:
+    """Create or verify the declared indexes
+
+    Returns a drift report per collection:
+    created     - declared indexes that were missing and have been created
+    modified    - TTL indexes whose expiry has been changed to the declared one
+    dropped     - retention TTL indexes no longer declared (retention set to 0)
+    missing     - declared indexes that are missing (only when create=False)
+    mismatched  - indexes on the declared keys with different options
+    unexpected  - indexes present in the database but not declared
+    errors      - declared indexes that could not be created
+    """
+    report: Dict[str, Dict[str, List[str]]] = {}
+    # Must exist before its indexes, or creating them makes a regular collection
+    collection_entries = {}
+    if settings.CONSUMPTIONS_TIMESERIES:
+        collection_entries["consumptions"] = await _ensure_timeseries(database, create)
+
+    for collection_name, declared in INDEXES.items():
+        collection = database[collection_name]
+        existing = await collection.index_information()
+        existing_by_key = {
+            _key(info["key"]): (name, info) for name, info in existing.items()
+        }
+
+        entry = {
+            "created": [],
+            "modified": [],
+            "dropped": [],
+            "missing": [],
+            "mismatched": [],
+            "unexpected": [],
+            "errors": [],
+        }
+        declared_keys = set()
+
+        for index in declared:
+            document = index.document
+            key = _key(document["key"])
+            declared_keys.add(key)
+            name = document["name"]
+
+            if key in existing_by_key:
+                existing_name, info = existing_by_key[key]
+                existing_options = _options(info)
+                if existing_options == _options(document):
+                    continue
+                # A changed retention horizon only changes the expiry,
+                # which can be done in place
+                expiry_only = (
+                    {**existing_options, "expireAfterSeconds": None}
+                    == {**_options(document), "expireAfterSeconds": None}
+                    and "expireAfterSeconds" in existing_options
+                    and "expireAfterSeconds" in document
+                )
+                if not (create and expiry_only):
+                    entry["mismatched"].append(existing_name)
+                    continue
+                try:
+                    await database.command(
+                        "collMod",
+                        collection_name,
+                        index={
+                            "name": existing_name,
+                            "expireAfterSeconds": document["expireAfterSeconds"],
+                        },
+                    )
+                    entry["modified"].append(existing_name)
+                except OperationFailure as e:
+                    logger.error(
+                        f"Failed to change expiry of {collection_name}.{existing_name}: {str(e)}"
+                    )
+                    entry["errors"].append(existing_name)
+                continue
+
+            if not create:
+                entry["missing"].append(name)
+                continue
+
+            try:
+                await collection.create_indexes([index])
+                entry["created"].append(name)
+            except OperationFailure as e:
+                logger.error(f"Failed to create index {collection_name}.{name}: {str(e)}")
+                entry["errors"].append(name)
+
+        for key, (name, info) in existing_by_key.items():
+            if key in IMPLICIT_INDEX_KEYS or key in declared_keys:
+                continue
+            retention_ttl = (
+                collection_name in RETENTION_DAYS
+                and key == (("timestamp", ASCENDING),)
+                and "expireAfterSeconds" in info
+            )
+            if not (create and retention_ttl):
+                entry["unexpected"].append(name)
+                continue
+            # Left in place it would keep expiring documents
+            try:
+                await collection.drop_index(name)
+                entry["dropped"].append(name)
+            except OperationFailure as e:
+                logger.error(f"Failed to drop index {collection_name}.{name}: {str(e)}")
+                entry["errors"].append(name)
+
+        for kind, names in collection_entries.get(collection_name, {}).items():
+            entry[kind].extend(names)
+
+        report[collection_name] = entry
+
+    for collection_name, entry in report.items():
+        for name in entry["created"]:
+            logger.info(f"Created index {collection_name}.{name}")
+        for name in entry["modified"]:
+            logger.info(f"Changed expiry of index {collection_name}.{name}")
+        for name in entry["dropped"]:
+            logger.info(f"Dropped retention index {collection_name}.{name}")
+        for kind in ("missing", "mismatched", "unexpected"):
+            for name in entry[kind]:
+                logger.warning(f"Index drift on {collection_name}: {kind} {name}")
+
+    return report
+
+
+def has_drift(report: Dict[str, Dict[str, List[str]]]) -> bool:
+    """Whether a report shows any difference from the declared indexes"""
+    return any(
+        entry["missing"] or entry["mismatched"] or entry["unexpected"] or entry["errors"]
+        for entry in report.values()
+    )
@@ -0,0 +1,162 @@
+import asyncio
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+from app.config import settings
+from app.metrics import Counter, Histogram
+import logging
+
+logger = logging.getLogger(__name__)
+
+loop_lag = Histogram(
+    "hems_event_loop_lag_seconds",
+    "How late the event loop woke a sleeping sampler",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+loop_stalls = Counter(
+    "hems_event_loop_stalls_total", "Stalls longer than LOOP_SLOW_CALLBACK_SECONDS", ("task",)
+)
+
+
+def _percentile(ordered: List[float], fraction: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class LoopMonitor:
+    """Measures event loop lag and catches the code blocking the loop
+
+    A sampler task sleeps for `interval` and records how late it wakes up;
+    the recent samples give the lag percentiles. A watchdog thread checks
+    the sampler's heartbeat, and when the loop has not run it for longer
+    than `slow_threshold`, it captures the loop thread's stack and the task
+    that was running, so stalls point to the code that caused them (bcrypt,
+    large model construction, synchronous I/O).
+    """
+
+    def __init__(
+        self, interval: float, slow_threshold: float, window: int, max_stalls: int = 20
+    ):
+        self.interval = interval
+        self.slow_threshold = slow_threshold
+        self._samples: Deque[float] = deque(maxlen=window)
+        self.stalls: Deque[Dict[str, Any]] = deque(maxlen=max_stalls)
+        self.stall_count = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._heartbeat = 0.0
+        self._sampler: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    @property
+    def running(self) -> bool:
+        return self._sampler is not None and not self._sampler.done()
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stop.clear()
+        self._sampler = asyncio.create_task(self._sample())
+        self._watchdog = threading.Thread(
+            target=self._watch, name="loop-watchdog", daemon=True
+        )
+        self._watchdog.start()
+
+    async def stop(self) -> None:
+        self._stop.set()
+        if self._sampler:
+            self._sampler.cancel()
+            try:
+                await self._sampler
+            except asyncio.CancelledError:
+                pass
+            self._sampler = None
+        if self._watchdog:
+            self._watchdog.join(timeout=self.slow_threshold * 2)
+            self._watchdog = None
+
+    async def _sample(self) -> None:
+        while True:
+            start = time.monotonic()
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self._heartbeat = now
+            lag = max(0.0, now - start - self.interval)
+            self._samples.append(lag)
+            loop_lag.observe(lag)
+            if lag > self.slow_threshold and self.stalls and self.stalls[-1]["total_ms"] is None:
+                # The stall reported by the watchdog has ended
+                self.stalls[-1]["total_ms"] = round(lag * 1000, 1)
+
+    def _watch(self) -> None:
+        reported = 0.0
+        check_every = min(self.slow_threshold / 2, self.interval)
+        while not self._stop.wait(check_every):
+            heartbeat = self._heartbeat
+            stalled_for = time.monotonic() - heartbeat - self.interval
+            # Report each stall once, while it is happening
+            if stalled_for > self.slow_threshold and heartbeat != reported:
+                reported = heartbeat
+                self._report(stalled_for)
+
+    def _current_task_name(self) -> str:
+        # Read from the watchdog thread; asyncio.current_task() only works
+        # inside the loop's own thread. _current_tasks is private (and may be
+        # missing or change), and the loop thread mutates it meanwhile, so
+        # it is copied and any failure only loses the task name.
+        try:
+            current_tasks = dict(getattr(asyncio.tasks, "_current_tasks", {}))
+            task = current_tasks.get(self._loop)
+            if task is None:
+                return "callback"
+            coro = task.get_coro()
+            return getattr(coro, "__qualname__", None) or task.get_name()
+        except Exception:
+            return "unknown"
+
+    def _report(self, stalled_for: float) -> None:
+        frame = sys._current_frames().get(self._loop_thread_id)
+        stack = traceback.format_stack(frame, limit=30) if frame else []
+        task = self._current_task_name()
+        self.stall_count += 1
+        loop_stalls.inc(task)
+        self.stalls.append(
+            {
+                "at": time.time(),
+                "detected_after_ms": round(stalled_for * 1000, 1),
+                "total_ms": None,
+                "task": task,
+                "stack": [line.rstrip() for line in stack],
+            }
+        )
+        logger.warning(
+            f"Event loop blocked for over {stalled_for * 1000:.0f}ms in {task}:\n"
+            + "".join(stack[-12:])
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        ordered = sorted(self._samples)
+        return {
+            "running": self.running,
+            "samples": len(ordered),
+            "lag_p50": _percentile(ordered, 0.50),
+            "lag_p90": _percentile(ordered, 0.90),
+            "lag_p99": _percentile(ordered, 0.99),
+            "lag_max": ordered[-1] if ordered else 0.0,
+            "stalls": self.stall_count,
+        }
+
+
+loop_monitor = LoopMonitor(
+    interval=settings.LOOP_MONITOR_INTERVAL_SECONDS,
+    slow_threshold=settings.LOOP_SLOW_CALLBACK_SECONDS,
+    window=settings.LOOP_MONITOR_WINDOW,
+)
@@ -1,8 +1,26 @@
+import logging
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
 
+from app import metrics
+from app.auth import AccessTokenLogFilter, principal_cache_stats
 from app.config import settings
-from app.database import connect_to_mongo, close_mongo_connection
+from app.health import liveness, readiness
+from app.loop_monitor import loop_monitor
+from app.database import connect_to_mongo, close_mongo_connection, get_pool_stats
+from app.ai_client import connect_ai_client, close_ai_client, get_ai_client_stats
+from app.state import state
+from app.utils import shutdown_password_pool, password_pool_stats
+from app.services.alert_hub import alert_hub
+from app.services.alert_service import AlertService
+from app.services.device_service import DeviceService
+from app.services.feature_window import feature_window
+from app.services.ingest_buffer import consumption_buffer
+from app.services.meter_service import MeterService
+from app.services.prediction_scheduler import prediction_scheduler
+from app.services.subscription_service import SubscriptionService
+from app.services.unread_reconciler import unread_reconciler
 from app.routers import (
     users, auth, consumptions, devices, 
     subscriptions, alerts, predictions
@@ -14,6 +32,9 @@ app = FastAPI(
     openapi_url=f"{settings.API_V1_STR}/openapi.json"
 )
 
+# Stream tokens travel in the URL; keep them out of the access log
+logging.getLogger("uvicorn.access").addFilter(AccessTokenLogFilter())
+
 origins = ["*"]
 
 # CORS middleware
@@ -25,6 +46,33 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+if settings.METRICS_ENABLED:
+    app.add_middleware(metrics.MetricsMiddleware)
+    metrics.register_stats(
+        "hems_mongodb_pool", "MongoDB connection pool usage",
+        lambda: get_pool_stats()["pools"], label="client",
+    )
+    metrics.register_stats("hems_cache", "In-process cache usage", lambda: {
+        "principal": principal_cache_stats(),
+        "meter": MeterService.cache_stats(),
+        "subscription": SubscriptionService.cache_stats(),
+        "unread": AlertService.cache_stats(),
+        "device": DeviceService.cache_stats(),
+    }, label="cache")
+    metrics.register_stats("hems_ai_client", "AI service client usage", get_ai_client_stats)
+    metrics.register_stats("hems_password_pool", "Password hashing pool usage", password_pool_stats)
+    metrics.register_stats("hems_ingest_buffer", "Write-behind ingest buffer", consumption_buffer.stats)
+    metrics.register_stats("hems_prediction_scheduler", "Scheduled AI predictions", prediction_scheduler.stats)
+    metrics.register_stats("hems_feature_window", "Rolling prediction feature window", feature_window.stats)
+    metrics.register_stats("hems_state", "Shared state backend", state.stats)
+    metrics.register_stats("hems_alert_streams", "Alert stream fan-out", alert_hub.stats)
+    metrics.register_stats(
+        "hems_unread_reconciler", "Unread alert counter reconciliation", unread_reconciler.stats
+    )
+    metrics.register_stats(
+        "hems_event_loop", "Event loop lag (seconds) and stalls", loop_monitor.stats
+    )
+
 # Include routers
 app.include_router(auth.router, prefix=f"{settings.API_V1_STR}/auth", tags=["auth"])
 app.include_router(users.router, prefix=f"{settings.API_V1_STR}/users", tags=["users"])
@@ -38,11 +86,28 @@ app.include_router(predictions.router, prefix=f"{settings.API_V1_STR}/prediction
 
 @app.on_event("startup")
 async def startup_event():
+    if settings.LOOP_MONITOR_ENABLED:
+        loop_monitor.start()
     await connect_to_mongo()
+    await state.connect()
+    await connect_ai_client()
+    if settings.INGEST_WRITE_BEHIND:
+        consumption_buffer.start()
+    prediction_scheduler.start()
+    unread_reconciler.start()
 
 @app.on_event("shutdown")
 async def shutdown_event():
+    # Fail readiness first so the load balancer stops sending traffic
+    readiness.draining = True
+    await unread_reconciler.stop()
+    await prediction_scheduler.stop(timeout=settings.AI_SERVICE_TIMEOUT)
+    await consumption_buffer.drain(timeout=settings.INGEST_DRAIN_TIMEOUT_SECONDS)
+    await close_ai_client()
+    shutdown_password_pool()
+    await state.close()
     await close_mongo_connection()
+    await loop_monitor.stop()
 
 @app.get("/")
 async def root():
@@ -52,16 +117,30 @@ async def root():
         "docs": "/docs"
     }
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics_endpoint():
+    if not settings.METRICS_ENABLED:
+        return PlainTextResponse("Metrics disabled\n", status_code=404)
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy", "timestamp": "2024-01-01T00:00:00Z"}
+    """Liveness: the process is running and serving requests"""
+    return liveness()
+
+@app.get("/ready")
+async def readiness_check():
+    """Readiness: dependencies are reachable and this worker has capacity"""
+    result = await readiness.check()
+    return JSONResponse(result, status_code=200 if result["ready"] else 503)
 
 if __name__ == "__main__":
+    # Development server with auto-reload; use `python -m app.serve` in production
     import uvicorn
     uvicorn.run(
-        "main:app",
-        host="192.168.10.129",
-        port=8000,
+        "app.main:app",
+        host=settings.SERVER_HOST,
+        port=settings.SERVER_PORT,
         reload=True,
         log_level="info"
     )
\ No newline at end of file
@@ -0,0 +1,253 @@
+"""In-process metrics in the Prometheus text format.
+
+Counters and histograms are plain dicts keyed by label values, updated under
+a per-metric lock that is only contended by MongoDB driver threads, so they
+can stay on in production. Point-in-time values (pool usage, cache sizes,
+queue depths) are read from the existing stats() functions at scrape time.
+Each worker process keeps its own metrics.
+"""
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+from pymongo.monitoring import CommandListener
+
+# Seconds; covers sub-millisecond cache hits up to AI calls timing out
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30
+)
+
+_START_TIME = time.time()
+_metrics: List["Metric"] = []
+_stats: List[Tuple[str, str, Callable[[], Dict[str, Any]], Optional[str]]] = []
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[Any], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, *labels: Any, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        for labels, value in list(self._values.items()):
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}")
+        return lines
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [count per bucket (last one is +Inf), sum]
+        self._values: Dict[Tuple, list] = {}
+
+    def observe(self, value: float, *labels: Any) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    @contextmanager
+    def time(self, *labels: Any) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        for labels, (counts, total) in list(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = _labels(self.labelnames, labels, f'le="{_number(bound)}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            label_text = _labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {total}")
+            lines.append(f"{self.name}_count{label_text} {cumulative}")
+        return lines
+
+
+def register_stats(
+    prefix: str, help: str, stats: Callable[[], Dict[str, Any]], label: Optional[str] = None
+) -> None:
+    """Export the numeric values of a stats() dict as gauges named prefix_key
+
+    With a label, stats returns {label value: stats dict} instead.
+    """
+    _stats.append((prefix, help, stats, label))
+
+
+def _render_stats() -> List[str]:
+    samples: Dict[str, List[str]] = {}
+    helps: Dict[str, str] = {}
+    for prefix, help, stats, label in _stats:
+        try:
+            groups = stats() if label else {None: stats()}
+        except Exception:
+            continue
+        for label_value, values in groups.items():
+            label_text = _labels((label,), (label_value,)) if label else ""
+            for key, value in values.items():
+                if isinstance(value, bool):
+                    value = int(value)
+                if not isinstance(value, (int, float)):
+                    continue
+                name = f"{prefix}_{key}"
+                helps[name] = help
+                samples.setdefault(name, []).append(f"{name}{label_text} {_number(value)}")
+
+    lines = []
+    for name, metric_samples in samples.items():
+        lines.append(f"# HELP {name} {helps[name]}")
+        lines.append(f"# TYPE {name} gauge")
+        lines.extend(metric_samples)
+    return lines
+
+
+def render() -> str:
+    lines = [
+        "# HELP hems_process_start_time_seconds Start time of this worker process",
+        "# TYPE hems_process_start_time_seconds gauge",
+        f'hems_process_start_time_seconds{{pid="{os.getpid()}"}} {_START_TIME}',
+    ]
+    for metric in _metrics:
+        lines.extend(metric.render())
+    lines.extend(_render_stats())
+    return "\n".join(lines) + "\n"
+
+
+http_requests = Counter(
+    "hems_http_requests_total", "HTTP requests by router, method and status",
+    ("router", "method", "status"),
+)
+http_request_duration = Histogram(
+    "hems_http_request_duration_seconds", "HTTP request latency by router", ("router",)
+)
+http_errors = Counter(
+    "hems_http_errors_total", "Requests that raised an unhandled exception", ("router",)
+)
+ingest_stage_duration = Histogram(
+    "hems_ingest_stage_duration_seconds",
+    "Time spent in each stage of sensor data ingestion",
+    ("endpoint", "stage"),
+)
+mongodb_command_duration = Histogram(
+    "hems_mongodb_command_duration_seconds", "MongoDB command latency", ("command",)
+)
+mongodb_command_failures = Counter(
+    "hems_mongodb_command_failures_total", "Failed MongoDB commands", ("command",)
+)
+ai_request_duration = Histogram(
+    "hems_ai_request_duration_seconds",
+    "AI service request latency by path and outcome",
+    ("path", "outcome"),
+)
+
+
+class CommandMetrics(CommandListener):
+    """Records MongoDB command timings reported by the driver"""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        mongodb_command_duration.observe(event.duration_micros / 1e6, event.command_name)
+
+    def failed(self, event):
+        mongodb_command_duration.observe(event.duration_micros / 1e6, event.command_name)
+        mongodb_command_failures.inc(event.command_name)
+
+
+class MetricsMiddleware:
+    """ASGI middleware counting requests and their latency per router
+
+    The router label is the first tag of the matched route (the routers are
+    included with one tag each), so it stays bounded whatever the paths are.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        except Exception:
+            http_errors.inc(_router(scope))
+            raise
+        finally:
+            router = _router(scope)
+            http_request_duration.observe(time.perf_counter() - start, router)
+            http_requests.inc(router, scope["method"], status_code)
+
+
+def _router(scope) -> str:
+    route = scope.get("route")
+    tags = getattr(route, "tags", None)
+    if tags:
+        return str(tags[0])
+    return "root" if route is not None else "unmatched"
@@ -3,6 +3,7 @@ from datetime import datetime
 from pydantic import BaseModel, Field, EmailStr, validator
 from bson import ObjectId
 import json
+from app.utils import to_naive_utc
 
 
 class PyObjectId(ObjectId):
@@ -102,6 +103,7 @@ class Subscription(BaseModel):
     start_date: datetime
     end_date: datetime
     status: str
+    alerts_triggered: List[str] = []  # Alert thresholds already raised
 
     @validator("status")
     def validate_status(cls, v):
@@ -115,6 +117,16 @@ class Subscription(BaseModel):
         json_encoders = {ObjectId: str}
 
 
+class EnergyDeduction(BaseModel):
+    remaining_kwh: float
+    percentage: float
+    triggered_alerts: List[str] = []  # Thresholds newly crossed by this deduction
+
+
+class BatchDeduction(EnergyDeduction):
+    billed: List[bool] = []  # Per reading of the batch, whether it was deducted
+
+
 class Consumption(BaseModel):
     id: Optional[PyObjectId] = Field(default_factory=PyObjectId, alias="_id")
     user_id: PyObjectId
@@ -127,6 +139,9 @@ class Consumption(BaseModel):
     devices_off: int = Field(..., ge=0)
     location: str
 
+    # Sensors may send offset timestamps; stored and compared as naive UTC
+    _naive_utc_timestamp = validator("timestamp", allow_reuse=True)(to_naive_utc)
+
     class Config:
         allow_population_by_field_name = True
         arbitrary_types_allowed = True
@@ -175,6 +190,37 @@ class Alert(BaseModel):
         json_encoders = {ObjectId: str}
 
 
+class Device(BaseModel):
+    id: Optional[PyObjectId] = Field(default_factory=PyObjectId, alias="_id")
+    user_id: PyObjectId
+    device_id: str = Field(..., min_length=1, max_length=100)
+    name: Optional[str] = None
+    api_key_hash: str  # SHA-256 of the API key, which is not stored
+    is_active: bool = True
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+    class Config:
+        allow_population_by_field_name = True
+        arbitrary_types_allowed = True
+        json_encoders = {ObjectId: str}
+
+
+class DeviceCreate(BaseModel):
+    device_id: str = Field(..., min_length=1, max_length=100)
+    name: Optional[str] = None
+
+
+class DeviceResponse(BaseModel):
+    device_id: str
+    name: Optional[str]
+    is_active: bool
+    created_at: datetime
+
+
+class DeviceRegistered(DeviceResponse):
+    api_key: str  # Only ever returned here
+
+
 class SensorData(BaseModel):
     device_id: str
     meter_id: str
@@ -0,0 +1,191 @@
+"""Local stand-in for Redis.
+
+Speaks enough of the Redis protocol for the shared state backend (HELLO,
+PING, GET, SET with NX/EX/PX, DEL, PUBLISH, SUBSCRIBE), in RESP2 or, after
+HELLO 3 as sent by redis-py 6+, RESP3, so several workers can be
+run and tested together without a Redis server:
+
+    python -m app.redis_stub --port 6379
+    STATE_BACKEND=redis REDIS_URL=redis://localhost:6379/0 python -m app.serve
+"""
+import argparse
+import asyncio
+import sys
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+
+class RedisStub:
+    def __init__(self):
+        self._values: Dict[bytes, Tuple[bytes, Optional[float]]] = {}
+        self._channels: Dict[bytes, Set[asyncio.StreamWriter]] = {}
+        # Connections that switched to RESP3
+        self._resp3: Set[asyncio.StreamWriter] = set()
+
+    async def _read_command(self, reader: asyncio.StreamReader) -> Optional[List[bytes]]:
+        line = await reader.readline()
+        if not line:
+            return None
+        if not line.startswith(b"*"):
+            # Inline command, as sent by telnet or redis-cli --pipe
+            return line.split()
+        args = []
+        for _ in range(int(line[1:])):
+            size = int((await reader.readline())[1:])
+            args.append((await reader.readexactly(size + 2))[:-2])
+        return args
+
+    @staticmethod
+    def _encode(value, resp3: bool = False, push: bool = False) -> bytes:
+        """Encode a reply; push marks out-of-band pub/sub messages"""
+        if value is None:
+            return b"_\r\n" if resp3 else b"$-1\r\n"
+        if isinstance(value, int):
+            return b":%d\r\n" % value
+        if isinstance(value, str):
+            return f"+{value}\r\n".encode()
+        if isinstance(value, Exception):
+            message = str(value)
+            # Errors carry their own code (NOPROTO ...) or get the generic one
+            if not message.split(" ", 1)[0].isupper():
+                message = f"ERR {message}"
+            return f"-{message}\r\n".encode()
+        if isinstance(value, dict):
+            if resp3:
+                return b"%%%d\r\n" % len(value) + b"".join(
+                    RedisStub._encode(k, resp3) + RedisStub._encode(v, resp3)
+                    for k, v in value.items()
+                )
+            value = [item for pair in value.items() for item in pair]
+        if isinstance(value, list):
+            kind = b">" if resp3 and push else b"*"
+            return kind + b"%d\r\n" % len(value) + b"".join(
+                RedisStub._encode(v, resp3) for v in value
+            )
+        return b"$%d\r\n%s\r\n" % (len(value), value)
+
+    def _get(self, key: bytes) -> Optional[bytes]:
+        entry = self._values.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self._values[key]
+            return None
+        return value
+
+    def _set(self, args: List[bytes]):
+        key, value, options = args[0], args[1], [a.upper() for a in args[2:]]
+        expires_at = None
+        for flag, scale in ((b"EX", 1.0), (b"PX", 0.001)):
+            if flag in options:
+                expires_at = time.monotonic() + int(args[2 + options.index(flag) + 1]) * scale
+        if b"NX" in options and self._get(key) is not None:
+            return None
+        self._values[key] = (value, expires_at)
+        return "OK"
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        subscriptions: Set[bytes] = set()
+        try:
+            while True:
+                args = await self._read_command(reader)
+                if args is None:
+                    break
+                if not args:
+                    continue
+                command, args = args[0].upper(), args[1:]
+
+                if command == b"PING":
+                    reply = args[0] if args else "PONG"
+                elif command == b"GET":
+                    reply = self._get(args[0])
+                elif command == b"SET":
+                    reply = self._set(args)
+                elif command == b"DEL":
+                    reply = sum(
+                        1 for key in args if self._get(key) is not None and self._values.pop(key)
+                    )
+                elif command == b"PUBLISH":
+                    subscribers = list(self._channels.get(args[0], ()))
+                    for subscriber in subscribers:
+                        subscriber.write(
+                            self._encode(
+                                [b"message", args[0], args[1]],
+                                subscriber in self._resp3,
+                                push=True,
+                            )
+                        )
+                    reply = len(subscribers)
+                elif command in (b"SUBSCRIBE", b"UNSUBSCRIBE"):
+                    for channel in args or list(subscriptions):
+                        if command == b"SUBSCRIBE":
+                            subscriptions.add(channel)
+                            self._channels.setdefault(channel, set()).add(writer)
+                        else:
+                            subscriptions.discard(channel)
+                            self._channels.get(channel, set()).discard(writer)
+                        writer.write(
+                            self._encode(
+                                [command.lower(), channel, len(subscriptions)],
+                                writer in self._resp3,
+                                push=True,
+                            )
+                        )
+                    await writer.drain()
+                    continue
+                elif command == b"HELLO":
+                    protocol = args[0] if args else b"2"
+                    if protocol not in (b"2", b"3"):
+                        reply = Exception("NOPROTO unsupported protocol version")
+                    else:
+                        if protocol == b"3":
+                            self._resp3.add(writer)
+                        else:
+                            self._resp3.discard(writer)
+                        reply = {
+                            b"server": b"redis",
+                            b"version": b"7.0.0",
+                            b"proto": int(protocol),
+                            b"id": id(writer),
+                            b"mode": b"standalone",
+                            b"role": b"master",
+                            b"modules": [],
+                        }
+                elif command in (b"SELECT", b"CLIENT"):
+                    reply = "OK"
+                elif command == b"QUIT":
+                    writer.write(self._encode("OK"))
+                    break
+                else:
+                    reply = Exception(f"unknown command '{command.decode()}'")
+
+                writer.write(self._encode(reply, writer in self._resp3))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            for channel in subscriptions:
+                self._channels.get(channel, set()).discard(writer)
+            self._resp3.discard(writer)
+            writer.close()
+
+    async def serve(self, host: str, port: int) -> asyncio.AbstractServer:
+        return await asyncio.start_server(self._handle, host, port)
+
+
+async def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.redis_stub")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6379)
+    args = parser.parse_args(argv)
+
+    server = await RedisStub().serve(args.host, args.port)
+    print(f"Redis stub listening on {args.host}:{args.port}")
+    async with server:
+        await server.serve_forever()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
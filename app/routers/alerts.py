@@ -1,11 +1,20 @@
-from typing import List, Optional
+import asyncio
+import json
+from typing import Any, Dict, List, Optional
 from fastapi import APIRouter, Depends, HTTPException, status
-from app.auth import get_current_active_user
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from app.auth import create_stream_token, get_current_active_user, get_stream_user
+from app.config import settings
 from app.models import User, Alert, PyObjectId
+from app.services.alert_hub import alert_hub
 from app.services.alert_service import AlertService
 
 router = APIRouter()
 
+def _sse(event: str, data: Dict[str, Any]) -> bytes:
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n".encode()
+
 @router.get("/list", response_model=List[Alert])
 async def get_alerts(
     read: Optional[bool] = None,
@@ -26,6 +35,63 @@ async def get_latest_alerts(current_user: User = Depends(get_current_active_user
         "unread_count": unread_count
     }
 
+@router.post("/stream-token")
+async def get_stream_token(current_user: User = Depends(get_current_active_user)):
+    """Short-lived token for /alerts/stream?access_token=, for EventSource
+    clients that cannot send an Authorization header"""
+    return {
+        "access_token": create_stream_token(current_user),
+        "expires_in": settings.ALERT_STREAM_TOKEN_SECONDS,
+    }
+
+@router.get("/stream")
+async def stream_alerts(current_user: User = Depends(get_stream_user)):
+    """Server-sent events: a snapshot of the latest unread alerts, then every
+    new alert and read change as it happens, each with the unread count"""
+    # Subscribed before the snapshot so nothing created meanwhile is missed
+    subscription = alert_hub.subscribe(str(current_user.id))
+    if subscription is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many alert streams, poll /alerts/latest instead",
+            headers={"Retry-After": "30"},
+        )
+
+    async def events():
+        try:
+            alerts = await AlertService.get_user_alerts(current_user.id, read=False, limit=10)
+            unread_count = await AlertService.get_unread_count(current_user.id)
+            yield b"retry: 5000\n\n"
+            yield _sse(
+                "snapshot",
+                {
+                    "alerts": [AlertService.to_event(alert) for alert in alerts],
+                    "unread_count": unread_count,
+                },
+            )
+            while True:
+                try:
+                    event = await asyncio.wait_for(
+                        subscription.queue.get(), settings.ALERT_STREAM_HEARTBEAT_SECONDS
+                    )
+                except asyncio.TimeoutError:
+                    # Comment line, keeps proxies from closing an idle stream
+                    yield b": keep-alive\n\n"
+                    continue
+                if event["event"] == "close":
+                    break
+                yield _sse(event["event"], event["data"])
+        finally:
+            alert_hub.unsubscribe(subscription)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        # Also runs when the client leaves before the stream starts
+        background=BackgroundTask(alert_hub.unsubscribe, subscription),
+    )
+
 @router.post("/mark-as-read/{alert_id}")
 async def mark_alert_as_read(
     alert_id: str,
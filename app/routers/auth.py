@@ -3,7 +3,7 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
 from app.database import get_collection
 from app.models import Token, UserCreate
-from app.utils import verify_password, create_access_token
+from app.utils import verify_password_async, create_access_token, PasswordPoolBusy
 from app.config import settings
 
 router = APIRouter()
@@ -14,7 +14,18 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends()):
     users_collection = get_collection("users")
     user = await users_collection.find_one({"email": form_data.username})
     
-    if not user or not verify_password(form_data.password, user["hashed_password"]):
+    try:
+        password_ok = user is not None and await verify_password_async(
+            form_data.password, user["hashed_password"]
+        )
+    except PasswordPoolBusy:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many login attempts in progress, try again shortly",
+            headers={"Retry-After": "1"},
+        )
+    
+    if not password_ok:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
@@ -23,7 +34,8 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends()):
     
     access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": user["email"]}, expires_delta=access_token_expires
+        data={"sub": user["email"], "uid": str(user["_id"])},
+        expires_delta=access_token_expires,
     )
     
     return {"access_token": access_token, "token_type": "bearer"}
\ No newline at end of file
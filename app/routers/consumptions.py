@@ -1,15 +1,21 @@
-from typing import List
+import importlib.util
+from typing import List, Optional
 from datetime import datetime
-from fastapi import APIRouter, Depends, HTTPException, status
-from app.database import get_collection
-from app.auth import get_current_active_user
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
+from app.config import settings
+from app.metrics import ingest_stage_duration
+from app.auth import get_current_active_user, get_sensor_device
 from app.models import User, Consumption, SensorData, ConsumptionAggregation, PyObjectId
 from app.utils import watt_to_kwh
 from app.services.consumption_service import ConsumptionService
 from app.services.subscription_service import SubscriptionService
 from app.services.alert_service import AlertService
 from app.services.save_mode_service import SaveModeService
-from app.services.ai_service import AIService
+from app.services.prediction_scheduler import prediction_scheduler
+from app.services.device_service import DeviceKey
+from app.services.meter_service import MeterService
+from app.services.export_service import ExportService, MEDIA_TYPES
 import logging
 
 router = APIRouter()
@@ -17,19 +23,29 @@ logger = logging.getLogger(__name__)
 
 
 @router.post("/sensor/data")
-async def receive_sensor_data(sensor_data: SensorData):
+async def receive_sensor_data(
+    sensor_data: SensorData, device: Optional[DeviceKey] = Depends(get_sensor_device)
+):
     """استقبال بيانات الاستهلاك من العداد باستخدام meter_id فقط"""
     try:
         # البحث عن المستخدم باستخدام meter_id فقط
-        users_collection = get_collection("users")
-        user_data = await users_collection.find_one({"meter_id": sensor_data.meter_id})
+        with ingest_stage_duration.time("single", "lookup"):
+            user = await MeterService.resolve(sensor_data.meter_id)
 
-        if not user_data:
+        if not user:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND, detail="Meter ID not registered"
             )
-
-        user = User(**user_data)
+        if device is not None and device.user_id != user.id:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Device is not registered to this meter's user",
+            )
+        if device is not None and sensor_data.device_id != device.device_id:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Reading does not come from the authenticated device",
+            )
 
         # Convert watt to kWh (assuming 1 hour measurement)
         power_usage_kwh = watt_to_kwh(sensor_data.total_power_watt)
@@ -48,32 +64,36 @@ async def receive_sensor_data(sensor_data: SensorData):
         )
 
         # Store consumption
-        await ConsumptionService.create_consumption(consumption)
+        with ingest_stage_duration.time("single", "insert"):
+            await ConsumptionService.create_consumption(consumption)
 
-        # Deduct from subscription
-        deduction_success = await SubscriptionService.deduct_energy(
-            user.id, power_usage_kwh
-        )
+        # Deduct from subscription; the update returns the new balance and
+        # claims any alert thresholds it crossed
+        with ingest_stage_duration.time("single", "deduction"):
+            deduction = await SubscriptionService.deduct_energy(user.id, power_usage_kwh)
 
-        if not deduction_success:
+        if not deduction:
             logger.warning(f"Failed to deduct energy for user {user.id}")
+            with ingest_stage_duration.time("single", "percentage"):
+                deduction = await SubscriptionService.claim_threshold_alerts(user.id)
 
-        # Check subscription percentage and trigger alerts
-        percentage = await SubscriptionService.get_subscription_percentage(user.id)
-        if percentage is not None:
-            # Check and create alerts
-            triggered_alerts = await AlertService.check_and_create_alerts(
-                user.id, percentage
-            )
+        if deduction:
+            # Create the alerts of the claimed thresholds
+            with ingest_stage_duration.time("single", "alerts"):
+                triggered_alerts = await AlertService.create_threshold_alerts(
+                    user.id, deduction.percentage, deduction.triggered_alerts
+                )
 
             # Auto-enable save mode if critical threshold reached
             if "CRITICAL" in triggered_alerts:
-                await SaveModeService.process_low_energy_save_mode(user.id, percentage)
-
-        # Trigger AI prediction (async - don't wait for response)
-        import asyncio
+                with ingest_stage_duration.time("single", "save_mode"):
+                    await SaveModeService.process_low_energy_save_mode(
+                        user.id, deduction.percentage
+                    )
 
-        asyncio.create_task(AIService.fetch_ai_prediction(user.id))
+        # Trigger AI prediction (coalesced per user, runs in the background)
+        with ingest_stage_duration.time("single", "prediction"):
+            prediction_scheduler.schedule(user.id)
 
         return {
             "status": "success",
@@ -92,6 +112,152 @@ async def receive_sensor_data(sensor_data: SensorData):
         )
 
 
+@router.post("/sensor/data/batch")
+async def receive_sensor_data_batch(
+    sensor_data: List[SensorData], device: Optional[DeviceKey] = Depends(get_sensor_device)
+):
+    """Receive many meter readings, possibly from many meters, in one request
+
+    With a device API key, only readings of that device, for meters belonging
+    to the device's user, are accepted.
+    """
+    if not sensor_data:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="No sensor data provided"
+        )
+    if len(sensor_data) > settings.SENSOR_BATCH_MAX_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Batch exceeds {settings.SENSOR_BATCH_MAX_SIZE} readings",
+        )
+
+    try:
+        # Resolve every meter in the batch with at most one query
+        with ingest_stage_duration.time("batch", "lookup"):
+            users_by_meter = await MeterService.resolve_many(
+                reading.meter_id for reading in sensor_data
+            )
+
+        results = []
+        consumptions = []
+        consumption_indexes = []
+        now = datetime.utcnow()
+        for index, reading in enumerate(sensor_data):
+            user = users_by_meter.get(reading.meter_id)
+            if user is None:
+                results.append(
+                    {"index": index, "status": "error", "detail": "Meter ID not registered"}
+                )
+                continue
+            if device is not None and device.user_id != user.id:
+                results.append(
+                    {
+                        "index": index,
+                        "status": "error",
+                        "detail": "Device is not registered to this meter's user",
+                    }
+                )
+                continue
+            if device is not None and reading.device_id != device.device_id:
+                results.append(
+                    {
+                        "index": index,
+                        "status": "error",
+                        "detail": "Reading does not come from the authenticated device",
+                    }
+                )
+                continue
+            user_id = user.id
+
+            power_usage_kwh = watt_to_kwh(reading.total_power_watt)
+            consumptions.append(
+                Consumption(
+                    user_id=user_id,
+                    device_id=reading.device_id,
+                    power_usage_kwh=power_usage_kwh,
+                    total_power_watt=reading.total_power_watt,
+                    timestamp=reading.timestamp or now,
+                    temperature=reading.temperature,
+                    devices_on=reading.devices_on,
+                    devices_off=reading.devices_off,
+                    location=reading.location,
+                )
+            )
+            consumption_indexes.append(index)
+            results.append(
+                {
+                    "index": index,
+                    "status": "success",
+                    "kwh_used": power_usage_kwh,
+                    "user_id": str(user_id),
+                }
+            )
+
+        # Store all consumptions with one unordered insert
+        with ingest_stage_duration.time("batch", "insert"):
+            failed = await ConsumptionService.create_consumptions(consumptions)
+        usage = {}
+        usage_positions = {}
+        for position, consumption in enumerate(consumptions):
+            result = results[consumption_indexes[position]]
+            if position in failed:
+                result.update(status="error", detail="Failed to store consumption")
+                del result["kwh_used"]
+                continue
+            readings = usage.setdefault(consumption.user_id, [])
+            usage_positions[position] = len(readings)
+            readings.append(consumption.power_usage_kwh)
+
+        # Deduct the combined usage of each subscription, users concurrently
+        with ingest_stage_duration.time("batch", "deduction"):
+            deductions = await SubscriptionService.deduct_energy_many(usage)
+
+        for user_id, deduction in deductions.items():
+            if not deduction:
+                logger.warning(f"Failed to deduct energy for user {user_id}")
+                with ingest_stage_duration.time("batch", "percentage"):
+                    deduction = await SubscriptionService.claim_threshold_alerts(user_id)
+
+            if deduction:
+                with ingest_stage_duration.time("batch", "alerts"):
+                    triggered_alerts = await AlertService.create_threshold_alerts(
+                        user_id, deduction.percentage, deduction.triggered_alerts
+                    )
+                if "CRITICAL" in triggered_alerts:
+                    with ingest_stage_duration.time("batch", "save_mode"):
+                        await SaveModeService.process_low_energy_save_mode(
+                            user_id, deduction.percentage
+                        )
+
+            with ingest_stage_duration.time("batch", "prediction"):
+                prediction_scheduler.schedule(user_id)
+
+        for position, consumption in enumerate(consumptions):
+            if position not in failed:
+                deduction = deductions[consumption.user_id]
+                results[consumption_indexes[position]]["deducted"] = (
+                    deduction is not None and deduction.billed[usage_positions[position]]
+                )
+
+        processed = sum(1 for result in results if result["status"] == "success")
+        return {
+            "status": "success",
+            "message": f"Processed {processed} of {len(results)} readings",
+            "processed": processed,
+            "failed": len(results) - processed,
+            "results": results,
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error processing sensor data batch: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Error processing sensor data",
+        )
+
+
 @router.get("/user/{user_id}/hourly", response_model=List[ConsumptionAggregation])
 async def get_hourly_consumption(
     user_id: str, date: datetime, current_user: User = Depends(get_current_active_user)
@@ -154,3 +320,75 @@ async def get_today_consumption(
         PyObjectId(user_id)
     )
     return {"total_consumption_kwh": total_consumption}
+
+
+def _export_response(
+    user_id: PyObjectId,
+    export_format: str,
+    start: Optional[datetime],
+    end: Optional[datetime],
+    after: Optional[str],
+    device_id: Optional[str],
+) -> StreamingResponse:
+    if export_format == "arrow" and importlib.util.find_spec("pyarrow") is None:
+        raise HTTPException(
+            status_code=status.HTTP_501_NOT_IMPLEMENTED,
+            detail="Arrow export requires the 'pyarrow' package",
+        )
+    try:
+        after_cursor = ExportService.parse_cursor(after) if after else None
+    except Exception:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid 'after' cursor"
+        )
+
+    batches = ExportService.iter_batches(user_id, start, end, after_cursor, device_id)
+    extension = "arrows" if export_format == "arrow" else export_format
+    return StreamingResponse(
+        ExportService.encode(export_format, batches),
+        media_type=MEDIA_TYPES[export_format],
+        headers={
+            "Content-Disposition": f'attachment; filename="consumptions-{user_id}.{extension}"'
+        },
+    )
+
+
+@router.get("/user/{user_id}/export")
+async def export_consumption(
+    user_id: str,
+    format: str = Query("ndjson", regex="^(ndjson|csv|arrow)$"),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    after: Optional[str] = None,
+    device_id: Optional[str] = None,
+    current_user: User = Depends(get_current_active_user),
+):
+    """Stream raw readings as ndjson, CSV or Arrow; resume with after=<timestamp>_<id>"""
+    if current_user.id != PyObjectId(user_id):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized to access this resource",
+        )
+
+    return _export_response(PyObjectId(user_id), format, start, end, after, device_id)
+
+
+@router.get("/meter/{meter_id}/export")
+async def export_meter_consumption(
+    meter_id: str,
+    format: str = Query("ndjson", regex="^(ndjson|csv|arrow)$"),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    after: Optional[str] = None,
+    device_id: Optional[str] = None,
+    current_user: User = Depends(get_current_active_user),
+):
+    """Stream the raw readings of a meter; same formats and cursor as the user export"""
+    user = await MeterService.resolve(meter_id)
+    if not user or user.id != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized to access this resource",
+        )
+
+    return _export_response(user.id, format, start, end, after, device_id)
@@ -1,13 +1,56 @@
+from typing import List
 from fastapi import APIRouter, Depends, HTTPException, status
 from app.auth import get_current_active_user
-from app.models import User, SaveModeRequest
+from app.models import (
+    User, SaveModeRequest, Device, DeviceCreate, DeviceResponse, DeviceRegistered
+)
+from app.services.device_service import DeviceService
 from app.services.save_mode_service import SaveModeService
 
 router = APIRouter()
 
 
 # -----------------------------
-# Save Mode endpoints only
+# Device registration
+# -----------------------------
+@router.post("/register", response_model=DeviceRegistered, status_code=status.HTTP_201_CREATED)
+async def register_device(
+    request: DeviceCreate, current_user: User = Depends(get_current_active_user)
+):
+    """Register a device; its API key is returned only in this response"""
+    api_key = DeviceService.generate_api_key()
+    device = Device(
+        user_id=current_user.id,
+        device_id=request.device_id,
+        name=request.name,
+        api_key_hash=DeviceService.hash_api_key(api_key),
+    )
+    if not await DeviceService.create_device(device):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT, detail="Device ID already registered"
+        )
+    return DeviceRegistered(**device.dict(), api_key=api_key)
+
+
+@router.get("/list", response_model=List[DeviceResponse])
+async def list_devices(current_user: User = Depends(get_current_active_user)):
+    return await DeviceService.get_user_devices(current_user.id)
+
+
+@router.post("/deactivate/{device_id}")
+async def deactivate_device(
+    device_id: str, current_user: User = Depends(get_current_active_user)
+):
+    """Deactivate a device; its API key stops working immediately"""
+    if not await DeviceService.deactivate_device(device_id, current_user.id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Active device not found"
+        )
+    return {"status": "success", "message": "Device deactivated"}
+
+
+# -----------------------------
+# Save Mode endpoints
 # -----------------------------
 @router.post("/save_mode")
 async def toggle_save_mode(
@@ -1,8 +1,9 @@
 from typing import List
 from fastapi import APIRouter, Depends, HTTPException, status
-from app.auth import get_current_active_user
+from app.auth import get_current_active_user, invalidate_principal
 from app.models import User, Subscription, PlanResponse, UpgradePlanRequest
 from app.services.subscription_service import SubscriptionService
+from app.services.meter_service import MeterService
 from app.database import get_collection
 
 router = APIRouter()
@@ -60,6 +61,8 @@ async def upgrade_plan(
             {"_id": current_user.id},
             {"$set": {"selected_plan": upgrade_request.plan_id}},
         )
+        MeterService.invalidate(current_user.meter_id)
+        invalidate_principal(current_user.id)
 
         return {
             "status": "success",
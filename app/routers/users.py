@@ -3,8 +3,9 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from app.database import get_collection
 from app.auth import get_current_active_user
 from app.models import User, UserResponse, UserCreate, PyObjectId
-from app.utils import get_password_hash
+from app.utils import get_password_hash_async, PasswordPoolBusy
 from app.services.subscription_service import SubscriptionService
+from app.services.meter_service import MeterService
 
 router = APIRouter()
 
@@ -37,11 +38,20 @@ async def register_user(user_data: UserCreate):
             status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid plan selected"
         )
 
+    try:
+        hashed_password = await get_password_hash_async(user_data.password)
+    except PasswordPoolBusy:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many registrations in progress, try again shortly",
+            headers={"Retry-After": "1"},
+        )
+
     # Create user
     user = User(
         name=user_data.name,
         email=user_data.email,
-        hashed_password=get_password_hash(user_data.password),
+        hashed_password=hashed_password,
         building_type=user_data.building_type,
         preferred_temp=user_data.preferred_temp,
         energy_goal=user_data.energy_goal,
@@ -50,6 +60,7 @@ async def register_user(user_data: UserCreate):
     )
 
     result = await users_collection.insert_one(user.dict(by_alias=True))
+    MeterService.invalidate(user.meter_id)
 
     # ⬅️ تم التعديل: إنشاء الباقة بناءً على الخطة المختارة
     subscription_success = await SubscriptionService.create_subscription_from_plan(
@@ -59,6 +70,7 @@ async def register_user(user_data: UserCreate):
     if not subscription_success:
         # If subscription creation fails, delete the user
         await users_collection.delete_one({"_id": result.inserted_id})
+        MeterService.invalidate(user.meter_id)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to create subscription",
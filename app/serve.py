@@ -0,0 +1,91 @@
+"""Production launcher for the HEMS backend.
+
+Runs the API on several uvicorn worker processes that share one listening
+socket, using uvloop and httptools when they are installed:
+
+    python -m app.serve                  # one worker per CPU core
+    python -m app.serve --workers 4 --port 8000
+
+Each worker has its own caches, prediction claims and alert streams, so
+more than one worker requires STATE_BACKEND=redis to share them (or
+--allow-unshared-state, accepting that they stay per worker). On SIGTERM/SIGINT workers stop accepting connections, finish
+requests in flight for up to SERVER_GRACEFUL_TIMEOUT_SECONDS, then run the
+shutdown hooks (ingest buffer drain, scheduled predictions).
+"""
+import argparse
+import importlib.util
+import logging
+import os
+import sys
+import uvicorn
+from app.config import settings
+
+logger = logging.getLogger("app.serve")
+
+
+def _pick(module: str, preferred: str, fallback: str) -> str:
+    return preferred if importlib.util.find_spec(module) is not None else fallback
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.serve")
+    parser.add_argument("--host", default=settings.SERVER_HOST)
+    parser.add_argument("--port", type=int, default=settings.SERVER_PORT)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=settings.SERVER_WORKERS,
+        help="Worker processes (0 = one per CPU core)",
+    )
+    parser.add_argument(
+        "--allow-unshared-state",
+        action="store_true",
+        help="Run several workers with STATE_BACKEND=memory anyway",
+    )
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=args.log_level.upper())
+
+    workers = args.workers or os.cpu_count() or 1
+
+    if workers > 1 and settings.STATE_BACKEND == "memory":
+        if not args.allow_unshared_state:
+            logger.error(
+                f"Refusing to run {workers} workers with STATE_BACKEND=memory: cache "
+                "invalidations, prediction claims and alert streams would not reach "
+                "the other workers. Set STATE_BACKEND=redis, use --workers 1, or pass "
+                "--allow-unshared-state"
+            )
+            return 2
+        logger.warning(
+            f"Running {workers} workers with STATE_BACKEND=memory: cache "
+            "invalidations stay within one worker until entries expire"
+        )
+
+    loop = _pick("uvloop", "uvloop", "asyncio")
+    http = _pick("httptools", "httptools", "h11")
+    logger.info(f"Starting {workers} workers on {args.host}:{args.port} ({loop}, {http})")
+
+    uvicorn.run(
+        "app.main:app",
+        host=args.host,
+        port=args.port,
+        workers=workers,
+        loop=loop,
+        http=http,
+        backlog=settings.SERVER_BACKLOG,
+        timeout_keep_alive=settings.SERVER_KEEPALIVE_SECONDS,
+        timeout_graceful_shutdown=settings.SERVER_GRACEFUL_TIMEOUT_SECONDS,
+        limit_concurrency=settings.SERVER_LIMIT_CONCURRENCY,
+        log_level=args.log_level,
+        # Access lines cost more than most requests at high ingest rates
+        access_log=False,
+        proxy_headers=True,
+        server_header=False,
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,9 +1,11 @@
 from typing import List, Optional, Dict, Any
 from datetime import datetime, timedelta
 import httpx
+from app import timeseries
 from app.database import get_collection
 from app.models import Prediction, PyObjectId, Consumption
-from app.config import settings
+from app.ai_client import post_to_ai
+from app.services.feature_window import feature_window
 import logging
 
 logger = logging.getLogger(__name__)
@@ -12,18 +14,23 @@ class AIService:
     @staticmethod
     async def get_user_consumption_data(user_id: PyObjectId, hours: int = 24) -> List[Dict[str, Any]]:
         """Get user consumption data for AI analysis"""
-        consumptions_collection = get_collection("consumptions")
+        if hours == feature_window.hours:
+            # Hourly buckets kept up to date at ingest time
+            features = await feature_window.load([user_id])
+            return features.get(user_id, [])
+        
+        consumptions_collection = get_collection("consumptions", "analytics")
         
         start_time = datetime.utcnow() - timedelta(hours=hours)
         
-        cursor = consumptions_collection.find({
+        cursor = consumptions_collection.find(timeseries.stored_query({
             "user_id": user_id,
             "timestamp": {"$gte": start_time}
-        }).sort("timestamp", 1)
+        })).sort("timestamp", 1)
         
         data = []
         async for doc in cursor:
-            consumption = Consumption(**doc)
+            consumption = Consumption(**timeseries.from_stored(doc))
             data.append({
                 "timestamp": consumption.timestamp.isoformat(),
                 "power_usage_kwh": consumption.power_usage_kwh,
@@ -54,32 +61,28 @@ class AIService:
                 "timestamp": datetime.utcnow().isoformat()
             }
             
-            async with httpx.AsyncClient(timeout=settings.AI_SERVICE_TIMEOUT) as client:
-                response = await client.post(
-                    f"{settings.AI_SERVICE_URL}/predict",
-                    json=request_data
+            response = await post_to_ai("/predict", request_data)
+            
+            if response.status_code == 200:
+                ai_response = response.json()
+                
+                # Store prediction
+                prediction = Prediction(
+                    user_id=user_id,
+                    prediction_type=ai_response.get("prediction_type", "daily"),
+                    suggestions=ai_response.get("suggestions", []),
+                    timestamp=datetime.utcnow(),
+                    source="external_ai_service"
                 )
                 
-                if response.status_code == 200:
-                    ai_response = response.json()
-                    
-                    # Store prediction
-                    prediction = Prediction(
-                        user_id=user_id,
-                        prediction_type=ai_response.get("prediction_type", "daily"),
-                        suggestions=ai_response.get("suggestions", []),
-                        timestamp=datetime.utcnow(),
-                        source="external_ai_service"
-                    )
-                    
-                    predictions_collection = get_collection("predictions")
-                    await predictions_collection.insert_one(prediction.dict(by_alias=True))
-                    
-                    logger.info(f"AI prediction stored for user {user_id}")
-                    return prediction
-                else:
-                    logger.error(f"AI service error: {response.status_code} - {response.text}")
-                    return None
+                predictions_collection = get_collection("predictions")
+                await predictions_collection.insert_one(prediction.dict(by_alias=True))
+                
+                logger.info(f"AI prediction stored for user {user_id}")
+                return prediction
+            else:
+                logger.error(f"AI service error: {response.status_code} - {response.text}")
+                return None
                     
         except httpx.RequestError as e:
             logger.error(f"AI service request failed: {str(e)}")
@@ -88,6 +91,100 @@ class AIService:
             logger.error(f"Unexpected error in AI service: {str(e)}")
             return None
 
+    @staticmethod
+    async def get_users_consumption_data(
+        user_ids: List[PyObjectId], hours: int = 24
+    ) -> Dict[PyObjectId, List[Dict[str, Any]]]:
+        """Get consumption data of several users with a single query"""
+        if hours == feature_window.hours:
+            return await feature_window.load(user_ids)
+        
+        consumptions_collection = get_collection("consumptions", "analytics")
+        
+        start_time = datetime.utcnow() - timedelta(hours=hours)
+        
+        cursor = consumptions_collection.find(timeseries.stored_query({
+            "user_id": {"$in": user_ids},
+            "timestamp": {"$gte": start_time}
+        })).sort("timestamp", 1)
+        
+        data: Dict[PyObjectId, List[Dict[str, Any]]] = {}
+        async for doc in cursor:
+            consumption = Consumption(**timeseries.from_stored(doc))
+            data.setdefault(consumption.user_id, []).append({
+                "timestamp": consumption.timestamp.isoformat(),
+                "power_usage_kwh": consumption.power_usage_kwh,
+                "total_power_watt": consumption.total_power_watt,
+                "temperature": consumption.temperature,
+                "devices_on": consumption.devices_on,
+                "location": consumption.location
+            })
+        
+        return data
+
+    @staticmethod
+    async def fetch_ai_predictions(user_ids: List[PyObjectId]) -> List[Prediction]:
+        """Fetch predictions for several users with one request to the AI service
+        
+        The AI service answers POST /predict/batch with one entry per user,
+        and all predictions are stored with a single insert_many.
+        """
+        try:
+            consumption_data = await AIService.get_users_consumption_data(user_ids)
+            
+            now = datetime.utcnow()
+            requests = [
+                {
+                    "user_id": str(user_id),
+                    "consumption_data": consumption_data[user_id],
+                    "prediction_type": "daily",
+                    "timestamp": now.isoformat()
+                }
+                for user_id in user_ids
+                if consumption_data.get(user_id)
+            ]
+            
+            if not requests:
+                logger.warning(f"No consumption data found for {len(user_ids)} users")
+                return []
+            
+            response = await post_to_ai("/predict/batch", {"requests": requests})
+            
+            if response.status_code != 200:
+                logger.error(f"AI service error: {response.status_code} - {response.text}")
+                return []
+            
+            users = {str(user_id): user_id for user_id in user_ids}
+            predictions = []
+            for ai_response in response.json().get("predictions", []):
+                user_id = users.get(ai_response.get("user_id"))
+                if user_id is None:
+                    continue
+                predictions.append(Prediction(
+                    user_id=user_id,
+                    prediction_type=ai_response.get("prediction_type", "daily"),
+                    suggestions=ai_response.get("suggestions", []),
+                    timestamp=now,
+                    source="external_ai_service"
+                ))
+            
+            if predictions:
+                predictions_collection = get_collection("predictions")
+                await predictions_collection.insert_many(
+                    [prediction.dict(by_alias=True) for prediction in predictions],
+                    ordered=False
+                )
+            
+            logger.info(f"AI predictions stored for {len(predictions)} of {len(user_ids)} users")
+            return predictions
+                    
+        except httpx.RequestError as e:
+            logger.error(f"AI service request failed: {str(e)}")
+            return []
+        except Exception as e:
+            logger.error(f"Unexpected error in AI service: {str(e)}")
+            return []
+
     @staticmethod
     async def get_user_predictions(
         user_id: PyObjectId, 
@@ -114,13 +211,9 @@ class AIService:
                 "timestamp": datetime.utcnow().isoformat()
             }
             
-            async with httpx.AsyncClient(timeout=settings.AI_SERVICE_TIMEOUT) as client:
-                response = await client.post(
-                    f"{settings.AI_SERVICE_URL}/usage-history",
-                    json=request_data
-                )
-                
-                return response.status_code == 200
+            response = await post_to_ai("/usage-history", request_data)
+            
+            return response.status_code == 200
                 
         except Exception as e:
             logger.error(f"Error sending usage history: {str(e)}")
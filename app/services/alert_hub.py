@@ -0,0 +1,110 @@
+import asyncio
+from typing import Any, Dict, Optional, Set
+from app.config import settings
+from app.state import state
+import logging
+
+logger = logging.getLogger(__name__)
+
+DROP_POLICIES = ("drop_oldest", "drop_newest", "disconnect")
+
+
+class AlertSubscription:
+    """One stream's bounded queue of alert events"""
+
+    def __init__(self, user_id: str, max_queue: int):
+        self.user_id = user_id
+        self.queue: "asyncio.Queue[Dict[str, Any]]" = asyncio.Queue(maxsize=max_queue)
+        self.dropped = 0
+        self.closed = False
+
+
+class AlertHub:
+    """In-process fan-out of alert events to the streams of each user
+
+    Publishing never waits on a slow client: every subscription has a
+    bounded queue, and when it is full the drop policy decides whether the
+    oldest event is discarded (the default; the newest unread count always
+    gets through), the new one is, or the stream is disconnected so the
+    client reconnects and starts from a fresh snapshot. Events are broadcast
+    through the shared state backend, so streams held by other workers
+    receive them too.
+    """
+
+    def __init__(self, max_queue: int, drop_policy: str, max_subscribers: int):
+        if drop_policy not in DROP_POLICIES:
+            raise ValueError(f"Unknown alert stream drop policy: {drop_policy}")
+        self.max_queue = max_queue
+        self.drop_policy = drop_policy
+        self.max_subscribers = max_subscribers
+        self._subscriptions: Dict[str, Set[AlertSubscription]] = {}
+        self.subscribers = 0
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.disconnected = 0
+
+    def subscribe(self, user_id: str) -> Optional[AlertSubscription]:
+        """Open a subscription; None when this worker holds too many streams"""
+        if self.subscribers >= self.max_subscribers:
+            return None
+        subscription = AlertSubscription(user_id, self.max_queue)
+        self._subscriptions.setdefault(user_id, set()).add(subscription)
+        self.subscribers += 1
+        return subscription
+
+    def unsubscribe(self, subscription: AlertSubscription) -> None:
+        subscriptions = self._subscriptions.get(subscription.user_id)
+        if subscriptions is None or subscription not in subscriptions:
+            return
+        subscriptions.discard(subscription)
+        if not subscriptions:
+            del self._subscriptions[subscription.user_id]
+        self.subscribers -= 1
+
+    def publish(self, user_id: str, event: Dict[str, Any]) -> None:
+        """Send an event to the user's streams in every worker"""
+        self.published += 1
+        state.broadcast("alerts", {"user_id": user_id, "event": event})
+
+    def _deliver(self, payload: Dict[str, Any]) -> None:
+        for subscription in list(self._subscriptions.get(payload["user_id"], ())):
+            self._offer(subscription, payload["event"])
+
+    def _offer(self, subscription: AlertSubscription, event: Dict[str, Any]) -> None:
+        if subscription.closed:
+            return
+        if subscription.queue.full():
+            subscription.dropped += 1
+            self.dropped += 1
+            if self.drop_policy == "drop_newest":
+                return
+            if self.drop_policy == "disconnect":
+                subscription.closed = True
+                self.disconnected += 1
+                # Wake the stream so it notices it was closed
+                subscription.queue.get_nowait()
+                subscription.queue.put_nowait({"event": "close"})
+                return
+            subscription.queue.get_nowait()
+        subscription.queue.put_nowait(event)
+        self.delivered += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "subscribers": self.subscribers,
+            "users": len(self._subscriptions),
+            "max_subscribers": self.max_subscribers,
+            "published": self.published,
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+            "disconnected": self.disconnected,
+        }
+
+
+alert_hub = AlertHub(
+    max_queue=settings.ALERT_STREAM_QUEUE_SIZE,
+    drop_policy=settings.ALERT_STREAM_DROP_POLICY,
+    max_subscribers=settings.ALERT_STREAM_MAX_SUBSCRIBERS,
+)
+state.add_listener("alerts", alert_hub._deliver)
@@ -1,15 +1,26 @@
-from typing import List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 from datetime import datetime
+from bson import ObjectId
+from pymongo import ReturnDocument, UpdateOne
+from app.cache import TTLCache
 from app.database import get_collection
 from app.models import Alert, PyObjectId
 from app.config import settings
+from app.services.alert_hub import alert_hub
+from app.state import state
 import logging
 
 logger = logging.getLogger(__name__)
 
 
 class AlertService:
-    _triggered_thresholds = {}  # Track triggered alerts per user
+    # Unread counts are kept in alert_counters ({_id: user_id, unread: n}),
+    # adjusted with $inc whenever an alert is created or read, so the polled
+    # count is a single _id lookup rather than a count over alert history
+    _unread_cache = TTLCache(
+        maxsize=settings.ALERT_UNREAD_CACHE_SIZE,
+        ttl=settings.ALERT_UNREAD_CACHE_TTL_SECONDS,
+    )
 
     @staticmethod
     async def create_alert(
@@ -35,21 +46,48 @@ class AlertService:
 
         if result.acknowledged:
             logger.info(f"Alert created for user {user_id}: {alert_type} - {message}")
+            unread_count = await AlertService._adjust_unread(user_id, 1)
+            await AlertService._push(
+                user_id, "alert", unread_count, AlertService.to_event(alert)
+            )
             return True
         return False
 
     @staticmethod
-    async def check_and_create_alerts(
-        user_id: PyObjectId, percentage: float
-    ) -> List[str]:
-        """Check thresholds and create alerts if needed"""
-        from app.services.subscription_service import SubscriptionService
+    def to_event(alert: Alert) -> Dict[str, Any]:
+        """JSON-ready alert as sent to alert streams"""
+        return {
+            "id": str(alert.id),
+            "alert_type": alert.alert_type,
+            "percentage": alert.percentage,
+            "message": alert.message,
+            "timestamp": alert.timestamp.isoformat(),
+            "read": alert.read,
+            "auto_triggered": alert.auto_triggered,
+        }
 
-        triggered_alerts = []
-        user_key = str(user_id)
+    @staticmethod
+    async def _push(
+        user_id: PyObjectId,
+        event: str,
+        unread_count: Optional[int],
+        data: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        """Send an event with the unread count to the user's alert streams"""
+        try:
+            if unread_count is None:
+                unread_count = await AlertService.get_unread_count(user_id)
+            alert_hub.publish(
+                str(user_id),
+                {"event": event, "data": {**(data or {}), "unread_count": unread_count}},
+            )
+        except Exception as e:
+            logger.error(f"Failed to push {event} event to user {user_id}: {str(e)}")
 
-        # Check each threshold
-        thresholds = [
+    @staticmethod
+    def get_thresholds() -> List[Tuple[float, str, str]]:
+        """Alert thresholds as (percentage, alert type, message)"""
+        return [
             (
                 settings.WARNING_THRESHOLD * 100,
                 "WARNING",
@@ -67,23 +105,23 @@ class AlertService:
             ),
         ]
 
-        for threshold, alert_type, message in thresholds:
-            if (
-                percentage <= threshold
-                and user_key
-                not in AlertService._triggered_thresholds.get(alert_type, set())
-            ):
+    @staticmethod
+    async def create_threshold_alerts(
+        user_id: PyObjectId, percentage: float, alert_types: List[str]
+    ) -> List[str]:
+        """Create the alerts of thresholds claimed on the subscription
 
+        Which thresholds fire is decided atomically with the energy deduction
+        (see SubscriptionService.deduct_energy), so each one is raised once
+        per subscription, even across workers and restarts.
+        """
+        triggered_alerts = []
+        for _, alert_type, message in AlertService.get_thresholds():
+            if alert_type in alert_types:
                 await AlertService.create_alert(
                     user_id, alert_type, percentage, message
                 )
                 triggered_alerts.append(alert_type)
-
-                # Mark this threshold as triggered for this user
-                if alert_type not in AlertService._triggered_thresholds:
-                    AlertService._triggered_thresholds[alert_type] = set()
-                AlertService._triggered_thresholds[alert_type].add(user_key)
-
         return triggered_alerts
 
     @staticmethod
@@ -109,7 +147,11 @@ class AlertService:
         result = await alerts_collection.update_one(
             {"_id": alert_id, "user_id": user_id}, {"$set": {"read": True}}
         )
-        return result.modified_count > 0
+        if result.modified_count > 0:
+            unread_count = await AlertService._adjust_unread(user_id, -1)
+            await AlertService._push(user_id, "read", unread_count, {"id": str(alert_id)})
+            return True
+        return False
 
     @staticmethod
     async def mark_all_alerts_as_read(user_id: PyObjectId) -> bool:
@@ -118,12 +160,140 @@ class AlertService:
         result = await alerts_collection.update_many(
             {"user_id": user_id, "read": False}, {"$set": {"read": True}}
         )
-        return result.modified_count > 0
+        if result.modified_count > 0:
+            unread_count = await AlertService._adjust_unread(
+                user_id, -result.modified_count
+            )
+            await AlertService._push(user_id, "read", unread_count)
+            return True
+        return False
+
+    @staticmethod
+    async def _adjust_unread(user_id: PyObjectId, delta: int) -> Optional[int]:
+        """Apply a change to the user's unread counter and return the new count
+
+        Runs after the alert write it accounts for; if it fails the counter
+        drifts until the next reconciliation, so errors are only logged.
+        """
+        counters_collection = get_collection("alert_counters")
+        try:
+            counter = await counters_collection.find_one_and_update(
+                {"_id": user_id},
+                {"$inc": {"unread": delta}},
+                return_document=ReturnDocument.AFTER,
+            )
+            if counter is None:
+                # First change since counters were introduced; the count
+                # already includes the alert write this accounts for
+                unread_count = await AlertService._seed_unread(user_id)
+            else:
+                unread_count = max(0, counter["unread"])
+        except Exception as e:
+            logger.error(f"Failed to update unread counter of user {user_id}: {str(e)}")
+            state.invalidate("unread", user_id)
+            return None
+        state.invalidate("unread", user_id)
+        AlertService._unread_cache.set(user_id, unread_count)
+        return unread_count
 
     @staticmethod
     async def get_unread_count(user_id: PyObjectId) -> int:
         """Get count of unread alerts"""
+        unread_count = AlertService._unread_cache.get(user_id)
+        if unread_count is not None:
+            return unread_count
+
+        counters_collection = get_collection("alert_counters")
+        counter = await counters_collection.find_one({"_id": user_id})
+        if counter is None:
+            # No alert created or read since counters were introduced
+            unread_count = await AlertService._seed_unread(user_id)
+        else:
+            unread_count = max(0, counter["unread"])
+        AlertService._unread_cache.set(user_id, unread_count)
+        return unread_count
+
+    @staticmethod
+    async def _seed_unread(user_id: PyObjectId) -> int:
+        """Create a missing unread counter from the user's unread alerts
+
+        A counter created concurrently (by another seed) wins, and its
+        value is returned.
+        """
         alerts_collection = get_collection("alerts")
-        return await alerts_collection.count_documents(
+        unread_count = await alerts_collection.count_documents(
             {"user_id": user_id, "read": False}
         )
+        counter = await get_collection("alert_counters").find_one_and_update(
+            {"_id": user_id},
+            {"$setOnInsert": {"unread": unread_count}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        return max(0, counter["unread"])
+
+    @staticmethod
+    def cache_stats() -> Dict[str, Any]:
+        return AlertService._unread_cache.stats()
+
+    @staticmethod
+    async def reconcile_unread_counts() -> Dict[str, int]:
+        """Reset every unread counter to the number of unread alerts
+
+        Corrects drift left by a failed counter update. Counters are read
+        before the alerts are counted, and each correction only applies if
+        the counter still holds the value read, so an $inc made meanwhile
+        is never overwritten; that counter is corrected by the next run.
+        Missing counters are only created, never replaced. The unread alerts
+        are counted from the (read, user_id) index.
+
+        Counts are eventually consistent: _adjust_unread runs separately
+        after the alert write, so an alert written during a run may be
+        counted here before its $inc lands, leaving that counter off by one
+        until the next run.
+        """
+        alerts_collection = get_collection("alerts")
+        counters_collection = get_collection("alert_counters")
+
+        stored: Dict[ObjectId, Optional[int]] = {}
+        async for counter in counters_collection.find({}, {"unread": 1}):
+            stored[counter["_id"]] = counter.get("unread")
+
+        actual: Dict[ObjectId, int] = {}
+        async for row in alerts_collection.aggregate(
+            [
+                {"$match": {"read": False}},
+                {"$group": {"_id": "$user_id", "unread": {"$sum": 1}}},
+            ]
+        ):
+            actual[row["_id"]] = row["unread"]
+
+        corrections: Dict[ObjectId, UpdateOne] = {}
+        for user_id, value in stored.items():
+            unread = actual.pop(user_id, 0)
+            if value != unread:
+                corrections[user_id] = UpdateOne(
+                    {"_id": user_id, "unread": value}, {"$set": {"unread": unread}}
+                )
+        # Users with unread alerts and no counter yet
+        for user_id, unread in actual.items():
+            corrections[user_id] = UpdateOne(
+                {"_id": user_id}, {"$setOnInsert": {"unread": unread}}, upsert=True
+            )
+
+        user_ids = list(corrections)
+        corrected = 0
+        for start in range(0, len(user_ids), 1000):
+            chunk = user_ids[start:start + 1000]
+            result = await counters_collection.bulk_write(
+                [corrections[user_id] for user_id in chunk], ordered=False
+            )
+            corrected += result.modified_count + result.upserted_count
+            for user_id in chunk:
+                state.invalidate("unread", user_id)
+        if corrected:
+            logger.info(f"Reconciled unread counters, {corrected} corrected")
+        return {"corrected": corrected}
+
+
+state.register_cache("unread", AlertService._unread_cache, key_type=ObjectId)
@@ -1,188 +1,233 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Set
 from datetime import datetime, timedelta
-from app.database import get_collection
+from pymongo.errors import BulkWriteError
+from app import timeseries
+from app.config import settings
+from app.database import get_collection, get_database
+from app.indexes import RETENTION_DAYS, ensure_indexes
 from app.models import Consumption, PyObjectId, ConsumptionAggregation
 from app.utils import watt_to_kwh
+from app.services.ingest_buffer import consumption_buffer
+from app.services.feature_window import feature_window
+from app.services.rollup_service import RollupService
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Where a regular consumptions collection is moved by the time-series migration
+LEGACY_CONSUMPTIONS = "consumptions_legacy"
+
 class ConsumptionService:
     @staticmethod
     async def create_consumption(consumption: Consumption) -> bool:
-        """Store consumption data"""
-        consumptions_collection = get_collection("consumptions")
-        result = await consumptions_collection.insert_one(consumption.dict(by_alias=True))
+        """Store consumption data
+
+        With write-behind enabled the document is only queued here and is
+        written by the ingest buffer as part of a larger insert_many.
+        """
+        if consumption_buffer.running:
+            await consumption_buffer.put(consumption.dict(by_alias=True))
+            feature_window.record(consumption)
+            return True
+
+        document = consumption.dict(by_alias=True)
+        consumptions_collection = get_collection("consumptions", "ingest")
+        result = await consumptions_collection.insert_one(timeseries.to_stored(document))
+        await RollupService.apply([document])
+        feature_window.record(consumption)
         return result.acknowledged
 
+    @staticmethod
+    async def create_consumptions(consumptions: List[Consumption]) -> Set[int]:
+        """Store many consumption records in one unordered insert.
+
+        Returns the indexes of the records that could not be written.
+        """
+        if not consumptions:
+            return set()
+
+        documents = [consumption.dict(by_alias=True) for consumption in consumptions]
+        if consumption_buffer.running:
+            await consumption_buffer.put_many(documents)
+            for consumption in consumptions:
+                feature_window.record(consumption)
+            return set()
+
+        consumptions_collection = get_collection("consumptions", "ingest")
+        try:
+            await consumptions_collection.insert_many(
+                [timeseries.to_stored(document) for document in documents], ordered=False
+            )
+        except BulkWriteError as e:
+            failed = {error["index"] for error in e.details.get("writeErrors", [])}
+            logger.error(f"Failed to store {len(failed)} of {len(documents)} consumptions")
+        else:
+            failed = set()
+
+        await RollupService.apply(
+            [document for index, document in enumerate(documents) if index not in failed]
+        )
+        for index, consumption in enumerate(consumptions):
+            if index not in failed:
+                feature_window.record(consumption)
+        return failed
+
+    @staticmethod
+    def _to_aggregation(period: str, rollup: Dict[str, Any]) -> ConsumptionAggregation:
+        return ConsumptionAggregation(
+            period=period,
+            total_consumption_kwh=rollup["kwh"],
+            average_power_watt=rollup["watt_sum"] / rollup["count"] if rollup["count"] else 0.0,
+            timestamp=rollup["first_timestamp"]
+        )
+
     @staticmethod
     async def get_hourly_consumption(user_id: PyObjectId, date: datetime) -> List[ConsumptionAggregation]:
         """Get hourly consumption aggregation for a specific date"""
-        consumptions_collection = get_collection("consumptions")
-        
         start_of_day = datetime(date.year, date.month, date.day)
         end_of_day = start_of_day + timedelta(days=1)
         
-        pipeline = [
-            {
-                "$match": {
-                    "user_id": user_id,
-                    "timestamp": {
-                        "$gte": start_of_day,
-                        "$lt": end_of_day
-                    }
-                }
-            },
-            {
-                "$group": {
-                    "_id": {
-                        "year": {"$year": "$timestamp"},
-                        "month": {"$month": "$timestamp"},
-                        "day": {"$dayOfMonth": "$timestamp"},
-                        "hour": {"$hour": "$timestamp"}
-                    },
-                    "total_consumption_kwh": {"$sum": "$power_usage_kwh"},
-                    "average_power_watt": {"$avg": "$total_power_watt"},
-                    "timestamp": {"$first": "$timestamp"}
-                }
-            },
-            {
-                "$sort": {"_id.hour": 1}
-            }
+        rollups = await RollupService.get_rollups(
+            "consumption_hourly", user_id, start_of_day, end_of_day
+        )
+        return [
+            ConsumptionService._to_aggregation(f"{rollup['period_start'].hour:02d}:00", rollup)
+            for rollup in rollups
         ]
-        
-        aggregations = []
-        async for doc in consumptions_collection.aggregate(pipeline):
-            aggregations.append(ConsumptionAggregation(
-                period=f"{doc['_id']['hour']:02d}:00",
-                total_consumption_kwh=doc["total_consumption_kwh"],
-                average_power_watt=doc["average_power_watt"],
-                timestamp=doc["timestamp"]
-            ))
-        
-        return aggregations
 
     @staticmethod
     async def get_daily_consumption(user_id: PyObjectId, year: int, month: int) -> List[ConsumptionAggregation]:
         """Get daily consumption aggregation for a specific month"""
-        consumptions_collection = get_collection("consumptions")
-        
         start_of_month = datetime(year, month, 1)
         if month == 12:
             end_of_month = datetime(year + 1, 1, 1)
         else:
             end_of_month = datetime(year, month + 1, 1)
         
-        pipeline = [
-            {
-                "$match": {
-                    "user_id": user_id,
-                    "timestamp": {
-                        "$gte": start_of_month,
-                        "$lt": end_of_month
-                    }
-                }
-            },
-            {
-                "$group": {
-                    "_id": {
-                        "year": {"$year": "$timestamp"},
-                        "month": {"$month": "$timestamp"},
-                        "day": {"$dayOfMonth": "$timestamp"}
-                    },
-                    "total_consumption_kwh": {"$sum": "$power_usage_kwh"},
-                    "average_power_watt": {"$avg": "$total_power_watt"},
-                    "timestamp": {"$first": "$timestamp"}
-                }
-            },
-            {
-                "$sort": {"_id.day": 1}
-            }
+        rollups = await RollupService.get_rollups(
+            "consumption_daily", user_id, start_of_month, end_of_month
+        )
+        return [
+            ConsumptionService._to_aggregation(rollup["period_start"].strftime("%Y-%m-%d"), rollup)
+            for rollup in rollups
         ]
-        
-        aggregations = []
-        async for doc in consumptions_collection.aggregate(pipeline):
-            aggregations.append(ConsumptionAggregation(
-                period=f"{doc['_id']['year']}-{doc['_id']['month']:02d}-{doc['_id']['day']:02d}",
-                total_consumption_kwh=doc["total_consumption_kwh"],
-                average_power_watt=doc["average_power_watt"],
-                timestamp=doc["timestamp"]
-            ))
-        
-        return aggregations
 
     @staticmethod
     async def get_monthly_consumption(user_id: PyObjectId, year: int) -> List[ConsumptionAggregation]:
         """Get monthly consumption aggregation for a specific year"""
-        consumptions_collection = get_collection("consumptions")
-        
         start_of_year = datetime(year, 1, 1)
         end_of_year = datetime(year + 1, 1, 1)
         
-        pipeline = [
-            {
-                "$match": {
-                    "user_id": user_id,
-                    "timestamp": {
-                        "$gte": start_of_year,
-                        "$lt": end_of_year
-                    }
-                }
-            },
-            {
-                "$group": {
-                    "_id": {
-                        "year": {"$year": "$timestamp"},
-                        "month": {"$month": "$timestamp"}
-                    },
-                    "total_consumption_kwh": {"$sum": "$power_usage_kwh"},
-                    "average_power_watt": {"$avg": "$total_power_watt"},
-                    "timestamp": {"$first": "$timestamp"}
-                }
-            },
-            {
-                "$sort": {"_id.month": 1}
-            }
+        rollups = await RollupService.get_rollups(
+            "consumption_monthly", user_id, start_of_year, end_of_year
+        )
+        return [
+            ConsumptionService._to_aggregation(rollup["period_start"].strftime("%Y-%m"), rollup)
+            for rollup in rollups
         ]
-        
-        aggregations = []
-        async for doc in consumptions_collection.aggregate(pipeline):
-            aggregations.append(ConsumptionAggregation(
-                period=f"{doc['_id']['year']}-{doc['_id']['month']:02d}",
-                total_consumption_kwh=doc["total_consumption_kwh"],
-                average_power_watt=doc["average_power_watt"],
-                timestamp=doc["timestamp"]
-            ))
-        
-        return aggregations
 
     @staticmethod
     async def get_total_consumption_today(user_id: PyObjectId) -> float:
         """Get total consumption for today"""
-        consumptions_collection = get_collection("consumptions")
-        
         today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
         tomorrow = today + timedelta(days=1)
         
-        pipeline = [
-            {
-                "$match": {
-                    "user_id": user_id,
-                    "timestamp": {
-                        "$gte": today,
-                        "$lt": tomorrow
+        rollups = await RollupService.get_rollups("consumption_daily", user_id, today, tomorrow)
+        if rollups:
+            return rollups[0]["kwh"]
+        return 0.0
+
+    @staticmethod
+    async def migrate_to_timeseries(
+        batch_size: int = 5000, drop_legacy: bool = False
+    ) -> Dict[str, Any]:
+        """Move readings from a regular consumptions collection to a time-series one
+
+        The regular collection is renamed to consumptions_legacy and an empty
+        time-series consumptions collection takes its place, so ingestion can
+        resume against it right away; stop the API for this swap, which is
+        quick, and restart it with CONSUMPTIONS_TIMESERIES=true. Readings are
+        then copied in _id order with the last copied _id recorded after each
+        batch, so an interrupted run continues where it stopped. Rollups are
+        not touched, they already count every copied reading.
+        """
+        if not settings.CONSUMPTIONS_TIMESERIES:
+            raise ValueError("Set CONSUMPTIONS_TIMESERIES=true to migrate")
+
+        database = get_database()
+        current = await timeseries.collection_info(database, "consumptions")
+        legacy = await timeseries.collection_info(database, LEGACY_CONSUMPTIONS)
+        if current is not None and current.get("type") != "timeseries":
+            if legacy is not None:
+                raise ValueError(
+                    f"Both consumptions and {LEGACY_CONSUMPTIONS} are regular collections"
+                )
+            await database["consumptions"].rename(LEGACY_CONSUMPTIONS)
+            legacy, current = current, None
+            logger.info(f"Renamed consumptions to {LEGACY_CONSUMPTIONS}")
+        if current is None:
+            await database.create_collection(
+                "consumptions", **timeseries.collection_options(RETENTION_DAYS["consumptions"])
+            )
+            await ensure_indexes(database)
+            logger.info("Created time-series consumptions")
+        if legacy is None:
+            return {"copied": 0, "legacy": None}
+
+        migrations_collection = database["migrations"]
+        progress = await migrations_collection.find_one({"_id": "consumptions_timeseries"})
+        last_id: Optional[Any] = progress["last_id"] if progress else None
+
+        source = database[LEGACY_CONSUMPTIONS]
+        target = database["consumptions"]
+        cursor = source.find({"_id": {"$gt": last_id}} if last_id else {}).sort("_id", 1)
+        cursor = cursor.batch_size(batch_size)
+        copied = 0
+        # A run stopped between writing a batch and recording it would
+        # otherwise copy that batch twice
+        check_existing = last_id is not None
+        try:
+            while True:
+                batch = await cursor.to_list(length=batch_size)
+                if not batch:
+                    break
+                last_id = batch[-1]["_id"]
+                if check_existing:
+                    check_existing = False
+                    # The time range lets the server skip every other bucket
+                    timestamps = [doc["timestamp"] for doc in batch]
+                    existing = {
+                        doc["_id"]
+                        async for doc in target.find(
+                            {
+                                "_id": {"$in": [doc["_id"] for doc in batch]},
+                                "timestamp": {"$gte": min(timestamps), "$lte": max(timestamps)},
+                            },
+                            {"_id": 1},
+                        )
                     }
-                }
-            },
-            {
-                "$group": {
-                    "_id": None,
-                    "total_consumption": {"$sum": "$power_usage_kwh"}
-                }
-            }
-        ]
-        
-        result = await consumptions_collection.aggregate(pipeline).to_list(length=1)
-        if result:
-            return result[0]["total_consumption"]
-        return 0.0
\ No newline at end of file
+                    batch = [doc for doc in batch if doc["_id"] not in existing]
+                if batch:
+                    await target.insert_many(
+                        [timeseries.to_stored(doc) for doc in batch], ordered=False
+                    )
+                await migrations_collection.update_one(
+                    {"_id": "consumptions_timeseries"},
+                    {"$set": {"last_id": last_id, "updated_at": datetime.utcnow()}},
+                    upsert=True,
+                )
+                copied += len(batch)
+                logger.info(f"Copied {copied} readings to time-series consumptions")
+        finally:
+            await cursor.close()
+
+        result: Dict[str, Any] = {
+            "copied": copied,
+            "legacy": LEGACY_CONSUMPTIONS,
+            "legacy_count": await source.estimated_document_count(),
+        }
+        if drop_legacy:
+            await source.drop()
+            await migrations_collection.delete_one({"_id": "consumptions_timeseries"})
+            result["legacy"] = None
+        return result
@@ -1,63 +1,140 @@
-import secrets
-from typing import List, Optional
-from datetime import datetime
-from app.database import get_collection
-from app.models import Device, PyObjectId
-import logging
-
-logger = logging.getLogger(__name__)
-
-
-class DeviceService:
-    @staticmethod
-    def generate_api_key() -> str:
-        """توليد مفتاح API عشوائي وآمن"""
-        return f"HEMS_{secrets.token_urlsafe(24)}"
-
-    @staticmethod
-    async def create_device(device: Device) -> bool:
-        """تسجيل جهاز جديد في النظام"""
-        devices_collection = get_collection("devices")
-
-        # التحقق من أن device_id غير مستخدم لنفس المستخدم
-        existing_device = await devices_collection.find_one(
-            {"device_id": device.device_id, "user_id": device.user_id}
-        )
-
-        if existing_device:
-            return False
-
-        result = await devices_collection.insert_one(device.dict(by_alias=True))
-        return result.acknowledged
-
-    @staticmethod
-    async def get_device_by_api_key(api_key: str) -> Optional[Device]:
-        """الحصول على بيانات الجهاز باستخدام API Key"""
-        devices_collection = get_collection("devices")
-        device_data = await devices_collection.find_one(
-            {"api_key": api_key, "is_active": True}
-        )
-
-        if device_data:
-            return Device(**device_data)
-        return None
-
-    @staticmethod
-    async def get_user_devices(user_id: PyObjectId) -> List[Device]:
-        """الحصول على جميع أجهزة المستخدم"""
-        devices_collection = get_collection("devices")
-        cursor = devices_collection.find({"user_id": user_id})
-
-        devices = []
-        async for doc in cursor:
-            devices.append(Device(**doc))
-        return devices
-
-    @staticmethod
-    async def deactivate_device(device_id: str, user_id: PyObjectId) -> bool:
-        """إبطال جهاز (حذف منطقي)"""
-        devices_collection = get_collection("devices")
-        result = await devices_collection.update_one(
-            {"device_id": device_id, "user_id": user_id}, {"$set": {"is_active": False}}
-        )
-        return result.modified_count > 0
+import hashlib
+import secrets
+from typing import Any, Dict, List, NamedTuple, Optional
+from datetime import datetime
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from app.cache import TTLCache
+from app.config import settings
+from app.database import get_collection
+from app.models import Device, PyObjectId
+from app.state import state
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEVICE_KEY_PROJECTION = {"_id": 1, "user_id": 1, "device_id": 1}
+
+
+class DeviceKey(NamedTuple):
+    """What sensor ingestion needs to know about an authenticated device"""
+
+    id: PyObjectId
+    user_id: PyObjectId
+    device_id: str
+
+
+class DeviceService:
+    # Devices store the SHA-256 of their API key, never the key itself, and
+    # are looked up by it; the caches of active devices and unknown keys are
+    # keyed by it too. An attacker cannot steer the hash of a guess, so
+    # lookup timing reveals nothing about stored keys.
+    _cache = TTLCache(settings.DEVICE_CACHE_SIZE, settings.DEVICE_CACHE_TTL_SECONDS)
+    _unknown = TTLCache(
+        settings.DEVICE_NEGATIVE_CACHE_SIZE, settings.DEVICE_NEGATIVE_CACHE_TTL_SECONDS
+    )
+
+    @staticmethod
+    def generate_api_key() -> str:
+        """توليد مفتاح API عشوائي وآمن"""
+        return f"HEMS_{secrets.token_urlsafe(24)}"
+
+    @staticmethod
+    def hash_api_key(api_key: str) -> str:
+        return hashlib.sha256(api_key.encode()).hexdigest()
+
+    @staticmethod
+    async def create_device(device: Device) -> bool:
+        """تسجيل جهاز جديد في النظام"""
+        devices_collection = get_collection("devices")
+
+        # The unique (user_id, device_id) index rejects a device_id the user
+        # already has, even when two registrations race
+        try:
+            result = await devices_collection.insert_one(device.dict(by_alias=True))
+        except DuplicateKeyError:
+            return False
+        return result.acknowledged
+
+    @staticmethod
+    async def get_device_by_api_key(api_key: str) -> Optional[Device]:
+        """الحصول على بيانات الجهاز باستخدام API Key"""
+        devices_collection = get_collection("devices")
+        device_data = await devices_collection.find_one(
+            {"api_key_hash": DeviceService.hash_api_key(api_key), "is_active": True}
+        )
+
+        if device_data:
+            return Device(**device_data)
+        return None
+
+    @staticmethod
+    async def authenticate(api_key: str) -> Optional[DeviceKey]:
+        """Resolve an API key to its active device, None if there is none
+
+        Served from the cache after the first request of a device, so
+        authenticating a reading costs no database round trip. A lookup
+        that overlaps a deactivation is not cached, as it may have read the
+        device while it was still active.
+        """
+        key_hash = DeviceService.hash_api_key(api_key)
+        device = DeviceService._cache.get(key_hash)
+        if device is not None:
+            return device
+        if key_hash in DeviceService._unknown:
+            return None
+
+        generation = DeviceService._cache.generation
+        devices_collection = get_collection("devices")
+        device_data = await devices_collection.find_one(
+            {"api_key_hash": key_hash, "is_active": True}, DEVICE_KEY_PROJECTION
+        )
+        if device_data is None:
+            DeviceService._unknown.set(key_hash, True)
+            return None
+        device = DeviceKey(
+            id=device_data["_id"],
+            user_id=device_data["user_id"],
+            device_id=device_data["device_id"],
+        )
+        DeviceService._cache.set(key_hash, device, generation=generation)
+        return device
+
+    @staticmethod
+    def invalidate(api_key_hash: str) -> None:
+        """Drop a key, by its hash, from the cache of every worker"""
+        state.invalidate("device", api_key_hash)
+
+    @staticmethod
+    def cache_stats() -> Dict[str, Any]:
+        return {**DeviceService._cache.stats(), "unknown": len(DeviceService._unknown)}
+
+    @staticmethod
+    async def get_user_devices(user_id: PyObjectId) -> List[Device]:
+        """الحصول على جميع أجهزة المستخدم"""
+        devices_collection = get_collection("devices")
+        cursor = devices_collection.find({"user_id": user_id})
+
+        devices = []
+        async for doc in cursor:
+            devices.append(Device(**doc))
+        return devices
+
+    @staticmethod
+    async def deactivate_device(device_id: str, user_id: PyObjectId) -> bool:
+        """إبطال جهاز (حذف منطقي)"""
+        devices_collection = get_collection("devices")
+        # The returned key hash is needed to evict the device from the caches
+        device_data = await devices_collection.find_one_and_update(
+            {"device_id": device_id, "user_id": user_id, "is_active": True},
+            {"$set": {"is_active": False}},
+            projection={"api_key_hash": 1},
+            return_document=ReturnDocument.BEFORE,
+        )
+        if device_data is None:
+            return False
+        DeviceService.invalidate(device_data["api_key_hash"])
+        return True
+
+
+state.register_cache("device", DeviceService._cache)
@@ -0,0 +1,170 @@
+import csv
+import io
+import json
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from bson import ObjectId
+from app import timeseries
+from app.config import settings
+from app.database import get_collection
+from app.models import PyObjectId
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Exported fields, in column order
+EXPORT_FIELDS = [
+    "id",
+    "timestamp",
+    "device_id",
+    "power_usage_kwh",
+    "total_power_watt",
+    "temperature",
+    "devices_on",
+    "devices_off",
+    "location",
+]
+
+EXPORT_PROJECTION = {field: 1 for field in EXPORT_FIELDS if field != "id"}
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+
+
+class ExportService:
+    """Streams raw consumption history without materialising it
+
+    Documents are read in cursor batches with a projection and encoded
+    batch by batch, so memory stays bounded by EXPORT_BATCH_SIZE whatever
+    the range. Readings are ordered by (timestamp, _id), and every row
+    carries both, so an interrupted export resumes with
+    after=<timestamp>_<id> of the last row received.
+    """
+
+    @staticmethod
+    def parse_cursor(cursor: str) -> Tuple[datetime, ObjectId]:
+        """Raises ValueError for a malformed cursor"""
+        timestamp, _, document_id = cursor.rpartition("_")
+        return datetime.fromisoformat(timestamp), ObjectId(document_id)
+
+    @staticmethod
+    async def iter_batches(
+        user_id: PyObjectId,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        after: Optional[Tuple[datetime, ObjectId]] = None,
+        device_id: Optional[str] = None,
+    ) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Raw consumption documents of a user with start <= timestamp < end"""
+        query: Dict[str, Any] = {"user_id": user_id}
+        timestamp_range: Dict[str, Any] = {}
+        if start is not None:
+            timestamp_range["$gte"] = start
+        if end is not None:
+            timestamp_range["$lt"] = end
+        if timestamp_range:
+            query["timestamp"] = timestamp_range
+        if after is not None:
+            after_timestamp, after_id = after
+            query["$or"] = [
+                {"timestamp": {"$gt": after_timestamp}},
+                {"timestamp": after_timestamp, "_id": {"$gt": after_id}},
+            ]
+        if device_id is not None:
+            query["device_id"] = device_id
+
+        consumptions_collection = get_collection("consumptions", "analytics")
+        cursor = (
+            consumptions_collection.find(
+                timeseries.stored_query(query), timeseries.stored_projection(EXPORT_PROJECTION)
+            )
+            .sort([("timestamp", 1), ("_id", 1)])
+            .batch_size(settings.EXPORT_BATCH_SIZE)
+        )
+        try:
+            while True:
+                batch = await cursor.to_list(length=settings.EXPORT_BATCH_SIZE)
+                if not batch:
+                    break
+                yield [timeseries.from_stored(document) for document in batch]
+        finally:
+            await cursor.close()
+
+    @staticmethod
+    def _row(document: Dict[str, Any]) -> Dict[str, Any]:
+        row = {field: document.get(field) for field in EXPORT_FIELDS}
+        row["id"] = str(document["_id"])
+        return row
+
+    @staticmethod
+    async def _ndjson(batches: AsyncIterator[List[Dict[str, Any]]]) -> AsyncIterator[bytes]:
+        async for batch in batches:
+            lines = []
+            for document in batch:
+                row = ExportService._row(document)
+                row["timestamp"] = row["timestamp"].isoformat()
+                lines.append(json.dumps(row, separators=(",", ":")))
+            yield ("\n".join(lines) + "\n").encode()
+
+    @staticmethod
+    async def _csv(batches: AsyncIterator[List[Dict[str, Any]]]) -> AsyncIterator[bytes]:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(EXPORT_FIELDS)
+        async for batch in batches:
+            for document in batch:
+                row = ExportService._row(document)
+                row["timestamp"] = row["timestamp"].isoformat()
+                writer.writerow(row[field] for field in EXPORT_FIELDS)
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue().encode()
+
+    @staticmethod
+    async def _arrow(batches: AsyncIterator[List[Dict[str, Any]]]) -> AsyncIterator[bytes]:
+        import pyarrow as pa
+
+        schema = pa.schema(
+            [
+                ("id", pa.string()),
+                ("timestamp", pa.timestamp("ms")),
+                ("device_id", pa.string()),
+                ("power_usage_kwh", pa.float64()),
+                ("total_power_watt", pa.float64()),
+                ("temperature", pa.float64()),
+                ("devices_on", pa.int64()),
+                ("devices_off", pa.int64()),
+                ("location", pa.string()),
+            ]
+        )
+        sink = io.BytesIO()
+        with pa.ipc.new_stream(sink, schema) as writer:
+            async for batch in batches:
+                columns = {field: [] for field in EXPORT_FIELDS}
+                for document in batch:
+                    for field, value in ExportService._row(document).items():
+                        columns[field].append(value)
+                writer.write_batch(pa.RecordBatch.from_pydict(columns, schema=schema))
+                yield sink.getvalue()
+                sink.seek(0)
+                sink.truncate()
+        # End-of-stream marker written when the writer closes
+        yield sink.getvalue()
+
+    @staticmethod
+    def encode(
+        export_format: str, batches: AsyncIterator[List[Dict[str, Any]]]
+    ) -> AsyncIterator[bytes]:
+        """Encode document batches as ndjson, csv or an Arrow IPC stream"""
+        if export_format == "ndjson":
+            return ExportService._ndjson(batches)
+        if export_format == "csv":
+            return ExportService._csv(batches)
+        if export_format == "arrow":
+            return ExportService._arrow(batches)
+        raise ValueError(f"Unsupported export format: {export_format}")
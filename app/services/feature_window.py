@@ -0,0 +1,261 @@
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional
+from bson import ObjectId
+from app import timeseries
+from app.config import settings
+from app.database import get_collection
+from app.models import Consumption, PyObjectId
+from app.state import state
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _hour(timestamp: datetime) -> datetime:
+    return timestamp.replace(minute=0, second=0, microsecond=0)
+
+
+class HourBucket:
+    __slots__ = (
+        "kwh",
+        "watt_sum",
+        "count",
+        "temperature_sum",
+        "temperature_count",
+        "devices_on",
+        "location",
+    )
+
+    def __init__(self):
+        self.kwh = 0.0
+        self.watt_sum = 0.0
+        self.count = 0
+        self.temperature_sum = 0.0
+        self.temperature_count = 0
+        self.devices_on = 0
+        self.location = None
+
+    def add(self, consumption: Consumption) -> None:
+        self.kwh += consumption.power_usage_kwh
+        self.watt_sum += consumption.total_power_watt
+        self.count += 1
+        if consumption.temperature is not None:
+            self.temperature_sum += consumption.temperature
+            self.temperature_count += 1
+        self.devices_on = consumption.devices_on
+        self.location = consumption.location
+
+    def features(self, hour: datetime) -> Dict[str, Any]:
+        return {
+            "timestamp": hour.isoformat(),
+            "power_usage_kwh": self.kwh,
+            "total_power_watt": self.watt_sum / self.count if self.count else 0.0,
+            "temperature": (
+                self.temperature_sum / self.temperature_count
+                if self.temperature_count
+                else None
+            ),
+            "devices_on": self.devices_on,
+            "location": self.location,
+            "readings": self.count,
+        }
+
+
+class FeatureWindow:
+    """Rolling per-user window of hourly consumption buckets
+
+    Kept up to date as readings are ingested, so building the input of a
+    prediction reads at most `hours` buckets instead of rescanning and
+    validating every raw reading. Users that are not in memory (cold start,
+    evicted) are rebuilt from MongoDB with one aggregation. The number of
+    users held is bounded; the least recently used ones are evicted. When
+    other processes also ingest readings, set max_age so windows that may be
+    missing their readings are rebuilt.
+
+    Readings of a user whose window is being rebuilt are held back meanwhile;
+    the rebuild only reads readings created before it started (by their
+    ObjectId) and replays the held ones created after that.
+    """
+
+    def __init__(self, hours: int, max_users: int, max_age: Optional[float] = None):
+        self.hours = hours
+        self.max_users = max_users
+        self.max_age = max_age
+        self._windows: "OrderedDict[PyObjectId, Dict[datetime, HourBucket]]" = OrderedDict()
+        self._loaded_at: Dict[PyObjectId, float] = {}
+        # Readings recorded while the user's window is being rebuilt
+        self._pending: Dict[PyObjectId, List[Consumption]] = {}
+        self.hits = 0
+        self.rebuilds = 0
+
+    def _prune(self, buckets: Dict[datetime, HourBucket], now: datetime) -> None:
+        oldest = _hour(now) - timedelta(hours=self.hours - 1)
+        for hour in [hour for hour in buckets if hour < oldest]:
+            del buckets[hour]
+
+    def _store(self, user_id: PyObjectId, buckets: Dict[datetime, HourBucket]) -> None:
+        self._windows[user_id] = buckets
+        self._windows.move_to_end(user_id)
+        self._loaded_at[user_id] = time.monotonic()
+        while len(self._windows) > self.max_users:
+            evicted, _ = self._windows.popitem(last=False)
+            self._loaded_at.pop(evicted, None)
+
+    def record(self, consumption: Consumption) -> None:
+        """Add a reading to the window of its user, if that window is loaded
+
+        Windows that are not loaded are left alone; they pick the reading up
+        from MongoDB when next rebuilt. With the write-behind buffer that is
+        only once it has been flushed, so a rebuild in between misses it
+        until the window is rebuilt again (max_age, eviction).
+        """
+        buckets = self._windows.get(consumption.user_id)
+        if buckets is None:
+            pending = self._pending.get(consumption.user_id)
+            if pending is not None:
+                pending.append(consumption)
+            return
+        self._add(buckets, consumption)
+
+    def _add(self, buckets: Dict[datetime, HourBucket], consumption: Consumption) -> None:
+        hour = _hour(consumption.timestamp)
+        if hour < _hour(datetime.utcnow()) - timedelta(hours=self.hours - 1):
+            return
+
+        bucket = buckets.get(hour)
+        if bucket is None:
+            bucket = buckets[hour] = HourBucket()
+        bucket.add(consumption)
+
+    def snapshot(self, user_id: PyObjectId) -> Optional[List[Dict[str, Any]]]:
+        """Hourly features of a loaded window, oldest first; None if not loaded"""
+        buckets = self._windows.get(user_id)
+        if buckets is None:
+            return None
+        if (
+            self.max_age is not None
+            and time.monotonic() - self._loaded_at[user_id] > self.max_age
+        ):
+            self.invalidate(user_id)
+            return None
+
+        self._windows.move_to_end(user_id)
+        self._prune(buckets, datetime.utcnow())
+        self.hits += 1
+        return [buckets[hour].features(hour) for hour in sorted(buckets)]
+
+    def invalidate(self, user_id: PyObjectId) -> None:
+        self._windows.pop(user_id, None)
+        self._loaded_at.pop(user_id, None)
+
+    async def load(
+        self, user_ids: Iterable[PyObjectId]
+    ) -> Dict[PyObjectId, List[Dict[str, Any]]]:
+        """Hourly features of several users, rebuilding cold windows from MongoDB"""
+        features: Dict[PyObjectId, List[Dict[str, Any]]] = {}
+        cold = []
+        for user_id in user_ids:
+            snapshot = self.snapshot(user_id)
+            if snapshot is None:
+                cold.append(user_id)
+            else:
+                features[user_id] = snapshot
+
+        if cold:
+            cutoff = ObjectId()
+            for user_id in cold:
+                self._pending.setdefault(user_id, [])
+            try:
+                windows = await self._rebuild(cold, cutoff)
+            finally:
+                pending = {user_id: self._pending.pop(user_id, []) for user_id in cold}
+            for user_id, buckets in windows.items():
+                if user_id in self._windows:
+                    # An overlapping rebuild finished first and is kept current
+                    snapshot = self.snapshot(user_id)
+                    if snapshot is not None:
+                        features[user_id] = snapshot
+                        continue
+                for consumption in pending[user_id]:
+                    if consumption.id >= cutoff:
+                        self._add(buckets, consumption)
+                self._store(user_id, buckets)
+                features[user_id] = [
+                    buckets[hour].features(hour) for hour in sorted(buckets)
+                ]
+        return features
+
+    async def _rebuild(
+        self, user_ids: List[PyObjectId], cutoff: ObjectId
+    ) -> Dict[PyObjectId, Dict[datetime, HourBucket]]:
+        consumptions_collection = get_collection("consumptions", "analytics")
+        start = _hour(datetime.utcnow()) - timedelta(hours=self.hours - 1)
+
+        pipeline = [
+            {
+                "$match": timeseries.stored_query(
+                    {
+                        "user_id": {"$in": user_ids},
+                        "timestamp": {"$gte": start},
+                        "_id": {"$lt": cutoff},
+                    }
+                )
+            },
+            {"$sort": {"timestamp": 1}},
+            {
+                "$group": {
+                    "_id": {
+                        "user_id": timeseries.ref("user_id"),
+                        "hour": {
+                            "$dateFromParts": {
+                                "year": {"$year": "$timestamp"},
+                                "month": {"$month": "$timestamp"},
+                                "day": {"$dayOfMonth": "$timestamp"},
+                                "hour": {"$hour": "$timestamp"},
+                            }
+                        },
+                    },
+                    "kwh": {"$sum": "$power_usage_kwh"},
+                    "watt_sum": {"$sum": "$total_power_watt"},
+                    "count": {"$sum": 1},
+                    "temperature_sum": {"$sum": "$temperature"},
+                    "temperature_count": {
+                        "$sum": {"$cond": [{"$gt": ["$temperature", None]}, 1, 0]}
+                    },
+                    "devices_on": {"$last": "$devices_on"},
+                    "location": {"$last": timeseries.ref("location")},
+                }
+            },
+        ]
+
+        windows: Dict[PyObjectId, Dict[datetime, HourBucket]] = {
+            user_id: {} for user_id in user_ids
+        }
+        async for doc in consumptions_collection.aggregate(pipeline):
+            bucket = HourBucket()
+            for field in HourBucket.__slots__:
+                setattr(bucket, field, doc[field])
+            windows[doc["_id"]["user_id"]][doc["_id"]["hour"]] = bucket
+
+        self.rebuilds += len(user_ids)
+        return windows
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "users": len(self._windows),
+            "max_users": self.max_users,
+            "hours": self.hours,
+            "max_age": self.max_age,
+            "hits": self.hits,
+            "rebuilds": self.rebuilds,
+        }
+
+
+feature_window = FeatureWindow(
+    hours=settings.FEATURE_WINDOW_HOURS,
+    max_users=settings.FEATURE_WINDOW_MAX_USERS,
+    # Only this worker ingests readings unless state is shared between workers
+    max_age=settings.FEATURE_WINDOW_MAX_AGE_SECONDS if state.shared else None,
+)
@@ -0,0 +1,302 @@
+import asyncio
+import os
+import time
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from bson import json_util
+from pymongo.errors import BulkWriteError
+from app import timeseries
+from app.config import settings
+from app.database import get_collection
+from app.services.rollup_service import RollupService
+import logging
+
+logger = logging.getLogger(__name__)
+
+DUPLICATE_KEY = 11000
+
+
+class IngestBuffer:
+    """Write-behind buffer for consumption documents
+
+    Documents are queued in memory and written by a single flusher task with
+    insert_many whenever a batch fills up or the flush interval elapses. The
+    queue is bounded, so producers wait (backpressure) once the memory budget
+    is used up instead of growing the backlog without limit. to_stored maps
+    each document to the form written, and after_write is awaited with the
+    (unmapped) documents of each batch that were written.
+
+    Readings are acknowledged (and billed) once queued, so they are never
+    dropped: a failed flush is retried with exponential backoff, and
+    documents that still cannot be written, or are left queued when drain
+    times out or the flusher dies, are appended to a dead-letter file in
+    their stored form, one MongoDB Extended JSON document per line. Load
+    those back with mongoimport and rebuild the rollups of their range.
+    A failing after_write is logged; it never stops the flusher.
+    """
+
+    def __init__(
+        self,
+        collection_name: str,
+        batch_size: int,
+        flush_interval: float,
+        max_pending: int,
+        retry_attempts: int = 0,
+        retry_backoff: float = 0.5,
+        dead_letter_dir: Optional[str] = None,
+        after_write: Optional[Callable[[List[Dict[str, Any]]], Awaitable[None]]] = None,
+        to_stored: Optional[Callable[[Dict[str, Any]], Dict[str, Any]]] = None,
+    ):
+        self.collection_name = collection_name
+        self.after_write = after_write
+        self.to_stored = to_stored
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.retry_attempts = retry_attempts
+        self.retry_backoff = retry_backoff
+        self.dead_letter_dir = dead_letter_dir
+        self._queue: Optional[asyncio.Queue] = None
+        self._flusher: Optional[asyncio.Task] = None
+        self._recovery: Optional[asyncio.Task] = None
+        self._unwritten: List[Dict[str, Any]] = []  # Of the batch being flushed
+        self.flushed = 0
+        self.failed = 0
+        self.retries = 0
+        self.dead_lettered = 0
+        self.after_write_errors = 0
+        self.flushes = 0
+
+    @property
+    def running(self) -> bool:
+        return self._flusher is not None and not self._flusher.done()
+
+    @property
+    def died(self) -> bool:
+        """The flusher stopped on an unexpected error"""
+        return (
+            self._flusher is not None
+            and self._flusher.done()
+            and not self._flusher.cancelled()
+            and self._flusher.exception() is not None
+        )
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_pending)
+        self._flusher = asyncio.create_task(self._run())
+        self._flusher.add_done_callback(self._on_flusher_done)
+        logger.info(
+            f"Ingest buffer started (batch {self.batch_size}, "
+            f"interval {self.flush_interval * 1000:.0f}ms, max {self.max_pending})"
+        )
+
+    async def put(self, document: Dict[str, Any]) -> None:
+        """Queue a document, waiting while the buffer is full"""
+        await self._queue.put(document)
+
+    async def put_many(self, documents: List[Dict[str, Any]]) -> None:
+        for document in documents:
+            await self._queue.put(document)
+
+    def _on_flusher_done(self, task: asyncio.Task) -> None:
+        if not self.died:
+            return
+        logger.critical(
+            f"Ingest buffer flusher died: {task.exception()!r}, "
+            f"dead-lettering {self.depth + len(self._unwritten)} documents"
+        )
+        # Producers stop queueing now that the buffer is not running
+        self._recovery = asyncio.create_task(self._dead_letter_pending())
+
+    async def _dead_letter_pending(self) -> None:
+        """Dead-letter the cut-off batch and everything still queued"""
+        remaining = self._unwritten
+        self._unwritten = []
+        while True:
+            while not self._queue.empty():
+                remaining.append(self._queue.get_nowait())
+                self._queue.task_done()
+            if not remaining:
+                break
+            await self.dead_letter(remaining)
+            remaining = []
+            # Producers that were waiting on a full queue get to put
+            await asyncio.sleep(0)
+
+    async def _run(self) -> None:
+        while True:
+            # Tracked from the start, so drain can dead-letter a batch it cuts off
+            batch = self._unwritten = [await self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            await self._flush(batch)
+
+    def _stored(self, documents: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        return [self.to_stored(doc) for doc in documents] if self.to_stored else documents
+
+    async def _write(
+        self, documents: List[Dict[str, Any]]
+    ) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """Insert documents; returns the written, retryable and rejected ones
+
+        A duplicate key means an earlier attempt already wrote the document
+        (documents carry their _id), so it counts as written.
+        """
+        try:
+            collection = get_collection(self.collection_name, "ingest")
+            await collection.insert_many(self._stored(documents), ordered=False)
+            return documents, [], []
+        except BulkWriteError as e:
+            codes = {error["index"]: error.get("code") for error in e.details.get("writeErrors", [])}
+            written = [
+                doc for index, doc in enumerate(documents)
+                if codes.get(index, DUPLICATE_KEY) == DUPLICATE_KEY
+            ]
+            rejected = [
+                doc for index, doc in enumerate(documents)
+                if codes.get(index, DUPLICATE_KEY) != DUPLICATE_KEY
+            ]
+            if rejected:
+                logger.error(
+                    f"Ingest buffer: {len(rejected)} of {len(documents)} documents rejected"
+                )
+            return written, [], rejected
+        except Exception as e:
+            logger.error(f"Ingest buffer flush of {len(documents)} documents failed: {str(e)}")
+            return [], documents, []
+
+    async def _flush(self, batch: List[Dict[str, Any]]) -> None:
+        written: List[Dict[str, Any]] = []
+        self._unwritten = batch
+        try:
+            for attempt in range(self.retry_attempts + 1):
+                if attempt:
+                    self.retries += 1
+                    await asyncio.sleep(self.retry_backoff * 2 ** (attempt - 1))
+                done, self._unwritten, rejected = await self._write(self._unwritten)
+                written += done
+                if rejected:
+                    await self.dead_letter(rejected)
+                if not self._unwritten:
+                    break
+            else:
+                await self.dead_letter(self._unwritten)
+                self._unwritten = []
+
+            self.flushed += len(written)
+            if self.after_write and written:
+                try:
+                    await self.after_write(written)
+                except Exception as e:
+                    # The documents are written; only what follows from them is missing
+                    self.after_write_errors += 1
+                    logger.error(
+                        f"Ingest buffer after_write failed for {len(written)} written "
+                        f"documents: {str(e)}"
+                    )
+        finally:
+            self.flushes += 1
+            for _ in batch:
+                self._queue.task_done()
+
+    @staticmethod
+    def _append(path: str, documents: List[Dict[str, Any]]) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "a", encoding="utf-8") as dead_letter_file:
+            dead_letter_file.write(
+                "".join(
+                    json_util.dumps(document, json_options=json_util.RELAXED_JSON_OPTIONS)
+                    + "\n"
+                    for document in documents
+                )
+            )
+
+    async def dead_letter(self, documents: List[Dict[str, Any]]) -> Optional[str]:
+        """Append documents that could not be written to a dead-letter file"""
+        if not documents:
+            return None
+        self.failed += len(documents)
+        if not self.dead_letter_dir:
+            logger.error(f"Ingest buffer dropped {len(documents)} documents (no dead-letter dir)")
+            return None
+        path = os.path.join(
+            self.dead_letter_dir,
+            f"{self.collection_name}-{datetime.utcnow():%Y%m%d}-{os.getpid()}.ndjson",
+        )
+        try:
+            # Off the event loop, the disk may be slow
+            await asyncio.to_thread(self._append, path, self._stored(documents))
+        except Exception as e:
+            logger.critical(
+                f"Ingest buffer lost {len(documents)} documents, dead-letter write failed: {str(e)}"
+            )
+            return None
+        self.dead_lettered += len(documents)
+        logger.error(f"Ingest buffer dead-lettered {len(documents)} documents to {path}")
+        return path
+
+    async def drain(self, timeout: Optional[float] = None) -> None:
+        """Flush everything still queued and stop the flusher
+
+        Whatever is not written by the timeout is dead-lettered rather than
+        dropped; a batch cut off mid-write may then be both written and in
+        the dead-letter file, which mongoimport skips by _id.
+        """
+        if self._flusher is None:
+            return
+        if self.running:
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout)
+            except asyncio.TimeoutError:
+                logger.error(f"Ingest buffer drain timed out with {self.depth} documents queued")
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+        elif self._recovery is not None:
+            await self._recovery
+        self._flusher = None
+        self._recovery = None
+        await self._dead_letter_pending()
+        logger.info(f"Ingest buffer drained ({self.flushed} written, {self.failed} failed)")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "died": self.died,
+            "depth": self.depth,
+            "max_pending": self.max_pending,
+            "flushed": self.flushed,
+            "failed": self.failed,
+            "retries": self.retries,
+            "dead_lettered": self.dead_lettered,
+            "after_write_errors": self.after_write_errors,
+            "flushes": self.flushes,
+        }
+
+
+consumption_buffer = IngestBuffer(
+    "consumptions",
+    batch_size=settings.INGEST_BATCH_SIZE,
+    flush_interval=settings.INGEST_FLUSH_INTERVAL_MS / 1000,
+    max_pending=settings.INGEST_MAX_PENDING,
+    retry_attempts=settings.INGEST_RETRY_ATTEMPTS,
+    retry_backoff=settings.INGEST_RETRY_BACKOFF_MS / 1000,
+    dead_letter_dir=settings.INGEST_DEAD_LETTER_DIR,
+    after_write=RollupService.apply,
+    to_stored=timeseries.to_stored,
+)
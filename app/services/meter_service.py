@@ -0,0 +1,97 @@
+from typing import Any, Dict, Iterable, NamedTuple, Optional
+from bson import ObjectId
+from app.cache import TTLCache
+from app.config import settings
+from app.database import get_collection
+from app.state import state
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Only the fields ingestion needs, so a lookup never builds a full User model
+METER_USER_PROJECTION = {"_id": 1, "selected_plan": 1, "save_mode": 1}
+
+# Stored for meters with no registered user, so unknown meters do not hit
+# the database on every reading either
+_UNREGISTERED = object()
+
+
+class MeterUser(NamedTuple):
+    id: ObjectId
+    selected_plan: str
+    save_mode: bool
+
+
+class MeterService:
+    _cache = TTLCache(settings.METER_CACHE_SIZE, settings.METER_CACHE_TTL_SECONDS)
+
+    @staticmethod
+    def _to_meter_user(user_data: Dict[str, Any]) -> MeterUser:
+        return MeterUser(
+            id=user_data["_id"],
+            selected_plan=user_data.get("selected_plan", "basic"),
+            save_mode=user_data.get("save_mode", False),
+        )
+
+    @staticmethod
+    def _remember(meter_id: str, meter_user: Optional[MeterUser]) -> None:
+        if meter_user is None:
+            MeterService._cache.set(
+                meter_id,
+                _UNREGISTERED,
+                ttl=settings.METER_CACHE_NEGATIVE_TTL_SECONDS,
+            )
+        else:
+            MeterService._cache.set(meter_id, meter_user)
+
+    @staticmethod
+    async def resolve(meter_id: str) -> Optional[MeterUser]:
+        """Resolve the user a meter belongs to, None if it is not registered"""
+        cached = MeterService._cache.get(meter_id)
+        if cached is not None:
+            return None if cached is _UNREGISTERED else cached
+
+        users_collection = get_collection("users")
+        user_data = await users_collection.find_one(
+            {"meter_id": meter_id}, METER_USER_PROJECTION
+        )
+        meter_user = MeterService._to_meter_user(user_data) if user_data else None
+        MeterService._remember(meter_id, meter_user)
+        return meter_user
+
+    @staticmethod
+    async def resolve_many(meter_ids: Iterable[str]) -> Dict[str, MeterUser]:
+        """Resolve several meters, querying only the ones not in the cache"""
+        resolved: Dict[str, MeterUser] = {}
+        missing = []
+        for meter_id in set(meter_ids):
+            cached = MeterService._cache.get(meter_id)
+            if cached is None:
+                missing.append(meter_id)
+            elif cached is not _UNREGISTERED:
+                resolved[meter_id] = cached
+
+        if missing:
+            users_collection = get_collection("users")
+            projection = dict(METER_USER_PROJECTION, meter_id=1)
+            async for user_data in users_collection.find(
+                {"meter_id": {"$in": missing}}, projection
+            ):
+                resolved[user_data["meter_id"]] = MeterService._to_meter_user(user_data)
+
+            for meter_id in missing:
+                MeterService._remember(meter_id, resolved.get(meter_id))
+
+        return resolved
+
+    @staticmethod
+    def invalidate(meter_id: str) -> None:
+        """Drop a meter from the cache after the user behind it changed"""
+        state.invalidate("meter", meter_id)
+
+    @staticmethod
+    def cache_stats() -> Dict[str, Any]:
+        return MeterService._cache.stats()
+
+
+state.register_cache("meter", MeterService._cache)
@@ -0,0 +1,166 @@
+import asyncio
+import time
+from typing import Any, Dict, List, Optional, Set
+from app.config import settings
+from app.models import PyObjectId
+from app.services.ai_service import AIService
+from app.state import state
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class PredictionScheduler:
+    """Coalesces prediction requests per user and bounds AI concurrency
+
+    The first request for a user is queued and runs once the coalescing
+    window has passed; requests for the same user in the meantime are folded
+    into it. Users that are due together are sent to the AI service in
+    batches of up to batch_size. At most max_concurrency requests are in
+    flight, and when the bounded queue is full new users are dropped and
+    counted as overflow. With several workers, a user is claimed through the
+    shared state before predicting, so only one worker predicts it per window.
+    """
+
+    def __init__(
+        self, window: float, max_concurrency: int, max_queue: int, batch_size: int
+    ):
+        self.window = window
+        self.batch_size = batch_size
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self._pending: Dict[PyObjectId, float] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        # Strong references, the event loop only keeps weak ones to tasks
+        self._tasks: Set[asyncio.Task] = set()
+        self.scheduled = 0
+        self.coalesced = 0
+        self.overflow = 0
+        self.completed = 0
+        self.failed = 0
+
+    @property
+    def running(self) -> bool:
+        return self._dispatcher is not None and not self._dispatcher.done()
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._pending.clear()
+        self._dispatcher = asyncio.create_task(self._dispatch())
+
+    def schedule(self, user_id: PyObjectId) -> bool:
+        """Request a prediction for a user; returns False if coalesced or dropped"""
+        if not self.running:
+            self.start()
+
+        if user_id in self._pending:
+            self.coalesced += 1
+            return False
+
+        try:
+            self._queue.put_nowait(user_id)
+        except asyncio.QueueFull:
+            self.overflow += 1
+            if self.overflow % 100 == 1:
+                logger.warning(
+                    f"Prediction queue full ({self.max_queue}), "
+                    f"{self.overflow} requests dropped so far"
+                )
+            return False
+
+        self._pending[user_id] = time.monotonic() + self.window
+        self.scheduled += 1
+        return True
+
+    async def _dispatch(self) -> None:
+        carry = None
+        while True:
+            user_id = carry if carry is not None else await self._queue.get()
+            carry = None
+            delay = self._pending.get(user_id, 0) - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            # Users are queued in due order, so take the ones already due
+            batch = [user_id]
+            while len(batch) < self.batch_size and not self._queue.empty():
+                next_user = self._queue.get_nowait()
+                if self._pending.get(next_user, 0) > time.monotonic():
+                    carry = next_user
+                    break
+                batch.append(next_user)
+
+            await self._semaphore.acquire()
+            # Readings that arrive from now on schedule a fresh prediction
+            for user_id in batch:
+                self._pending.pop(user_id, None)
+            task = asyncio.create_task(self._predict(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _predict(self, user_ids: List[PyObjectId]) -> None:
+        try:
+            if state.shared:
+                claims = await asyncio.gather(
+                    *(state.claim(f"prediction:{user_id}", self.window) for user_id in user_ids)
+                )
+                self.coalesced += claims.count(False)
+                user_ids = [user_id for user_id, claimed in zip(user_ids, claims) if claimed]
+                if not user_ids:
+                    return
+            if len(user_ids) == 1:
+                prediction = await AIService.fetch_ai_prediction(user_ids[0])
+                predictions = [prediction] if prediction else []
+            else:
+                predictions = await AIService.fetch_ai_predictions(user_ids)
+            self.completed += len(predictions)
+            self.failed += len(user_ids) - len(predictions)
+        except Exception as e:
+            self.failed += len(user_ids)
+            logger.error(f"Scheduled predictions failed for {len(user_ids)} users: {str(e)}")
+        finally:
+            self._semaphore.release()
+
+    async def stop(self, timeout: Optional[float] = None) -> None:
+        """Stop dispatching and wait for predictions already in flight"""
+        if self._dispatcher:
+            self._dispatcher.cancel()
+            try:
+                await self._dispatcher
+            except asyncio.CancelledError:
+                pass
+            self._dispatcher = None
+
+        if self._tasks:
+            done, pending = await asyncio.wait(set(self._tasks), timeout=timeout)
+            for task in pending:
+                task.cancel()
+        self._pending.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "queued": self._queue.qsize() if self._queue else 0,
+            "max_queue": self.max_queue,
+            "in_flight": len(self._tasks),
+            "max_concurrency": self.max_concurrency,
+            "batch_size": self.batch_size,
+            "scheduled": self.scheduled,
+            "coalesced": self.coalesced,
+            "overflow": self.overflow,
+            "completed": self.completed,
+            "failed": self.failed,
+        }
+
+
+prediction_scheduler = PredictionScheduler(
+    window=settings.PREDICTION_COALESCE_SECONDS,
+    max_concurrency=settings.PREDICTION_MAX_CONCURRENCY,
+    max_queue=settings.PREDICTION_QUEUE_SIZE,
+    batch_size=settings.PREDICTION_BATCH_SIZE,
+)
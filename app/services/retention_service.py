@@ -0,0 +1,167 @@
+import gzip
+import os
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+from bson import json_util
+from app import timeseries
+from app.config import settings
+from app.database import get_collection
+from app.indexes import RETENTION_DAYS
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class RetentionService:
+    """Archives documents of the retained collections before they expire
+
+    Archives are gzip-compressed files with one MongoDB Extended JSON
+    document per line (ObjectIds and dates keep their types, so they can be
+    loaded back with mongoimport); consumptions are archived flat whatever
+    their storage layout. Each run is recorded in the `archives`
+    collection, and the next run of a collection starts where the last one
+    ended. File writes are blocking, so this is meant for the CLI.
+    """
+
+    @staticmethod
+    def horizon(collection_name: str) -> Optional[datetime]:
+        """Timestamp before which documents expire; None when kept forever"""
+        days = RETENTION_DAYS.get(collection_name, 0)
+        if days <= 0:
+            return None
+        return datetime.utcnow() - timedelta(days=days)
+
+    @staticmethod
+    async def last_archived(collection_name: str) -> Optional[datetime]:
+        """End of the latest archive of a collection"""
+        archive = await get_collection("archives").find_one(
+            {"collection": collection_name}, sort=[("before", -1)]
+        )
+        return archive["before"] if archive else None
+
+    @staticmethod
+    async def archive_lag(collection_name: str) -> Optional[Dict[str, Any]]:
+        """How far expiry has run past the last archive; None when kept forever
+
+        lag_seconds > 0 means documents have expired without being archived.
+        """
+        horizon = RetentionService.horizon(collection_name)
+        if horizon is None:
+            return None
+        archived_until = await RetentionService.last_archived(collection_name)
+        lag = horizon - archived_until if archived_until else None
+        return {
+            "horizon": horizon.isoformat() + "Z",
+            "archived_until": archived_until.isoformat() + "Z" if archived_until else None,
+            "lag_seconds": round(lag.total_seconds()) if lag is not None else None,
+        }
+
+    @staticmethod
+    async def archive(
+        collection_name: str,
+        before: Optional[datetime] = None,
+        since: Optional[datetime] = None,
+        directory: Optional[str] = None,
+        delete: bool = False,
+    ) -> Dict[str, Any]:
+        """Write documents with since <= timestamp < before to an archive file
+
+        `before` defaults to ARCHIVE_AHEAD_DAYS past the retention horizon,
+        so a daily run archives everything before it expires, and `since`
+        to the end of the previous archive. With `delete`, each batch is
+        removed once it is synced to the file; if the run fails, the
+        deleted documents are kept in the .partial file.
+        """
+        if collection_name not in RETENTION_DAYS:
+            raise ValueError(f"{collection_name} is not a retained collection")
+        if before is None:
+            horizon = RetentionService.horizon(collection_name)
+            if horizon is None:
+                raise ValueError(
+                    f"{collection_name} is kept forever, give the end of the range"
+                )
+            before = horizon + timedelta(days=settings.ARCHIVE_AHEAD_DAYS)
+        if since is None:
+            since = await RetentionService.last_archived(collection_name)
+        if since is not None and since >= before:
+            return {"collection": collection_name, "file": None, "documents": 0, "deleted": 0}
+
+        query: Dict[str, Any] = {"timestamp": {"$lt": before}}
+        if since is not None:
+            query["timestamp"]["$gte"] = since
+
+        directory = directory or settings.ARCHIVE_DIR
+        os.makedirs(directory, exist_ok=True)
+        start_label = f"{since:%Y%m%dT%H%M%S}" if since else "start"
+        path = os.path.join(
+            directory, f"{collection_name}-{start_label}-{before:%Y%m%dT%H%M%S}.ndjson.gz"
+        )
+        partial_path = f"{path}.partial"
+
+        collection = get_collection(collection_name, "analytics")
+        cursor = collection.find(query).sort("timestamp", 1).batch_size(
+            settings.EXPORT_BATCH_SIZE
+        )
+        documents = 0
+        deleted = 0
+        try:
+            with open(partial_path, "wb") as raw_file, gzip.open(
+                raw_file, "wt", encoding="utf-8"
+            ) as archive_file:
+                while True:
+                    batch = await cursor.to_list(length=settings.EXPORT_BATCH_SIZE)
+                    if not batch:
+                        break
+                    archive_file.write(
+                        "".join(
+                            json_util.dumps(
+                                timeseries.from_stored(document),
+                                json_options=json_util.RELAXED_JSON_OPTIONS,
+                            )
+                            + "\n"
+                            for document in batch
+                        )
+                    )
+                    documents += len(batch)
+                    if delete:
+                        archive_file.flush()
+                        os.fsync(raw_file.fileno())
+                        # By _id, so documents written to the range meanwhile are not lost
+                        result = await get_collection(collection_name).delete_many(
+                            {"_id": {"$in": [document["_id"] for document in batch]}}
+                        )
+                        deleted += result.deleted_count
+        except Exception:
+            if deleted:
+                logger.error(
+                    f"Archive of {collection_name} failed after deleting {deleted} "
+                    f"documents, they are kept in {partial_path}"
+                )
+            raise
+        finally:
+            await cursor.close()
+        if documents:
+            os.replace(partial_path, path)
+        else:
+            # Still recorded: the range is covered, and the archive lag is current
+            os.remove(partial_path)
+            path = None
+
+        await get_collection("archives").insert_one(
+            {
+                "collection": collection_name,
+                "since": since,
+                "before": before,
+                "file": path,
+                "documents": documents,
+                "created_at": datetime.utcnow(),
+            }
+        )
+
+        logger.info(f"Archived {documents} {collection_name} documents to {path or 'no file'}")
+        return {
+            "collection": collection_name,
+            "file": path,
+            "documents": documents,
+            "deleted": deleted,
+        }
@@ -0,0 +1,219 @@
+import asyncio
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from pymongo import UpdateOne
+from app import timeseries
+from app.database import get_collection
+from app.indexes import RETENTION_DAYS
+from app.models import PyObjectId
+from app.utils import to_naive_utc
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _hour_start(timestamp: datetime) -> datetime:
+    return datetime(timestamp.year, timestamp.month, timestamp.day, timestamp.hour)
+
+
+def _day_start(timestamp: datetime) -> datetime:
+    return datetime(timestamp.year, timestamp.month, timestamp.day)
+
+
+def _month_start(timestamp: datetime) -> datetime:
+    return datetime(timestamp.year, timestamp.month, 1)
+
+
+# Rollup collection -> (period start in Python, period start as an
+# aggregation expression over $timestamp)
+ROLLUPS: Dict[str, Tuple[Callable[[datetime], datetime], Dict[str, Any]]] = {
+    "consumption_hourly": (
+        _hour_start,
+        {
+            "year": {"$year": "$timestamp"},
+            "month": {"$month": "$timestamp"},
+            "day": {"$dayOfMonth": "$timestamp"},
+            "hour": {"$hour": "$timestamp"},
+        },
+    ),
+    "consumption_daily": (
+        _day_start,
+        {
+            "year": {"$year": "$timestamp"},
+            "month": {"$month": "$timestamp"},
+            "day": {"$dayOfMonth": "$timestamp"},
+        },
+    ),
+    "consumption_monthly": (
+        _month_start,
+        {
+            "year": {"$year": "$timestamp"},
+            "month": {"$month": "$timestamp"},
+        },
+    ),
+}
+
+
+class RollupService:
+    """Hourly, daily and monthly consumption totals maintained on ingest
+
+    Each rollup document holds, for one user and period, the kWh total, the
+    sum and count of power readings (for the average) and the first reading
+    time, so dashboard queries read a handful of documents instead of
+    aggregating every raw reading in the range.
+    """
+
+    @staticmethod
+    async def apply(documents: List[Dict[str, Any]]) -> None:
+        """Add stored consumption documents to every rollup collection"""
+        if not documents:
+            return
+        await asyncio.gather(
+            *(
+                RollupService._apply_to(collection_name, period_start, documents)
+                for collection_name, (period_start, _) in ROLLUPS.items()
+            )
+        )
+
+    @staticmethod
+    async def _apply_to(
+        collection_name: str,
+        period_start: Callable[[datetime], datetime],
+        documents: List[Dict[str, Any]],
+    ) -> None:
+        # Combine readings of the same user and period before writing
+        totals: Dict[Tuple[PyObjectId, datetime], Dict[str, Any]] = {}
+        for doc in documents:
+            # Periods are UTC, as MongoDB stores timestamps and rebuild() groups them
+            timestamp = to_naive_utc(doc["timestamp"])
+            key = (doc["user_id"], period_start(timestamp))
+            total = totals.get(key)
+            if total is None:
+                total = totals[key] = {
+                    "kwh": 0.0,
+                    "watt_sum": 0.0,
+                    "count": 0,
+                    "first_timestamp": timestamp,
+                }
+            total["kwh"] += doc["power_usage_kwh"]
+            total["watt_sum"] += doc["total_power_watt"]
+            total["count"] += 1
+            total["first_timestamp"] = min(total["first_timestamp"], timestamp)
+
+        operations = [
+            UpdateOne(
+                {"user_id": user_id, "period_start": start},
+                {
+                    "$inc": {
+                        "kwh": total["kwh"],
+                        "watt_sum": total["watt_sum"],
+                        "count": total["count"],
+                    },
+                    "$min": {"first_timestamp": total["first_timestamp"]},
+                },
+                upsert=True,
+            )
+            for (user_id, start), total in totals.items()
+        ]
+
+        try:
+            await get_collection(collection_name, "ingest").bulk_write(operations, ordered=False)
+        except Exception as e:
+            logger.error(f"Failed to update {collection_name}: {str(e)}")
+
+    @staticmethod
+    async def get_rollups(
+        collection_name: str, user_id: PyObjectId, start: datetime, end: datetime
+    ) -> List[Dict[str, Any]]:
+        """Rollup documents of a user with start <= period_start < end"""
+        cursor = get_collection(collection_name, "analytics").find(
+            {"user_id": user_id, "period_start": {"$gte": start, "$lt": end}},
+            {
+                "_id": 0,
+                "period_start": 1,
+                "kwh": 1,
+                "watt_sum": 1,
+                "count": 1,
+                "first_timestamp": 1,
+            },
+        ).sort("period_start", 1)
+        return await cursor.to_list(length=None)
+
+    @staticmethod
+    async def rebuild(
+        since: Optional[datetime] = None, user_id: Optional[PyObjectId] = None
+    ) -> Dict[str, int]:
+        """Rebuild the rollups from raw consumptions
+
+        `since` is moved back to the start of its month so monthly totals stay
+        complete. When raw consumptions expire, it is moved forward to the
+        first month whose readings are all still there, so rollups are never
+        rebuilt from partial data. Readings ingested while the rebuild runs
+        may be counted twice or missed, so run it while ingestion is quiet.
+        """
+        if RETENTION_DAYS["consumptions"] > 0:
+            expired_until = datetime.utcnow() - timedelta(days=RETENTION_DAYS["consumptions"])
+            complete_from = _month_start(_month_start(expired_until) + timedelta(days=32))
+            if since is None or since < complete_from:
+                logger.warning(
+                    f"Raw consumptions before {expired_until:%Y-%m-%d} have expired, "
+                    f"rebuilding rollups from {complete_from:%Y-%m-%d} only"
+                )
+                since = complete_from
+
+        match: Dict[str, Any] = {}
+        if since is not None:
+            since = _month_start(since)
+            match["timestamp"] = {"$gte": since}
+        if user_id is not None:
+            match["user_id"] = user_id
+
+        rebuilt = {}
+        for collection_name, (_, period_parts) in ROLLUPS.items():
+            collection = get_collection(collection_name)
+            clear: Dict[str, Any] = {}
+            if since is not None:
+                clear["period_start"] = {"$gte": since}
+            if user_id is not None:
+                clear["user_id"] = user_id
+            await collection.delete_many(clear)
+
+            pipeline = [
+                {"$match": timeseries.stored_query(match)},
+                {
+                    "$group": {
+                        "_id": {
+                            "user_id": timeseries.ref("user_id"),
+                            "period_start": {"$dateFromParts": period_parts},
+                        },
+                        "kwh": {"$sum": "$power_usage_kwh"},
+                        "watt_sum": {"$sum": "$total_power_watt"},
+                        "count": {"$sum": 1},
+                        "first_timestamp": {"$min": "$timestamp"},
+                    }
+                },
+                {
+                    "$project": {
+                        "_id": 0,
+                        "user_id": "$_id.user_id",
+                        "period_start": "$_id.period_start",
+                        "kwh": 1,
+                        "watt_sum": 1,
+                        "count": 1,
+                        "first_timestamp": 1,
+                    }
+                },
+                {
+                    "$merge": {
+                        "into": collection_name,
+                        "on": ["user_id", "period_start"],
+                        "whenMatched": "replace",
+                        "whenNotMatched": "insert",
+                    }
+                },
+            ]
+            await get_collection("consumptions").aggregate(pipeline).to_list(length=None)
+            rebuilt[collection_name] = await collection.count_documents(clear)
+            logger.info(f"Rebuilt {rebuilt[collection_name]} documents in {collection_name}")
+
+        return rebuilt
@@ -1,8 +1,11 @@
 from typing import Optional, Dict, Any
 from datetime import datetime
+from pymongo import ReturnDocument
 from app.database import get_collection
 from app.models import User, PyObjectId, SaveModeCommand
 from app.utils import log_energy_event
+from app.auth import invalidate_principal
+from app.services.meter_service import MeterService
 import logging
 from typing import List
 
@@ -14,16 +17,19 @@ class SaveModeService:
     async def enable_save_mode(user_id: PyObjectId, reason: str) -> bool:
         """Enable save mode for user"""
         users_collection = get_collection("users")
-        result = await users_collection.update_one(
+        user_data = await users_collection.find_one_and_update(
             {"_id": user_id},
             {"$set": {
                 "save_mode": True,
                 "save_mode_reason": reason,
                 "save_mode_activated_at": datetime.utcnow()
-            }}
+            }},
+            projection={"meter_id": 1}
         )
         
-        if result.modified_count > 0:
+        if user_data:
+            MeterService.invalidate(user_data["meter_id"])
+            invalidate_principal(user_id)
             log_energy_event(str(user_id), "SAVE_MODE_ENABLED", f"Reason: {reason}")
             logger.info(f"Save mode enabled for user {user_id}, reason: {reason}")
             return True
@@ -33,15 +39,23 @@ class SaveModeService:
     async def disable_save_mode(user_id: PyObjectId) -> bool:
         """Disable save mode for user"""
         users_collection = get_collection("users")
-        result = await users_collection.update_one(
+        # The document before the update tells whether anything changed
+        user_data = await users_collection.find_one_and_update(
             {"_id": user_id},
             {"$set": {
                 "save_mode": False,
                 "save_mode_reason": None
-            }}
+            }},
+            projection={"meter_id": 1, "save_mode": 1, "save_mode_reason": 1},
+            return_document=ReturnDocument.BEFORE
         )
         
-        if result.modified_count > 0:
+        changed = user_data is not None and (
+            user_data.get("save_mode") or user_data.get("save_mode_reason") is not None
+        )
+        if changed:
+            MeterService.invalidate(user_data["meter_id"])
+            invalidate_principal(user_id)
             log_energy_event(str(user_id), "SAVE_MODE_DISABLED", "Manual disable")
             logger.info(f"Save mode disabled for user {user_id}")
             return True
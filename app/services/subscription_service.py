@@ -1,14 +1,36 @@
-from typing import Optional, List
+import asyncio
+from typing import Any, Optional, List, Dict
 from datetime import datetime, timedelta
+from bson import ObjectId
+from pymongo import ReturnDocument
+from app.cache import TTLCache
+from app.config import settings
 from app.database import get_collection
-from app.models import Subscription, PyObjectId, Plan, PlanResponse
+from app.state import state
+from app.models import (
+    Subscription,
+    PyObjectId,
+    Plan,
+    PlanResponse,
+    EnergyDeduction,
+    BatchDeduction,
+)
 from app.utils import calculate_percentage_remaining, log_energy_event
+from app.services.alert_service import AlertService
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Deductions of one batch in flight at once
+DEDUCTION_CONCURRENCY = 32
+
 
 class SubscriptionService:
+    # Active subscription document per user, kept current by deductions
+    _active_cache = TTLCache(
+        settings.SUBSCRIPTION_CACHE_SIZE, settings.SUBSCRIPTION_CACHE_TTL_SECONDS
+    )
+
     @staticmethod
     def get_available_plans() -> List[PlanResponse]:
         """Get available subscription plans"""
@@ -62,7 +84,7 @@ class SubscriptionService:
         if not selected_plan:
             return False
 
-        subscriptions_collection = get_collection("subscriptions")
+        subscriptions_collection = get_collection("subscriptions", "billing")
 
         # حساب تاريخ الانتهاء بناءً على مدة الباقة
         start_date = datetime.utcnow()
@@ -83,6 +105,7 @@ class SubscriptionService:
         result = await subscriptions_collection.insert_one(
             subscription.dict(by_alias=True)
         )
+        SubscriptionService.invalidate_active(user_id)
         return result.acknowledged
 
     @staticmethod
@@ -96,7 +119,7 @@ class SubscriptionService:
         if not new_plan:
             return False
 
-        subscriptions_collection = get_collection("subscriptions")
+        subscriptions_collection = get_collection("subscriptions", "billing")
 
         # إلغاء تفعيل الباقة الحالية
         await subscriptions_collection.update_many(
@@ -122,6 +145,7 @@ class SubscriptionService:
         result = await subscriptions_collection.insert_one(
             new_subscription.dict(by_alias=True)
         )
+        SubscriptionService.invalidate_active(user_id)
 
         if result.acknowledged:
             log_energy_event(
@@ -132,11 +156,32 @@ class SubscriptionService:
             return True
         return False
 
-    # ⬅️ الطرق الحالية تبقى كما هي مع تعديلات بسيطة
     @staticmethod
-    async def get_active_subscription(user_id: PyObjectId) -> Optional[Subscription]:
-        """Get user's active subscription"""
-        subscriptions_collection = get_collection("subscriptions")
+    def _cache_active(user_id: PyObjectId, subscription_data: Dict[str, Any]) -> None:
+        """Cache an active subscription document until its end date at the latest"""
+        ttl = min(
+            settings.SUBSCRIPTION_CACHE_TTL_SECONDS,
+            (subscription_data["end_date"] - datetime.utcnow()).total_seconds(),
+        )
+        if ttl > 0:
+            SubscriptionService._active_cache.set(user_id, subscription_data, ttl=ttl)
+
+    @staticmethod
+    def invalidate_active(user_id: PyObjectId) -> None:
+        state.invalidate("subscription", user_id)
+
+    @staticmethod
+    def cache_stats() -> Dict[str, Any]:
+        return SubscriptionService._active_cache.stats()
+
+    @staticmethod
+    async def _load_active(user_id: PyObjectId) -> Optional[Dict[str, Any]]:
+        """Active subscription document, read through the per-user cache"""
+        subscription_data = SubscriptionService._active_cache.get(user_id)
+        if subscription_data is not None:
+            return subscription_data
+
+        subscriptions_collection = get_collection("subscriptions", "billing")
         subscription_data = await subscriptions_collection.find_one(
             {
                 "user_id": user_id,
@@ -144,59 +189,250 @@ class SubscriptionService:
                 "end_date": {"$gte": datetime.utcnow()},
             }
         )
+        if subscription_data:
+            SubscriptionService._cache_active(user_id, subscription_data)
+        return subscription_data
+
+    # ⬅️ الطرق الحالية تبقى كما هي مع تعديلات بسيطة
+    @staticmethod
+    async def get_active_subscription(user_id: PyObjectId) -> Optional[Subscription]:
+        """Get user's active subscription"""
+        subscription_data = await SubscriptionService._load_active(user_id)
 
         if subscription_data:
             return Subscription(**subscription_data)
         return None
 
     @staticmethod
-    async def deduct_energy(user_id: PyObjectId, kwh_used: float) -> bool:
-        """Deduct energy consumption from subscription"""
-        subscription = await SubscriptionService.get_active_subscription(user_id)
-        if not subscription:
-            logger.warning(f"No active subscription found for user {user_id}")
-            return False
+    def _deduction_pipeline(kwh_used: float) -> List[Dict[str, Any]]:
+        """Update pipeline that deducts energy and claims crossed alert thresholds
 
-        if subscription.remaining_kwh < kwh_used:
-            logger.warning(f"Insufficient energy for user {user_id}")
-            return False
+        Thresholds crossed by the new balance that the subscription has not
+        alerted on yet are stored in last_triggered_alerts and added to
+        alerts_triggered in the same atomic update, so exactly one deduction
+        claims each threshold, across processes and restarts. A new
+        subscription starts with an empty alerts_triggered.
+        """
+        remaining = {"$subtract": ["$remaining_kwh", kwh_used]}
+        # 0% without a positive total, as calculate_percentage_remaining
+        percentage = {
+            "$cond": [
+                {"$gt": ["$total_kwh", 0]},
+                {"$multiply": [{"$divide": [remaining, "$total_kwh"]}, 100]},
+                0,
+            ]
+        }
+        crossed = {
+            "$concatArrays": [
+                {"$cond": [{"$lte": [percentage, threshold]}, [alert_type], []]}
+                for threshold, alert_type, _ in AlertService.get_thresholds()
+            ]
+        }
+        triggered = {"$ifNull": ["$alerts_triggered", []]}
+        return [
+            {
+                "$set": {
+                    "remaining_kwh": remaining,
+                    "last_triggered_alerts": {"$setDifference": [crossed, triggered]},
+                }
+            },
+            {
+                "$set": {
+                    "alerts_triggered": {
+                        "$setUnion": [triggered, "$last_triggered_alerts"]
+                    }
+                }
+            },
+        ]
 
-        subscriptions_collection = get_collection("subscriptions")
-        result = await subscriptions_collection.update_one(
-            {"_id": subscription.id}, {"$inc": {"remaining_kwh": -kwh_used}}
+    @staticmethod
+    def _to_deduction(subscription_data: Dict[str, Any]) -> EnergyDeduction:
+        return EnergyDeduction(
+            remaining_kwh=subscription_data["remaining_kwh"],
+            percentage=calculate_percentage_remaining(
+                subscription_data["remaining_kwh"], subscription_data["total_kwh"]
+            ),
+            triggered_alerts=subscription_data.get("last_triggered_alerts", []),
         )
 
-        if result.modified_count > 0:
-            new_remaining = subscription.remaining_kwh - kwh_used
-            percentage = calculate_percentage_remaining(
-                new_remaining, subscription.total_kwh
-            )
+    @staticmethod
+    async def _apply_deduction(
+        user_id: PyObjectId, kwh_used: float, now: datetime
+    ) -> Optional[Dict[str, Any]]:
+        """Deduct from the active subscription, returning it as updated"""
+        subscriptions_collection = get_collection("subscriptions", "billing")
+        return await subscriptions_collection.find_one_and_update(
+            {
+                "user_id": user_id,
+                "status": "active",
+                "end_date": {"$gte": now},
+                "remaining_kwh": {"$gte": kwh_used},
+            },
+            SubscriptionService._deduction_pipeline(kwh_used),
+            return_document=ReturnDocument.AFTER,
+        )
 
-            log_energy_event(
-                str(user_id),
-                "ENERGY_DEDUCTED",
-                f"Deducted {kwh_used}kWh, remaining: {new_remaining}kWh ({percentage:.1f}%)",
+    @staticmethod
+    async def deduct_energy(
+        user_id: PyObjectId, kwh_used: float
+    ) -> Optional[EnergyDeduction]:
+        """Deduct energy consumption from subscription
+
+        The balance check, the decrement and the alert threshold bookkeeping
+        happen in a single conditional update, so concurrent readings for the
+        same user can never overdraw the subscription or alert twice. Returns
+        the new balance with the newly crossed thresholds, or None when there
+        is no active subscription with enough energy left.
+        """
+        subscription_data = await SubscriptionService._apply_deduction(
+            user_id, kwh_used, datetime.utcnow()
+        )
+
+        if not subscription_data:
+            SubscriptionService.invalidate_active(user_id)
+            logger.warning(
+                f"No active subscription with {kwh_used}kWh remaining for user {user_id}"
             )
+            return None
 
-            return True
+        # The updated document keeps the cached subscription current
+        SubscriptionService._cache_active(user_id, subscription_data)
 
-        return False
+        deduction = SubscriptionService._to_deduction(subscription_data)
+
+        log_energy_event(
+            str(user_id),
+            "ENERGY_DEDUCTED",
+            f"Deducted {kwh_used}kWh, remaining: {deduction.remaining_kwh}kWh "
+            f"({deduction.percentage:.1f}%)",
+        )
+
+        return deduction
+
+    @staticmethod
+    async def claim_threshold_alerts(user_id: PyObjectId) -> Optional[EnergyDeduction]:
+        """Claim thresholds already crossed by the current balance, deducting nothing
+
+        Used when a deduction could not be applied, so a subscription that is
+        too low to cover a reading still gets its alerts. Returns None when
+        the user has no active subscription.
+        """
+        subscriptions_collection = get_collection("subscriptions", "billing")
+        subscription_data = await subscriptions_collection.find_one_and_update(
+            {
+                "user_id": user_id,
+                "status": "active",
+                "end_date": {"$gte": datetime.utcnow()},
+            },
+            SubscriptionService._deduction_pipeline(0),
+            return_document=ReturnDocument.AFTER,
+        )
+
+        if not subscription_data:
+            return None
+
+        SubscriptionService._cache_active(user_id, subscription_data)
+        return SubscriptionService._to_deduction(subscription_data)
+
+    @staticmethod
+    async def deduct_energy_many(
+        usage: Dict[PyObjectId, List[float]]
+    ) -> Dict[PyObjectId, Optional[BatchDeduction]]:
+        """Deduct the readings of several users, one combined deduction per user
+
+        Each user's deduction is its own find_one_and_update returning the
+        updated subscription, run concurrently, so every result (and the
+        thresholds it claimed) belongs to exactly that deduction whatever
+        other writers do meanwhile. When the balance cannot cover a user's
+        combined usage, the readings are deducted one by one instead, so the
+        ones that still fit are billed as they would be when sent singly.
+        Returns, per user, the new balance with every newly crossed threshold
+        and which readings were billed, or None when none could be.
+        """
+        results: Dict[PyObjectId, Optional[BatchDeduction]] = {
+            user_id: None for user_id in usage
+        }
+        if not usage:
+            return results
+
+        now = datetime.utcnow()
+        semaphore = asyncio.Semaphore(DEDUCTION_CONCURRENCY)
+
+        async def deduct(user_id: PyObjectId, readings: List[float]) -> None:
+            async with semaphore:
+                subscription_data = await SubscriptionService._apply_deduction(
+                    user_id, sum(readings), now
+                )
+                billed = [subscription_data is not None] * len(readings)
+                triggered = (subscription_data or {}).get("last_triggered_alerts", [])
+                if subscription_data is None and len(readings) > 1:
+                    # The balance only shrinks meanwhile, so a reading at
+                    # least as large as a refused one is refused too
+                    refused = float("inf")
+                    for position, kwh_used in enumerate(readings):
+                        if kwh_used >= refused:
+                            continue
+                        applied = await SubscriptionService._apply_deduction(
+                            user_id, kwh_used, now
+                        )
+                        if applied is None:
+                            refused = kwh_used
+                            continue
+                        subscription_data = applied
+                        billed[position] = True
+                        triggered += applied.get("last_triggered_alerts", [])
+            if subscription_data:
+                SubscriptionService._cache_active(user_id, subscription_data)
+                deduction = SubscriptionService._to_deduction(subscription_data)
+                results[user_id] = BatchDeduction(
+                    remaining_kwh=deduction.remaining_kwh,
+                    percentage=deduction.percentage,
+                    triggered_alerts=triggered,
+                    billed=billed,
+                )
+
+        await asyncio.gather(
+            *(deduct(user_id, readings) for user_id, readings in usage.items())
+        )
+
+        applied = 0
+        for user_id, deduction in results.items():
+            if deduction is None:
+                SubscriptionService.invalidate_active(user_id)
+                logger.warning(
+                    f"No active subscription with {min(usage[user_id])}kWh remaining "
+                    f"for user {user_id}"
+                )
+                continue
+            applied += 1
+            if not all(deduction.billed):
+                logger.warning(
+                    f"Billed {sum(deduction.billed)} of {len(deduction.billed)} readings "
+                    f"for user {user_id}, balance too low for the rest"
+                )
+
+        log_energy_event(
+            "batch",
+            "ENERGY_DEDUCTED",
+            f"Deducted energy for {applied} of {len(usage)} users",
+        )
+        return results
 
     @staticmethod
     async def get_subscription_percentage(user_id: PyObjectId) -> Optional[float]:
         """Get percentage of remaining energy"""
-        subscription = await SubscriptionService.get_active_subscription(user_id)
-        if not subscription:
+        subscription_data = await SubscriptionService._load_active(user_id)
+        if not subscription_data:
             return None
 
         return calculate_percentage_remaining(
-            subscription.remaining_kwh, subscription.total_kwh
+            subscription_data["remaining_kwh"], subscription_data["total_kwh"]
         )
 
     @staticmethod
     async def get_user_subscriptions(user_id: PyObjectId) -> List[Subscription]:
         """Get all user subscriptions"""
-        subscriptions_collection = get_collection("subscriptions")
+        subscriptions_collection = get_collection("subscriptions", "billing")
         cursor = subscriptions_collection.find({"user_id": user_id}).sort(
             "start_date", -1
         )
@@ -208,8 +444,14 @@ class SubscriptionService:
     @staticmethod
     async def create_subscription(subscription: Subscription) -> bool:
         """Create a new subscription (للتوافق مع الكود القديم)"""
-        subscriptions_collection = get_collection("subscriptions")
+        subscriptions_collection = get_collection("subscriptions", "billing")
         result = await subscriptions_collection.insert_one(
             subscription.dict(by_alias=True)
         )
+        SubscriptionService.invalidate_active(subscription.user_id)
         return result.acknowledged
+
+
+state.register_cache(
+    "subscription", SubscriptionService._active_cache, key_type=ObjectId
+)
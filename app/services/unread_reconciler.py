@@ -0,0 +1,78 @@
+import asyncio
+import time
+from typing import Any, Dict, Optional
+from app.config import settings
+from app.services.alert_service import AlertService
+from app.state import state
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class UnreadReconciler:
+    """Periodically corrects drift in the materialised unread alert counts
+
+    The counters are recomputed from the alerts on startup, which also seeds
+    them for alert history written before they existed, and then every
+    `interval` seconds. With several workers the run is claimed through the shared state, so
+    only one worker reconciles per interval.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+        self.runs = 0
+        self.skipped = 0
+        self.corrected = 0
+        self.failed = 0
+        self.last_run_at: Optional[float] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> None:
+        if self.running or self.interval <= 0:
+            return
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await self.reconcile_once()
+            await asyncio.sleep(self.interval)
+
+    async def reconcile_once(self) -> None:
+        if not await state.claim("alerts:reconcile-unread", self.interval * 0.9):
+            self.skipped += 1
+            return
+        try:
+            result = await AlertService.reconcile_unread_counts()
+            self.runs += 1
+            self.corrected += result["corrected"]
+            self.last_run_at = time.time()
+        except Exception as e:
+            self.failed += 1
+            logger.error(f"Unread counter reconciliation failed: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "interval": self.interval,
+            "runs": self.runs,
+            "skipped": self.skipped,
+            "corrected": self.corrected,
+            "failed": self.failed,
+            "last_run_at": self.last_run_at or 0.0,
+        }
+
+
+unread_reconciler = UnreadReconciler(interval=settings.ALERT_UNREAD_RECONCILE_SECONDS)
@@ -0,0 +1,211 @@
+import asyncio
+import json
+import os
+import time
+from typing import Any, Callable, Dict, Hashable, Optional, Set
+from app.cache import TTLCache
+from app.config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class StateBackend:
+    """State that must agree across workers, kept in this process
+
+    Three things are shared: invalidations of the in-process caches (a user
+    changed in one worker must be dropped from every worker's cache),
+    broadcast events (an alert created in one worker reaches the streams
+    held by the others), and short-lived claims that let exactly one worker
+    act on a key, such as running a user's prediction. This default only
+    sees its own process, so it is correct for a single worker.
+    """
+
+    shared = False
+
+    def __init__(self):
+        self._caches: Dict[str, tuple] = {}
+        self._claims: Dict[str, float] = {}
+        self._listeners: Dict[str, Callable[[Dict[str, Any]], None]] = {
+            "invalidate": self._apply_invalidation
+        }
+
+    async def connect(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+    def register_cache(
+        self, name: str, cache: TTLCache, key_type: Callable[[str], Hashable] = str
+    ) -> None:
+        """Make a cache invalidatable by name; key_type parses broadcast keys"""
+        self._caches[name] = (cache, key_type)
+
+    def add_listener(self, topic: str, handler: Callable[[Dict[str, Any]], None]) -> None:
+        """Call handler with the payload of every event broadcast on topic"""
+        self._listeners[topic] = handler
+
+    def broadcast(self, topic: str, payload: Dict[str, Any]) -> None:
+        """Deliver a JSON-serialisable event to the topic listener of every worker"""
+        self._dispatch(topic, payload)
+
+    def _dispatch(self, topic: str, payload: Dict[str, Any]) -> None:
+        handler = self._listeners.get(topic)
+        if handler is not None:
+            handler(payload)
+
+    def invalidate(self, name: str, key: Hashable) -> None:
+        """Drop a key from a registered cache in every worker"""
+        self.broadcast("invalidate", {"cache": name, "key": str(key)})
+
+    def _apply_invalidation(self, payload: Dict[str, Any]) -> None:
+        cache, key_type = self._caches[payload["cache"]]
+        cache.invalidate(key_type(payload["key"]))
+
+    async def claim(self, key: str, ttl: float) -> bool:
+        """Claim a key for ttl seconds; False if it is already claimed"""
+        now = time.monotonic()
+        if len(self._claims) > 10000:
+            self._claims = {k: t for k, t in self._claims.items() if t > now}
+        if self._claims.get(key, 0) > now:
+            return False
+        self._claims[key] = now + ttl
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": "memory", "shared": self.shared, "claims": len(self._claims)}
+
+
+class RedisStateBackend(StateBackend):
+    """State shared through Redis (or anything speaking its protocol)
+
+    Events, cache invalidations included, are published on one channel and
+    handled by every worker, so local cache reads stay as fast as with the
+    memory backend. Claims are SET NX with an expiry. If Redis is
+    unreachable, claims are granted and events are only handled locally, so
+    requests keep being served; cache entries then expire by TTL.
+    """
+
+    shared = True
+
+    def __init__(self, url: str, prefix: str):
+        super().__init__()
+        self.url = url
+        self.prefix = prefix
+        self.channel = f"{prefix}events"
+        self.origin = f"{os.getpid()}-{id(self)}"
+        self._redis = None
+        self._listener: Optional[asyncio.Task] = None
+        # Strong references, the event loop only keeps weak ones to tasks
+        self._tasks: Set[asyncio.Task] = set()
+        self.published = 0
+        self.received = 0
+        self.errors = 0
+
+    async def connect(self) -> None:
+        try:
+            import redis.asyncio as redis
+        except ImportError as e:
+            raise RuntimeError("STATE_BACKEND=redis requires the 'redis' package (>=5.0.1)") from e
+
+        self._redis = redis.from_url(self.url)
+        await self._redis.ping()
+        pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+        await pubsub.subscribe(self.channel)
+        self._listener = asyncio.create_task(self._listen(pubsub))
+        print(f"Connected to shared state at {self.url}")
+
+    async def close(self) -> None:
+        if self._tasks:
+            await asyncio.wait(set(self._tasks), timeout=5)
+        if self._listener:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
+
+    async def _listen(self, pubsub) -> None:
+        try:
+            while True:
+                try:
+                    async for message in pubsub.listen():
+                        if message["type"] == "message":
+                            self._apply(message["data"])
+                except (asyncio.CancelledError, KeyboardInterrupt):
+                    raise
+                except Exception as e:
+                    self.errors += 1
+                    logger.error(f"Event listener failed, resubscribing: {str(e)}")
+                    await asyncio.sleep(1)
+                    await pubsub.subscribe(self.channel)
+        finally:
+            await pubsub.aclose()
+
+    def _apply(self, data: bytes) -> None:
+        self.received += 1
+        try:
+            message = json.loads(data)
+            # This worker handled its own events when broadcasting them
+            if message["origin"] == self.origin:
+                return
+            self._dispatch(message["topic"], message["payload"])
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Ignoring event {data!r}: {str(e)}")
+
+    def broadcast(self, topic: str, payload: Dict[str, Any]) -> None:
+        self._dispatch(topic, payload)
+        if self._redis is None:
+            return
+        message = json.dumps({"topic": topic, "payload": payload, "origin": self.origin})
+        task = asyncio.create_task(self._publish(message))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _publish(self, message: str) -> None:
+        try:
+            await self._redis.publish(self.channel, message)
+            self.published += 1
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Failed to publish event: {str(e)}")
+
+    async def claim(self, key: str, ttl: float) -> bool:
+        if self._redis is None:
+            return await super().claim(key, ttl)
+        try:
+            claimed = await self._redis.set(
+                f"{self.prefix}claim:{key}", self.origin, nx=True, px=max(1, int(ttl * 1000))
+            )
+            return bool(claimed)
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Failed to claim {key}, proceeding locally: {str(e)}")
+            return await super().claim(key, ttl)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": "redis",
+            "shared": self.shared,
+            "connected": self._redis is not None,
+            "published": self.published,
+            "received": self.received,
+            "errors": self.errors,
+        }
+
+
+def create_state_backend() -> StateBackend:
+    if settings.STATE_BACKEND == "memory":
+        return StateBackend()
+    if settings.STATE_BACKEND == "redis":
+        return RedisStateBackend(settings.REDIS_URL, settings.STATE_KEY_PREFIX)
+    raise ValueError(f"Unknown STATE_BACKEND: {settings.STATE_BACKEND}")
+
+
+state = create_state_backend()
@@ -0,0 +1,99 @@
+"""Storage layout of consumption readings
+
+With CONSUMPTIONS_TIMESERIES the `consumptions` collection is a MongoDB
+time-series collection (7.0+, see MIN_SERVER_VERSION): readings are bucketed by their meta fields
+(user_id, device_id, location), which are stored once per bucket instead
+of once per reading. MongoDB takes a single metaField, so they are nested
+under `meta` in storage. Code outside this module keeps using flat
+documents and field names; queries, projections and aggregation field
+paths go through these helpers.
+"""
+from typing import Any, Dict, Optional
+from app.config import settings
+
+META_FIELD = "meta"
+META_FIELDS = ("user_id", "device_id", "location")
+TIME_FIELD = "timestamp"
+# Deletes on time-series collections may only filter on the metaField
+# before 7.0; archive --delete removes readings by _id
+MIN_SERVER_VERSION = (7, 0)
+
+
+def field(name: str) -> str:
+    """Stored path of a consumption field"""
+    if settings.CONSUMPTIONS_TIMESERIES and name in META_FIELDS:
+        return f"{META_FIELD}.{name}"
+    return name
+
+
+def ref(name: str) -> str:
+    """Aggregation expression referencing a consumption field"""
+    return f"${field(name)}"
+
+
+def stored_query(query: Dict[str, Any]) -> Dict[str, Any]:
+    """Rewrite a filter on flat fields for the stored layout"""
+    if not settings.CONSUMPTIONS_TIMESERIES:
+        return query
+    mapped = {}
+    for key, value in query.items():
+        if key in ("$and", "$or", "$nor"):
+            value = [stored_query(clause) for clause in value]
+        mapped[field(key)] = value
+    return mapped
+
+
+def stored_projection(projection: Dict[str, Any]) -> Dict[str, Any]:
+    if not settings.CONSUMPTIONS_TIMESERIES:
+        return projection
+    return {field(key): value for key, value in projection.items()}
+
+
+def to_stored(document: Dict[str, Any]) -> Dict[str, Any]:
+    """Stored form of a flat consumption document"""
+    if not settings.CONSUMPTIONS_TIMESERIES or META_FIELD in document:
+        return document
+    stored = {key: value for key, value in document.items() if key not in META_FIELDS}
+    stored[META_FIELD] = {name: document.get(name) for name in META_FIELDS}
+    return stored
+
+
+def from_stored(document: Dict[str, Any]) -> Dict[str, Any]:
+    """Flat form of a stored consumption document (either layout)"""
+    meta = document.get(META_FIELD)
+    if meta is None:
+        return document
+    flat = {key: value for key, value in document.items() if key != META_FIELD}
+    flat.update(meta)
+    return flat
+
+
+def collection_options(retention_days: int = 0) -> Dict[str, Any]:
+    """create_collection options of the time-series consumptions collection"""
+    options: Dict[str, Any] = {
+        "timeseries": {
+            "timeField": TIME_FIELD,
+            "metaField": META_FIELD,
+            "granularity": settings.CONSUMPTIONS_TIMESERIES_GRANULARITY,
+        }
+    }
+    if retention_days > 0:
+        options["expireAfterSeconds"] = retention_days * 86400
+    return options
+
+
+async def check_server(client) -> None:
+    """Refuse a server too old for time-series consumptions"""
+    info = await client.server_info()
+    if tuple(info.get("versionArray", [0, 0])[:2]) < MIN_SERVER_VERSION:
+        raise RuntimeError(
+            f"CONSUMPTIONS_TIMESERIES requires MongoDB "
+            f"{'.'.join(map(str, MIN_SERVER_VERSION))}+, the server runs {info.get('version')}"
+        )
+
+
+async def collection_info(database, name: str) -> Optional[Dict[str, Any]]:
+    """listCollections entry of a collection, None when it does not exist"""
+    async for info in await database.list_collections(filter={"name": name}):
+        return info
+    return None
@@ -1,5 +1,7 @@
-from datetime import datetime, timedelta
-from typing import Optional, Any, Dict
+import asyncio
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Any, Callable, Dict
 from jose import JWTError, jwt
 import bcrypt
 from app.config import settings
@@ -30,12 +32,78 @@ def get_password_hash(password: str) -> str:
             password_bytes = password_bytes[:72]
             logger.warning("Password truncated to 72 bytes for bcrypt")
             
-        hashed = bcrypt.hashpw(password_bytes, bcrypt.gensalt())
+        hashed = bcrypt.hashpw(password_bytes, bcrypt.gensalt(rounds=settings.BCRYPT_ROUNDS))
         return hashed.decode('utf-8')
     except Exception as e:
         logger.error(f"Password hashing error: {str(e)}")
         raise
 
+class PasswordPoolBusy(Exception):
+    """Raised when too many password hashing jobs are already queued"""
+
+
+class PasswordPool:
+    executor: Optional[Executor] = None
+    pending: int = 0
+    completed: int = 0
+    rejected: int = 0
+
+
+password_pool = PasswordPool()
+
+
+async def _run_password_job(func: Callable, *args):
+    """Run a bcrypt call on the bounded password pool, off the event loop
+
+    Threads are enough when the installed bcrypt releases the GIL while
+    hashing; set PASSWORD_POOL_USE_PROCESSES when it does not.
+    """
+    if password_pool.pending >= settings.PASSWORD_POOL_MAX_PENDING:
+        password_pool.rejected += 1
+        raise PasswordPoolBusy()
+
+    if password_pool.executor is None:
+        if settings.PASSWORD_POOL_USE_PROCESSES:
+            password_pool.executor = ProcessPoolExecutor(
+                max_workers=settings.PASSWORD_POOL_WORKERS
+            )
+        else:
+            password_pool.executor = ThreadPoolExecutor(
+                max_workers=settings.PASSWORD_POOL_WORKERS, thread_name_prefix="bcrypt"
+            )
+
+    password_pool.pending += 1
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(password_pool.executor, func, *args)
+    finally:
+        password_pool.pending -= 1
+        password_pool.completed += 1
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await _run_password_job(verify_password, plain_password, hashed_password)
+
+
+async def get_password_hash_async(password: str) -> str:
+    return await _run_password_job(get_password_hash, password)
+
+
+def shutdown_password_pool():
+    if password_pool.executor:
+        password_pool.executor.shutdown(wait=True)
+        password_pool.executor = None
+
+
+def password_pool_stats() -> Dict[str, Any]:
+    return {
+        "workers": settings.PASSWORD_POOL_WORKERS,
+        "pending": password_pool.pending,
+        "max_pending": settings.PASSWORD_POOL_MAX_PENDING,
+        "completed": password_pool.completed,
+        "rejected": password_pool.rejected,
+    }
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -63,6 +131,16 @@ def calculate_percentage_remaining(remaining: float, total: float) -> float:
         return 0
     return (remaining / total) * 100
 
+def to_naive_utc(timestamp: datetime) -> datetime:
+    """Naive UTC datetime, the form MongoDB returns and the code compares
+
+    Timezone-aware values (e.g. an ISO timestamp ending in Z or +03:00) are
+    converted to UTC; naive ones are taken to be UTC already.
+    """
+    if timestamp.tzinfo is None:
+        return timestamp
+    return timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+
 def format_timestamp_for_ai(timestamp: datetime) -> str:
     """Format timestamp for AI service"""
     return timestamp.isoformat()
@@ -0,0 +1,84 @@
+"""Shared fixtures
+
+MongoDB is replaced by mongomock-motor (an in-memory, single-process
+stand-in, see requirements-dev.txt), the AI service by app.ai_stub and
+Redis by app.redis_stub, so the suite runs without external services.
+Async tests use the anyio plugin on asyncio.
+"""
+import asyncio
+import functools
+import itertools
+import mongomock_motor
+import pytest
+from mongomock import aggregate
+from mongomock_motor import AsyncMongoMockClient
+from app.config import settings
+from app.database import db
+
+
+# mongomock-motor cursors lack batch_size(), close() and to_list(length)
+# with a bound; give them the Motor behaviour the services rely on
+def _batch_size(self, size):
+    return self
+
+
+async def _to_list(self, length=None):
+    return list(itertools.islice(self._AsyncCursor__cursor, length))
+
+
+async def _close(self):
+    pass
+
+
+mongomock_motor.AsyncCursor.batch_size = _batch_size
+mongomock_motor.AsyncCursor.to_list = _to_list
+mongomock_motor.AsyncCursor.close = _close
+
+# Used by the deduction pipeline, missing from mongomock's expression parser
+_handle_set_operator = aggregate._Parser._handle_set_operator
+
+
+def _set_operator(self, operator, values):
+    if operator == "$setDifference":
+        first, second = (self.parse(value) for value in values)
+        return [value for value in first if value not in second]
+    return _handle_set_operator(self, operator, values)
+
+
+aggregate._Parser._handle_set_operator = _set_operator
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def mongo():
+    """Fresh in-memory database wired into app.database"""
+    client = AsyncMongoMockClient()
+    db.client = client
+    db.database = client[settings.MONGODB_DB_NAME]
+    db.ingest_client = None
+    db.collections = {}
+    yield db.database
+    db.client = None
+    db.database = None
+    db.collections = {}
+
+
+@pytest.fixture
+def interleave(monkeypatch):
+    """Make writes yield to the event loop after applying, like a network
+    round trip, so concurrent coroutines interleave between a write and
+    whatever they do next"""
+    for name in ("bulk_write", "find_one_and_update", "update_one", "update_many", "insert_many"):
+        method = getattr(mongomock_motor.AsyncMongoMockCollection, name)
+
+        @functools.wraps(method)
+        async def yielding(self, *args, __method=method, **kwargs):
+            result = await __method(self, *args, **kwargs)
+            await asyncio.sleep(0)
+            return result
+
+        monkeypatch.setattr(mongomock_motor.AsyncMongoMockCollection, name, yielding)
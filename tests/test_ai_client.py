@@ -0,0 +1,64 @@
+import httpx
+import pytest
+from bson import ObjectId
+from app.ai_client import ai_client, get_ai_client_stats
+from app.ai_stub import app as ai_stub_app
+from app.services.ai_service import AIService
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def stub_ai():
+    """Shared AI client routed to the in-process AI stub"""
+    ai_client.client = httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=ai_stub_app), base_url="http://ai"
+    )
+    yield ai_client.client
+    ai_client.client = None
+
+
+async def test_batch_predictions_are_stored(mongo, stub_ai, monkeypatch):
+    users = [ObjectId(), ObjectId()]
+
+    async def consumption_data(user_ids, hours=24):
+        return {user_id: [{"power_usage_kwh": 1.0, "total_power_watt": 500.0}] for user_id in user_ids}
+
+    monkeypatch.setattr(AIService, "get_users_consumption_data", consumption_data)
+
+    predictions = await AIService.fetch_ai_predictions(users)
+
+    assert {prediction.user_id for prediction in predictions} == set(users)
+    assert await mongo["predictions"].count_documents({}) == 2
+    assert ai_client.requests >= 1
+
+
+def test_pool_stats_fall_back_to_requests_in_flight(monkeypatch):
+    # A transport without httpcore's private pool, as with ASGITransport
+    monkeypatch.setattr(ai_client, "transport", httpx.ASGITransport(app=ai_stub_app))
+    monkeypatch.setattr(ai_client, "in_flight", 3)
+
+    stats = get_ai_client_stats()
+    assert stats["connections"] == 3
+    assert stats["pool_introspection"] is False
+
+
+def test_pool_stats_survive_a_changed_httpcore(monkeypatch):
+    class Connection:
+        def is_idle(self):
+            raise AttributeError("renamed in a newer httpcore")
+
+    class Transport:
+        _pool = type("Pool", (), {"connections": [Connection()]})()
+
+    monkeypatch.setattr(ai_client, "transport", Transport())
+    monkeypatch.setattr(ai_client, "in_flight", 1)
+
+    stats = get_ai_client_stats()
+    assert stats["connections"] == 1
+    assert stats["pool_introspection"] is False
+
+
+def test_pool_stats_read_the_httpx_pool(monkeypatch):
+    monkeypatch.setattr(ai_client, "transport", httpx.AsyncHTTPTransport())
+    assert get_ai_client_stats()["pool_introspection"] is True
@@ -0,0 +1,92 @@
+import logging
+from datetime import timedelta
+import httpx
+import pytest
+from app.auth import AccessTokenLogFilter, create_stream_token
+from app.config import settings
+from app.main import app
+from app.models import User
+from app.services.alert_hub import alert_hub
+from app.utils import create_access_token
+
+pytestmark = pytest.mark.anyio
+
+ALERTS_URL = f"{settings.API_V1_STR}/alerts"
+
+
+@pytest.fixture
+async def user(mongo):
+    user = User(
+        name="Owner",
+        email="owner@example.com",
+        hashed_password="x",
+        building_type="house",
+        meter_id="meter-1",
+    )
+    await mongo["users"].insert_one(user.dict(by_alias=True))
+    return user
+
+
+@pytest.fixture
+async def client(mongo):
+    async with httpx.AsyncClient(app=app, base_url="http://test") as client:
+        yield client
+
+
+@pytest.fixture
+def streams_full(monkeypatch):
+    # Authentication passes, then the stream is refused before it starts
+    monkeypatch.setattr(alert_hub, "max_subscribers", 0)
+
+
+def _login_token(user):
+    return create_access_token(
+        {"sub": user.email, "uid": str(user.id)}, expires_delta=timedelta(minutes=5)
+    )
+
+
+async def test_stream_token_is_issued_to_a_logged_in_user(client, user):
+    response = await client.post(
+        f"{ALERTS_URL}/stream-token",
+        headers={"Authorization": f"Bearer {_login_token(user)}"},
+    )
+    assert response.status_code == 200
+    assert response.json()["expires_in"] == settings.ALERT_STREAM_TOKEN_SECONDS
+
+
+async def test_url_only_accepts_stream_tokens(client, user, streams_full):
+    login = await client.get(f"{ALERTS_URL}/stream", params={"access_token": _login_token(user)})
+    stream = await client.get(
+        f"{ALERTS_URL}/stream", params={"access_token": create_stream_token(user)}
+    )
+    assert login.status_code == 401
+    assert stream.status_code == 503
+
+
+async def test_stream_token_is_valid_nowhere_else(client, user):
+    response = await client.get(
+        f"{ALERTS_URL}/latest",
+        headers={"Authorization": f"Bearer {create_stream_token(user)}"},
+    )
+    assert response.status_code == 401
+
+
+async def test_full_worker_refuses_the_stream_with_retry_after(client, user, streams_full):
+    response = await client.get(
+        f"{ALERTS_URL}/stream",
+        headers={"Authorization": f"Bearer {_login_token(user)}"},
+    )
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "30"
+
+
+def test_access_log_redacts_url_tokens():
+    record = logging.LogRecord(
+        "uvicorn.access", logging.INFO, __file__, 0,
+        '%s - "%s %s HTTP/%s" %d',
+        ("127.0.0.1:5000", "GET", "/api/v1/alerts/stream?access_token=abc.def&x=1", "1.1", 200),
+        None,
+    )
+    AccessTokenLogFilter().filter(record)
+    assert "abc.def" not in record.getMessage()
+    assert "access_token=[redacted]&x=1" in record.getMessage()
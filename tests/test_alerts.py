@@ -0,0 +1,81 @@
+from datetime import datetime
+import mongomock_motor
+import pytest
+from bson import ObjectId
+from app.services.alert_service import AlertService
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture(autouse=True)
+def clear_unread_cache():
+    AlertService._unread_cache.clear()
+    yield
+    AlertService._unread_cache.clear()
+
+
+async def _insert_alerts(mongo, user_id, count, read=False):
+    await mongo["alerts"].insert_many(
+        [
+            {
+                "user_id": user_id,
+                "alert_type": "WARNING",
+                "percentage": 20.0,
+                "message": "Low balance",
+                "timestamp": datetime.utcnow(),
+                "read": read,
+                "auto_triggered": True,
+            }
+            for _ in range(count)
+        ]
+    )
+
+
+async def _counter(mongo, user_id):
+    counter = await mongo["alert_counters"].find_one({"_id": user_id})
+    return counter and counter["unread"]
+
+
+async def test_first_alert_seeds_the_counter_from_existing_alerts(mongo):
+    user_id = ObjectId()
+    await _insert_alerts(mongo, user_id, 3)
+
+    await AlertService.create_alert(user_id, "CRITICAL", 10.0, "Very low balance")
+
+    assert await _counter(mongo, user_id) == 4
+    AlertService._unread_cache.clear()
+    assert await AlertService.get_unread_count(user_id) == 4
+
+
+async def test_reconcile_creates_missing_counters_and_fixes_drift(mongo):
+    drifted, missing = ObjectId(), ObjectId()
+    await _insert_alerts(mongo, drifted, 2)
+    await _insert_alerts(mongo, missing, 3)
+    await mongo["alert_counters"].insert_one({"_id": drifted, "unread": 5})
+
+    assert await AlertService.reconcile_unread_counts() == {"corrected": 2}
+    assert await _counter(mongo, drifted) == 2
+    assert await _counter(mongo, missing) == 3
+
+
+async def test_reconcile_keeps_increments_made_while_it_runs(mongo, monkeypatch):
+    user_id = ObjectId()
+    await _insert_alerts(mongo, user_id, 2)
+    await mongo["alert_counters"].insert_one({"_id": user_id, "unread": 5})
+
+    bulk_write = mongomock_motor.AsyncMongoMockCollection.bulk_write
+
+    async def alert_created_meanwhile(self, *args, **kwargs):
+        monkeypatch.setattr(mongomock_motor.AsyncMongoMockCollection, "bulk_write", bulk_write)
+        await AlertService.create_alert(user_id, "CRITICAL", 10.0, "Very low balance")
+        return await bulk_write(self, *args, **kwargs)
+
+    monkeypatch.setattr(
+        mongomock_motor.AsyncMongoMockCollection, "bulk_write", alert_created_meanwhile
+    )
+    assert await AlertService.reconcile_unread_counts() == {"corrected": 0}
+    assert await _counter(mongo, user_id) == 6
+
+    # The next run corrects it
+    await AlertService.reconcile_unread_counts()
+    assert await _counter(mongo, user_id) == 3
@@ -0,0 +1,86 @@
+import asyncio
+from datetime import datetime, timedelta
+import pytest
+from bson import ObjectId
+from app.services.subscription_service import SubscriptionService
+
+pytestmark = pytest.mark.anyio
+
+
+async def _subscribe(mongo, total_kwh=100.0, remaining_kwh=100.0):
+    user_id = ObjectId()
+    await mongo["subscriptions"].insert_one(
+        {
+            "_id": ObjectId(),
+            "user_id": user_id,
+            "plan_id": "standard",
+            "plan_name": "Standard Plan",
+            "total_kwh": total_kwh,
+            "remaining_kwh": remaining_kwh,
+            "price": 18.0,
+            "start_date": datetime.utcnow(),
+            "end_date": datetime.utcnow() + timedelta(days=30),
+            "status": "active",
+            "alerts_triggered": [],
+        }
+    )
+    return user_id
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    SubscriptionService._active_cache.clear()
+
+
+async def test_batch_reports_every_applied_deduction(mongo):
+    rich = await _subscribe(mongo)
+    poor = await _subscribe(mongo, remaining_kwh=1.0)
+
+    results = await SubscriptionService.deduct_energy_many({rich: [10.0], poor: [5.0]})
+
+    assert results[rich].remaining_kwh == 90.0
+    assert results[poor] is None
+    poor_subscription = await mongo["subscriptions"].find_one({"user_id": poor})
+    assert poor_subscription["remaining_kwh"] == 1.0
+
+
+async def test_concurrent_deductions_claim_each_threshold_once(mongo, interleave):
+    user_id = await _subscribe(mongo, remaining_kwh=26.0)
+
+    # Every path crosses the 20% and 10% thresholds at some point
+    outcomes = await asyncio.gather(
+        SubscriptionService.deduct_energy_many({user_id: [4.0]}),
+        SubscriptionService.deduct_energy_many({user_id: [4.0]}),
+        SubscriptionService.deduct_energy(user_id, 4.0),
+        SubscriptionService.deduct_energy_many({user_id: [4.0]}),
+    )
+    deductions = [
+        outcome[user_id] if isinstance(outcome, dict) else outcome for outcome in outcomes
+    ]
+
+    # Energy was available for all four, so every one reports its deduction
+    assert all(deduction is not None for deduction in deductions)
+    claimed = [alert for deduction in deductions for alert in deduction.triggered_alerts]
+    assert sorted(claimed) == ["CRITICAL", "WARNING"]
+    subscription = await mongo["subscriptions"].find_one({"user_id": user_id})
+    assert subscription["remaining_kwh"] == pytest.approx(10.0)
+
+
+async def test_threshold_claimed_when_balance_cannot_cover_reading(mongo):
+    user_id = await _subscribe(mongo, remaining_kwh=4.0)
+
+    assert await SubscriptionService.deduct_energy(user_id, 10.0) is None
+    first = await SubscriptionService.claim_threshold_alerts(user_id)
+    second = await SubscriptionService.claim_threshold_alerts(user_id)
+
+    assert sorted(first.triggered_alerts) == ["CRITICAL", "FINAL", "WARNING"]
+    assert second.triggered_alerts == []
+
+
+async def test_deduction_from_an_empty_plan_alerts_instead_of_failing(mongo):
+    user_id = await _subscribe(mongo, total_kwh=0.0, remaining_kwh=0.0)
+
+    deduction = await SubscriptionService.deduct_energy(user_id, 0.0)
+
+    assert deduction.percentage == 0
+    assert sorted(deduction.triggered_alerts) == ["CRITICAL", "FINAL", "WARNING"]
@@ -0,0 +1,140 @@
+import httpx
+import mongomock_motor
+import pytest
+from bson import ObjectId
+from app.auth import get_current_active_user
+from app.config import settings
+from app.indexes import INDEXES
+from app.main import app
+from app.models import Device, User
+from app.services.device_service import DeviceService
+from app.services.meter_service import MeterService
+from app.services.prediction_scheduler import prediction_scheduler
+
+pytestmark = pytest.mark.anyio
+
+DEVICES_URL = f"{settings.API_V1_STR}/devices"
+
+
+@pytest.fixture(autouse=True)
+def clear_device_caches():
+    DeviceService._cache.clear()
+    DeviceService._unknown.clear()
+
+
+@pytest.fixture
+async def devices(mongo):
+    await mongo["devices"].create_indexes(INDEXES["devices"])
+    return mongo["devices"]
+
+
+@pytest.fixture
+async def user():
+    user = User(
+        name="Owner",
+        email="owner@example.com",
+        hashed_password="x",
+        building_type="house",
+        meter_id="meter-1",
+    )
+    app.dependency_overrides[get_current_active_user] = lambda: user
+    yield user
+    app.dependency_overrides.pop(get_current_active_user, None)
+
+
+async def _register(user_id, device_id="dev-1"):
+    api_key = DeviceService.generate_api_key()
+    device = Device(
+        user_id=user_id, device_id=device_id, api_key_hash=DeviceService.hash_api_key(api_key)
+    )
+    assert await DeviceService.create_device(device)
+    return api_key
+
+
+async def test_registration_stores_only_the_key_hash(devices, user):
+    async with httpx.AsyncClient(app=app, base_url="http://test") as client:
+        response = await client.post(f"{DEVICES_URL}/register", json={"device_id": "dev-1"})
+        duplicate = await client.post(f"{DEVICES_URL}/register", json={"device_id": "dev-1"})
+
+    assert response.status_code == 201
+    api_key = response.json()["api_key"]
+    stored = await devices.find_one({"device_id": "dev-1"})
+    assert "api_key" not in stored
+    assert stored["api_key_hash"] == DeviceService.hash_api_key(api_key)
+    assert duplicate.status_code == 409
+    assert await devices.count_documents({}) == 1
+
+
+async def test_deactivated_key_stops_working(devices):
+    user_id = ObjectId()
+    api_key = await _register(user_id)
+
+    device = await DeviceService.authenticate(api_key)
+    assert device.user_id == user_id and device.device_id == "dev-1"
+    assert await DeviceService.deactivate_device("dev-1", user_id)
+    assert await DeviceService.authenticate(api_key) is None
+
+
+async def test_lookup_overlapping_a_deactivation_is_not_cached(devices, monkeypatch):
+    user_id = ObjectId()
+    api_key = await _register(user_id)
+    find_one = mongomock_motor.AsyncMongoMockCollection.find_one
+
+    async def deactivated_meanwhile(self, *args, **kwargs):
+        monkeypatch.setattr(mongomock_motor.AsyncMongoMockCollection, "find_one", find_one)
+        device_data = await find_one(self, *args, **kwargs)
+        await DeviceService.deactivate_device("dev-1", user_id)
+        return device_data
+
+    monkeypatch.setattr(
+        mongomock_motor.AsyncMongoMockCollection, "find_one", deactivated_meanwhile
+    )
+    assert await DeviceService.authenticate(api_key) is not None
+    assert await DeviceService.authenticate(api_key) is None
+
+
+async def test_unknown_key_is_rejected(devices):
+    await _register(ObjectId())
+    assert await DeviceService.authenticate("HEMS_not-a-key") is None
+
+
+async def test_key_only_vouches_for_its_own_device_id(devices, mongo, monkeypatch):
+    MeterService._cache.clear()
+    monkeypatch.setattr(prediction_scheduler, "schedule", lambda user_id: True)
+    user_id = ObjectId()
+    await mongo["users"].insert_one({"_id": user_id, "meter_id": "meter-1"})
+    api_key = await _register(user_id)
+    headers = {"X-API-Key": api_key}
+
+    def reading(device_id):
+        return {
+            "device_id": device_id,
+            "meter_id": "meter-1",
+            "total_power_watt": 1000.0,
+            "devices_on": 1,
+            "devices_off": 0,
+            "location": "home",
+        }
+
+    async with httpx.AsyncClient(app=app, base_url="http://test") as client:
+        own = await client.post(
+            f"{settings.API_V1_STR}/consumptions/sensor/data",
+            json=reading("dev-1"),
+            headers=headers,
+        )
+        spoofed = await client.post(
+            f"{settings.API_V1_STR}/consumptions/sensor/data",
+            json=reading("dev-2"),
+            headers=headers,
+        )
+        batch = await client.post(
+            f"{settings.API_V1_STR}/consumptions/sensor/data/batch",
+            json=[reading("dev-1"), reading("dev-2")],
+            headers=headers,
+        )
+
+    assert own.status_code == 200
+    assert spoofed.status_code == 403
+    assert [result["status"] for result in batch.json()["results"]] == ["success", "error"]
+    stored = await mongo["consumptions"].distinct("device_id", {"user_id": user_id})
+    assert stored == ["dev-1"]
@@ -0,0 +1,94 @@
+import csv
+import io
+import json
+from datetime import datetime, timedelta
+import httpx
+import pytest
+from bson import ObjectId
+from app.auth import get_current_active_user
+from app.config import settings
+from app.main import app
+from app.models import Consumption, User
+
+pytestmark = pytest.mark.anyio
+
+EXPORT_URL = f"{settings.API_V1_STR}/consumptions/user/{{}}/export"
+
+
+@pytest.fixture
+async def user(mongo, monkeypatch):
+    monkeypatch.setattr(settings, "EXPORT_BATCH_SIZE", 2)
+    user = User(
+        name="Owner",
+        email="owner@example.com",
+        hashed_password="x",
+        building_type="house",
+        meter_id="meter-1",
+    )
+    app.dependency_overrides[get_current_active_user] = lambda: user
+    yield user
+    app.dependency_overrides.pop(get_current_active_user, None)
+
+
+async def _insert_readings(mongo, user_id):
+    start = datetime(2026, 1, 1)
+    # The second and third readings share a timestamp; _id breaks the tie
+    timestamps = [start, start + timedelta(hours=1), start + timedelta(hours=1)]
+    timestamps += [start + timedelta(hours=hours) for hours in (2, 3)]
+    readings = [
+        Consumption(
+            user_id=user_id,
+            device_id=f"dev-{index % 2}",
+            power_usage_kwh=float(index),
+            total_power_watt=index * 1000.0,
+            timestamp=timestamp,
+            devices_on=1,
+            devices_off=0,
+            location="home",
+        ).dict(by_alias=True)
+        for index, timestamp in enumerate(timestamps)
+    ]
+    await mongo["consumptions"].insert_many(list(reversed(readings)))
+    return [str(reading["_id"]) for reading in readings]
+
+
+async def _export(user_id, **params):
+    async with httpx.AsyncClient(app=app, base_url="http://test") as client:
+        return await client.get(EXPORT_URL.format(user_id), params=params)
+
+
+async def test_export_streams_every_reading_in_order_and_resumes(mongo, user):
+    ids = await _insert_readings(mongo, user.id)
+
+    response = await _export(user.id)
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [row["id"] for row in rows] == ids
+
+    # Resume after the first of the two readings sharing a timestamp
+    cursor = f"{rows[1]['timestamp']}_{rows[1]['id']}"
+    resumed = await _export(user.id, after=cursor)
+    assert [json.loads(line)["id"] for line in resumed.text.splitlines()] == ids[2:]
+
+
+async def test_csv_export_filters_by_range_and_device(mongo, user):
+    ids = await _insert_readings(mongo, user.id)
+
+    response = await _export(
+        user.id,
+        format="csv",
+        start="2026-01-01T01:00:00",
+        end="2026-01-01T03:00:00",
+        device_id="dev-0",
+    )
+
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert response.headers["content-type"].startswith("text/csv")
+    assert [row["id"] for row in rows] == [ids[2]]
+    assert rows[0]["power_usage_kwh"] == "2.0"
+
+
+async def test_export_rejects_bad_cursors_and_other_users(mongo, user):
+    assert (await _export(user.id, after="yesterday")).status_code == 400
+    assert (await _export(ObjectId())).status_code == 403
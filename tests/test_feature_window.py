@@ -0,0 +1,93 @@
+from datetime import datetime, timedelta
+import pytest
+from bson import ObjectId
+from app.config import settings
+from app.models import Consumption
+from app.services.feature_window import FeatureWindow, feature_window
+
+pytestmark = pytest.mark.anyio
+
+
+def _consumption(user_id, timestamp, kwh=1.0):
+    return Consumption(
+        user_id=user_id,
+        device_id="device-1",
+        power_usage_kwh=kwh,
+        total_power_watt=kwh * 1000,
+        timestamp=timestamp,
+        devices_on=1,
+        devices_off=0,
+        location="home",
+    )
+
+
+def test_single_process_windows_never_expire():
+    # The default memory state backend is a single worker
+    assert feature_window.max_age is None
+
+
+def test_max_age_outlasts_the_prediction_coalesce_interval():
+    assert settings.FEATURE_WINDOW_MAX_AGE_SECONDS > 2 * settings.PREDICTION_COALESCE_SECONDS
+
+
+async def test_window_is_rebuilt_then_kept_up_to_date(mongo):
+    window = FeatureWindow(hours=24, max_users=10)
+    user_id = ObjectId()
+    now = datetime.utcnow()
+    await mongo["consumptions"].insert_one(_consumption(user_id, now).dict(by_alias=True))
+
+    features = (await window.load([user_id]))[user_id]
+    assert [hour["power_usage_kwh"] for hour in features] == [1.0]
+
+    window.record(_consumption(user_id, now, kwh=2.0))
+    assert window.snapshot(user_id)[-1]["power_usage_kwh"] == 3.0
+    assert window.rebuilds == 1
+
+
+async def test_stale_window_is_rebuilt(mongo, monkeypatch):
+    window = FeatureWindow(hours=24, max_users=10, max_age=60)
+    user_id = ObjectId()
+    await window.load([user_id])
+    assert window.snapshot(user_id) == []
+
+    loaded_at = window._loaded_at[user_id]
+    monkeypatch.setattr(
+        "app.services.feature_window.time.monotonic", lambda: loaded_at + 61
+    )
+    assert window.snapshot(user_id) is None
+    await window.load([user_id])
+    assert window.rebuilds == 2
+
+
+async def test_old_readings_are_not_recorded(mongo):
+    window = FeatureWindow(hours=2, max_users=10)
+    user_id = ObjectId()
+    await window.load([user_id])
+
+    window.record(_consumption(user_id, datetime.utcnow() - timedelta(hours=3)))
+    assert window.snapshot(user_id) == []
+
+
+async def test_readings_recorded_during_a_rebuild_are_replayed_once(mongo, monkeypatch):
+    window = FeatureWindow(hours=24, max_users=10)
+    user_id = ObjectId()
+    now = datetime.utcnow()
+    before = _consumption(user_id, now)
+    await mongo["consumptions"].insert_one(before.dict(by_alias=True))
+    rebuild = window._rebuild
+
+    async def readings_arrive_meanwhile(user_ids, cutoff):
+        # Recorded before the query runs, one already stored, one still buffered
+        stored = _consumption(user_id, now, kwh=2.0)
+        await mongo["consumptions"].insert_one(stored.dict(by_alias=True))
+        window.record(stored)
+        window.record(_consumption(user_id, now, kwh=4.0))
+        return await rebuild(user_ids, cutoff)
+
+    monkeypatch.setattr(window, "_rebuild", readings_arrive_meanwhile)
+    features = (await window.load([user_id]))[user_id]
+
+    assert [hour["power_usage_kwh"] for hour in features] == [7.0]
+    assert window._pending == {}
+    window.record(_consumption(user_id, now, kwh=8.0))
+    assert window.snapshot(user_id)[-1]["power_usage_kwh"] == 15.0
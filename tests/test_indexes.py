@@ -0,0 +1,39 @@
+import pytest
+from pymongo import ASCENDING
+from app.indexes import ensure_indexes, has_drift
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_check_reports_missing_indexes_without_creating_them(mongo):
+    report = await ensure_indexes(mongo, create=False)
+
+    assert report["users"]["missing"] == ["email_1", "meter_id_1"]
+    assert report["users"]["created"] == []
+    assert has_drift(report)
+    assert "email_1" not in await mongo["users"].index_information()
+
+
+async def test_declared_indexes_are_created_once(mongo):
+    first = await ensure_indexes(mongo)
+    second = await ensure_indexes(mongo)
+
+    assert first["users"]["created"] == ["email_1", "meter_id_1"]
+    assert second["users"]["created"] == []
+    users_indexes = await mongo["users"].index_information()
+    assert users_indexes["email_1"]["unique"] and users_indexes["meter_id_1"]["unique"]
+
+
+async def test_drift_from_the_declared_indexes_is_reported(mongo):
+    await ensure_indexes(mongo)
+    report = await ensure_indexes(mongo, create=False)
+    assert not has_drift({"users": report["users"]})
+
+    await mongo["users"].drop_index("meter_id_1")
+    await mongo["users"].create_index([("meter_id", ASCENDING)])
+    await mongo["users"].create_index([("name", ASCENDING)])
+    report = await ensure_indexes(mongo, create=False)
+
+    assert report["users"]["mismatched"] == ["meter_id_1"]
+    assert report["users"]["unexpected"] == ["name_1"]
+    assert has_drift({"users": report["users"]})
@@ -0,0 +1,151 @@
+import asyncio
+from datetime import datetime
+import mongomock_motor
+import pytest
+from bson import ObjectId, json_util
+from pymongo.errors import AutoReconnect
+from app.services.ingest_buffer import IngestBuffer
+
+pytestmark = pytest.mark.anyio
+
+
+def _document(n=0):
+    return {"_id": ObjectId(), "device_id": f"device-{n}", "timestamp": datetime(2024, 1, 1)}
+
+
+def _dead_lettered(directory):
+    return [
+        json_util.loads(line)
+        for path in sorted(directory.iterdir())
+        for line in path.read_text().splitlines()
+    ]
+
+
+def _buffer(tmp_path, **options):
+    written = []
+
+    async def after_write(documents):
+        written.extend(documents)
+
+    options.setdefault("retry_attempts", 2)
+    buffer = IngestBuffer(
+        "consumptions",
+        batch_size=10,
+        flush_interval=0.01,
+        max_pending=100,
+        retry_backoff=0,
+        dead_letter_dir=str(tmp_path),
+        after_write=after_write,
+        **options,
+    )
+    return buffer, written
+
+
+def _fail_inserts(monkeypatch, times):
+    insert_many = mongomock_motor.AsyncMongoMockCollection.insert_many
+    calls = {"count": 0}
+
+    async def failing(self, documents, **kwargs):
+        calls["count"] += 1
+        if calls["count"] <= times:
+            raise AutoReconnect("connection reset")
+        return await insert_many(self, documents, **kwargs)
+
+    monkeypatch.setattr(mongomock_motor.AsyncMongoMockCollection, "insert_many", failing)
+
+
+async def test_failed_flush_is_retried(mongo, tmp_path, monkeypatch):
+    buffer, written = _buffer(tmp_path)
+    _fail_inserts(monkeypatch, times=1)
+    buffer.start()
+    documents = [_document(n) for n in range(3)]
+    await buffer.put_many(documents)
+    await buffer.drain(timeout=5)
+
+    assert await mongo["consumptions"].count_documents({}) == 3
+    assert written == documents
+    assert buffer.retries == 1
+    assert buffer.failed == 0
+    assert list(tmp_path.iterdir()) == []
+
+
+async def test_batch_that_keeps_failing_is_dead_lettered(mongo, tmp_path, monkeypatch):
+    buffer, written = _buffer(tmp_path)
+    _fail_inserts(monkeypatch, times=10)
+    buffer.start()
+    documents = [_document(n) for n in range(3)]
+    await buffer.put_many(documents)
+    await buffer.drain(timeout=5)
+
+    assert written == []
+    assert buffer.failed == buffer.dead_lettered == 3
+    assert [doc["_id"] for doc in _dead_lettered(tmp_path)] == [doc["_id"] for doc in documents]
+
+
+async def test_duplicate_documents_count_as_written(mongo, tmp_path):
+    buffer, written = _buffer(tmp_path)
+    existing = _document()
+    await mongo["consumptions"].insert_one(dict(existing))
+    buffer.start()
+    await buffer.put_many([existing, _document(1)])
+    await buffer.drain(timeout=5)
+
+    assert len(written) == 2
+    assert buffer.failed == 0
+
+
+async def test_drain_timeout_dead_letters_what_is_still_queued(mongo, tmp_path, monkeypatch):
+    buffer, written = _buffer(tmp_path, retry_attempts=100)
+    buffer.retry_backoff = 0.05
+    _fail_inserts(monkeypatch, times=1000)
+    buffer.start()
+    documents = [_document(n) for n in range(25)]
+    await buffer.put_many(documents)
+    await asyncio.sleep(0.02)
+    await buffer.drain(timeout=0.1)
+
+    dead = _dead_lettered(tmp_path)
+    assert sorted(doc["_id"] for doc in dead) == sorted(doc["_id"] for doc in documents)
+    assert buffer.depth == 0
+
+
+async def test_failing_after_write_does_not_stop_the_flusher(mongo, tmp_path):
+    buffer, _ = _buffer(tmp_path)
+
+    async def failing_after_write(documents):
+        raise RuntimeError("rollups unavailable")
+
+    buffer.after_write = failing_after_write
+    buffer.start()
+    await buffer.put_many([_document(n) for n in range(3)])
+    await buffer._queue.join()
+    assert buffer.running
+    await buffer.put(_document(3))
+    await buffer.drain(timeout=5)
+
+    assert await mongo["consumptions"].count_documents({}) == 4
+    assert buffer.after_write_errors == 2
+    assert list(tmp_path.iterdir()) == []
+
+
+async def test_queue_of_a_dead_flusher_is_dead_lettered(mongo, tmp_path, monkeypatch):
+    buffer, _ = _buffer(tmp_path)
+
+    async def crash(batch):
+        raise MemoryError("flusher crashed")
+
+    monkeypatch.setattr(buffer, "_flush", crash)
+    buffer.start()
+    documents = [_document(n) for n in range(3)]
+    await buffer.put_many(documents)
+    for _ in range(100):
+        if buffer.dead_lettered == 3:
+            break
+        await asyncio.sleep(0.01)
+
+    assert not buffer.running and buffer.stats()["died"]
+    assert sorted(doc["_id"] for doc in _dead_lettered(tmp_path)) == sorted(
+        doc["_id"] for doc in documents
+    )
+    await buffer.drain(timeout=1)
+    assert buffer.depth == 0
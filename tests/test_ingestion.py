@@ -0,0 +1,180 @@
+from datetime import datetime, timedelta, timezone
+import httpx
+import mongomock_motor
+import pytest
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
+from app.main import app
+from app.models import Device
+from app.services.device_service import DeviceService
+from app.services.feature_window import feature_window
+from app.services.meter_service import MeterService
+from app.services.prediction_scheduler import prediction_scheduler
+from app.services.subscription_service import SubscriptionService
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def client(mongo, monkeypatch):
+    MeterService._cache.clear()
+    SubscriptionService._active_cache.clear()
+    DeviceService._cache.clear()
+    DeviceService._unknown.clear()
+    monkeypatch.setattr(prediction_scheduler, "schedule", lambda user_id: True)
+    async with httpx.AsyncClient(app=app, base_url="http://test") as client:
+        yield client
+
+
+@pytest.fixture
+async def user_id(mongo):
+    user_id = ObjectId()
+    await mongo["users"].insert_one(
+        {"_id": user_id, "meter_id": "meter-1", "selected_plan": "standard", "save_mode": False}
+    )
+    await mongo["subscriptions"].insert_one(
+        {
+            "user_id": user_id,
+            "plan_id": "standard",
+            "plan_name": "Standard Plan",
+            "total_kwh": 100.0,
+            "remaining_kwh": 100.0,
+            "price": 18.0,
+            "start_date": datetime.utcnow(),
+            "end_date": datetime.utcnow() + timedelta(days=30),
+            "status": "active",
+            "alerts_triggered": [],
+        }
+    )
+    return user_id
+
+
+def _reading(**overrides):
+    reading = {
+        "device_id": "dev-1",
+        "meter_id": "meter-1",
+        "total_power_watt": 1000.0,
+        "devices_on": 2,
+        "devices_off": 1,
+        "location": "home",
+    }
+    reading.update(overrides)
+    return reading
+
+
+async def test_offset_timestamp_is_stored_as_naive_utc_and_billed(client, mongo, user_id):
+    # A loaded window compares reading hours against naive utcnow()
+    feature_window._store(user_id, {})
+    try:
+        now = datetime.now(timezone.utc).replace(microsecond=0)
+        response = await client.post(
+            "/api/v1/consumptions/sensor/data",
+            json=_reading(timestamp=now.strftime("%Y-%m-%dT%H:%M:%SZ")),
+        )
+    finally:
+        feature_window.invalidate(user_id)
+
+    assert response.status_code == 200
+    stored = await mongo["consumptions"].find_one({"user_id": user_id})
+    assert stored["timestamp"] == now.replace(tzinfo=None)
+    subscription = await mongo["subscriptions"].find_one({"user_id": user_id})
+    assert subscription["remaining_kwh"] == pytest.approx(99.0)
+
+
+async def _device_key(owner_id):
+    api_key = DeviceService.generate_api_key()
+    device = Device(
+        user_id=owner_id, device_id="dev-1", api_key_hash=DeviceService.hash_api_key(api_key)
+    )
+    await DeviceService.create_device(device)
+    return api_key
+
+
+async def test_device_key_must_be_active_and_belong_to_the_meter_owner(client, mongo, user_id):
+    own_key = await _device_key(user_id)
+    other_key = await _device_key(ObjectId())
+
+    async def send(api_key):
+        response = await client.post(
+            "/api/v1/consumptions/sensor/data", json=_reading(), headers={"X-API-Key": api_key}
+        )
+        return response.status_code
+
+    assert await send(own_key) == 200
+    assert await send(other_key) == 403
+    await DeviceService.deactivate_device("dev-1", user_id)
+    assert await send(own_key) == 401
+
+
+BATCH_URL = "/api/v1/consumptions/sensor/data/batch"
+
+
+async def test_batch_reports_each_reading_and_deducts_once_per_user(
+    client, mongo, user_id, monkeypatch
+):
+    applied = []
+    apply_deduction = SubscriptionService._apply_deduction
+
+    async def counted(user_id, kwh_used, now):
+        applied.append((user_id, kwh_used))
+        return await apply_deduction(user_id, kwh_used, now)
+
+    monkeypatch.setattr(SubscriptionService, "_apply_deduction", counted)
+    response = await client.post(
+        BATCH_URL,
+        json=[_reading(), _reading(meter_id="meter-unknown"), _reading(total_power_watt=2000.0)],
+    )
+
+    body = response.json()
+    assert response.status_code == 200
+    assert (body["processed"], body["failed"]) == (2, 1)
+    assert [(result["index"], result["status"]) for result in body["results"]] == [
+        (0, "success"),
+        (1, "error"),
+        (2, "success"),
+    ]
+    assert body["results"][1]["detail"] == "Meter ID not registered"
+    assert all(body["results"][index]["deducted"] for index in (0, 2))
+    assert applied == [(user_id, pytest.approx(3.0))]
+    subscription = await mongo["subscriptions"].find_one({"user_id": user_id})
+    assert subscription["remaining_kwh"] == pytest.approx(97.0)
+
+
+async def test_batch_bills_the_readings_that_still_fit(client, mongo, user_id):
+    await mongo["subscriptions"].update_one(
+        {"user_id": user_id}, {"$set": {"remaining_kwh": 1.5}}
+    )
+
+    response = await client.post(BATCH_URL, json=[_reading(), _reading()])
+
+    results = response.json()["results"]
+    assert [result["deducted"] for result in results] == [True, False]
+    subscription = await mongo["subscriptions"].find_one({"user_id": user_id})
+    assert subscription["remaining_kwh"] == pytest.approx(0.5)
+
+
+async def test_batch_neither_stores_nor_bills_a_failed_insert(
+    client, mongo, user_id, monkeypatch
+):
+    insert_many = mongomock_motor.AsyncMongoMockCollection.insert_many
+
+    async def second_fails(self, documents, **kwargs):
+        await insert_many(self, [documents[0], documents[2]], **kwargs)
+        raise BulkWriteError({"writeErrors": [{"index": 1, "errmsg": "boom"}]})
+
+    monkeypatch.setattr(mongomock_motor.AsyncMongoMockCollection, "insert_many", second_fails)
+    response = await client.post(
+        BATCH_URL, json=[_reading(), _reading(total_power_watt=5000.0), _reading()]
+    )
+
+    body = response.json()
+    assert (body["processed"], body["failed"]) == (2, 1)
+    assert body["results"][1] == {
+        "index": 1,
+        "status": "error",
+        "detail": "Failed to store consumption",
+        "user_id": str(user_id),
+    }
+    assert await mongo["consumptions"].count_documents({"user_id": user_id}) == 2
+    subscription = await mongo["subscriptions"].find_one({"user_id": user_id})
+    assert subscription["remaining_kwh"] == pytest.approx(98.0)
@@ -0,0 +1,49 @@
+import asyncio
+import time
+import pytest
+from app.loop_monitor import LoopMonitor
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def monitor():
+    monitor = LoopMonitor(interval=0.01, slow_threshold=0.05, window=100)
+    monitor.start()
+    yield monitor
+    await monitor.stop()
+
+
+async def test_sampler_records_loop_lag(monitor):
+    await asyncio.sleep(0.1)
+
+    stats = monitor.stats()
+    assert stats["running"]
+    assert stats["samples"] > 0
+    assert 0 <= stats["lag_p50"] <= stats["lag_max"]
+
+    await monitor.stop()
+    assert not monitor.running
+
+
+async def test_watchdog_reports_the_blocking_task_once(monitor):
+    async def blocks_the_loop():
+        time.sleep(0.3)
+
+    await asyncio.sleep(0.05)
+    await asyncio.create_task(blocks_the_loop())
+    await asyncio.sleep(0.05)
+
+    assert monitor.stall_count == 1
+    [stall] = monitor.stalls
+    assert stall["task"].endswith("blocks_the_loop")
+    assert any("blocks_the_loop" in line for line in stall["stack"])
+    assert stall["total_ms"] >= 250
+
+
+async def test_task_name_survives_asyncio_internals_changing(monitor, monkeypatch):
+    monkeypatch.delattr("asyncio.tasks._current_tasks", raising=False)
+    assert monitor._current_task_name() == "callback"
+
+    monkeypatch.setattr("asyncio.tasks._current_tasks", object(), raising=False)
+    assert monitor._current_task_name() == "unknown"
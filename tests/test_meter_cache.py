@@ -0,0 +1,63 @@
+import mongomock_motor
+import pytest
+from bson import ObjectId
+from app.services.meter_service import MeterService
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def queries(mongo, monkeypatch):
+    MeterService._cache.clear()
+    queries = []
+    find_one = mongomock_motor.AsyncMongoMockCollection.find_one
+    find = mongomock_motor.AsyncMongoMockCollection.find
+
+    async def counted_find_one(self, query, *args, **kwargs):
+        queries.append(query)
+        return await find_one(self, query, *args, **kwargs)
+
+    def counted_find(self, query, *args, **kwargs):
+        queries.append(query)
+        return find(self, query, *args, **kwargs)
+
+    monkeypatch.setattr(mongomock_motor.AsyncMongoMockCollection, "find_one", counted_find_one)
+    monkeypatch.setattr(mongomock_motor.AsyncMongoMockCollection, "find", counted_find)
+    yield queries
+    MeterService._cache.clear()
+
+
+async def test_meter_is_resolved_once_until_invalidated(mongo, queries):
+    user_id = ObjectId()
+    await mongo["users"].insert_one({"_id": user_id, "meter_id": "meter-1", "save_mode": True})
+
+    first = await MeterService.resolve("meter-1")
+    second = await MeterService.resolve("meter-1")
+    assert first == second
+    assert (first.id, first.selected_plan, first.save_mode) == (user_id, "basic", True)
+    assert len(queries) == 1
+
+    await mongo["users"].update_one({"_id": user_id}, {"$set": {"save_mode": False}})
+    MeterService.invalidate("meter-1")
+    assert not (await MeterService.resolve("meter-1")).save_mode
+    assert len(queries) == 2
+
+
+async def test_unknown_meter_is_cached_too(mongo, queries):
+    assert await MeterService.resolve("meter-unknown") is None
+    assert await MeterService.resolve("meter-unknown") is None
+    assert len(queries) == 1
+
+
+async def test_batch_queries_only_the_meters_not_cached(mongo, queries):
+    await mongo["users"].insert_many(
+        [{"_id": ObjectId(), "meter_id": meter_id} for meter_id in ("meter-1", "meter-2")]
+    )
+    await MeterService.resolve("meter-1")
+
+    resolved = await MeterService.resolve_many(["meter-1", "meter-2", "meter-3", "meter-2"])
+
+    assert set(resolved) == {"meter-1", "meter-2"}
+    assert sorted(queries[-1]["meter_id"]["$in"]) == ["meter-2", "meter-3"]
+    assert await MeterService.resolve_many(["meter-1", "meter-2", "meter-3"]) == resolved
+    assert len(queries) == 2
@@ -0,0 +1,61 @@
+import httpx
+import pytest
+from bson import ObjectId
+from app import metrics
+from app.main import app
+from app.services.meter_service import MeterService
+from app.services.prediction_scheduler import prediction_scheduler
+
+pytestmark = pytest.mark.anyio
+
+
+def _samples(text, name):
+    return [line for line in text.splitlines() if line.startswith(name)]
+
+
+async def test_metrics_expose_ingestion_stages_and_requests(mongo, monkeypatch):
+    MeterService._cache.clear()
+    monkeypatch.setattr(prediction_scheduler, "schedule", lambda user_id: True)
+    await mongo["users"].insert_one({"_id": ObjectId(), "meter_id": "meter-metrics"})
+    reading = {
+        "device_id": "dev-1",
+        "meter_id": "meter-metrics",
+        "total_power_watt": 500.0,
+        "devices_on": 1,
+        "devices_off": 0,
+        "location": "home",
+    }
+
+    async with httpx.AsyncClient(app=app, base_url="http://test") as client:
+        await client.post("/api/v1/consumptions/sensor/data", json=reading)
+        response = await client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    text = response.text
+    assert _samples(
+        text, 'hems_ingest_stage_duration_seconds_count{endpoint="single",stage="lookup"}'
+    )
+    assert _samples(
+        text, 'hems_http_requests_total{router="consumptions",method="POST",status="200"}'
+    )
+    assert _samples(text, 'hems_cache_size{cache="meter"}')
+    assert _samples(text, "hems_process_start_time_seconds")
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = metrics.Histogram("hems_test_seconds", "Test", ("stage",), buckets=(0.1, 1))
+    try:
+        for value in (0.05, 0.5, 0.5, 5):
+            histogram.observe(value, 'a"b')
+        lines = histogram.render()
+    finally:
+        metrics._metrics.remove(histogram)
+
+    assert lines[2:] == [
+        'hems_test_seconds_bucket{stage="a\\"b",le="0.1"} 1',
+        'hems_test_seconds_bucket{stage="a\\"b",le="1"} 3',
+        'hems_test_seconds_bucket{stage="a\\"b",le="+Inf"} 4',
+        'hems_test_seconds_sum{stage="a\\"b"} 6.05',
+        'hems_test_seconds_count{stage="a\\"b"} 4',
+    ]
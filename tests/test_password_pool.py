@@ -0,0 +1,61 @@
+import asyncio
+import threading
+import httpx
+import pytest
+from app.config import settings
+from app.main import app
+from app.utils import (
+    PasswordPoolBusy,
+    _run_password_job,
+    get_password_hash_async,
+    password_pool,
+    shutdown_password_pool,
+    verify_password_async,
+)
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture(autouse=True)
+def pool(monkeypatch):
+    monkeypatch.setattr(settings, "BCRYPT_ROUNDS", 4)
+    monkeypatch.setattr(settings, "PASSWORD_POOL_USE_PROCESSES", False)
+    monkeypatch.setattr(password_pool, "rejected", 0)
+    yield password_pool
+    shutdown_password_pool()
+
+
+async def test_hashing_runs_off_the_event_loop():
+    hashed = await get_password_hash_async("secret")
+
+    assert await verify_password_async("secret", hashed)
+    assert not await verify_password_async("wrong", hashed)
+    thread = await _run_password_job(lambda: threading.current_thread().name)
+    assert thread.startswith("bcrypt")
+
+
+async def test_jobs_beyond_max_pending_are_rejected(pool, monkeypatch):
+    monkeypatch.setattr(settings, "PASSWORD_POOL_MAX_PENDING", 1)
+    release = threading.Event()
+    running = asyncio.ensure_future(_run_password_job(release.wait, 5))
+    await asyncio.sleep(0.01)
+
+    with pytest.raises(PasswordPoolBusy):
+        await get_password_hash_async("secret")
+    release.set()
+    assert await running
+    assert pool.pending == 0 and pool.rejected == 1
+
+
+async def test_busy_pool_turns_logins_away(mongo, pool, monkeypatch):
+    await mongo["users"].insert_one({"email": "owner@example.com", "hashed_password": "x"})
+    monkeypatch.setattr(pool, "pending", settings.PASSWORD_POOL_MAX_PENDING)
+
+    async with httpx.AsyncClient(app=app, base_url="http://test") as client:
+        response = await client.post(
+            f"{settings.API_V1_STR}/auth/login",
+            data={"username": "owner@example.com", "password": "secret"},
+        )
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
@@ -0,0 +1,76 @@
+import pytest
+from pymongo import WriteConcern
+from app.config import settings
+from app.database import (
+    PoolStats,
+    _create_client,
+    db,
+    get_collection,
+    get_pool_options,
+    get_pool_stats,
+)
+
+
+@pytest.fixture
+def profile(monkeypatch):
+    def use(name, **overrides):
+        monkeypatch.setattr(settings, "MONGODB_POOL_PROFILE", name)
+        for setting, value in overrides.items():
+            monkeypatch.setattr(settings, setting, value)
+        return get_pool_options()
+
+    return use
+
+
+def test_profile_options_and_overrides(profile):
+    assert profile("default") == {"maxPoolSize": 100, "minPoolSize": 0}
+    assert profile("ingest", MONGODB_MAX_POOL_SIZE=50, MONGODB_READ_PREFERENCE="nearest") == {
+        "maxPoolSize": 50,
+        "minPoolSize": 20,
+        "maxIdleTimeMS": 300000,
+        "readPreference": "nearest",
+    }
+    with pytest.raises(ValueError):
+        profile("huge")
+
+
+def test_unavailable_compressors_are_skipped(profile):
+    options = profile("default", MONGODB_COMPRESSORS="zlib, lz4")
+    assert options["compressors"] == "zlib"
+
+
+def test_client_is_built_with_the_pool_options(profile, monkeypatch):
+    monkeypatch.setattr(db, "pool_stats", {})
+    client = _create_client("default", profile("small"))
+    try:
+        pool_options = client.delegate.options.pool_options
+        assert (pool_options.max_pool_size, pool_options.min_pool_size) == (20, 2)
+        assert get_pool_stats()["pools"]["default"]["max_size"] == 20
+    finally:
+        client.close()
+
+
+def test_pool_stats_follow_checkouts():
+    stats = PoolStats(max_size=4)
+    stats.connection_created(None)
+    stats.connection_check_out_started(None)
+    stats.connection_checked_out(None)
+    stats.connection_check_out_started(None)
+
+    assert stats.as_dict()["open"] == 1
+    assert (stats.as_dict()["in_use"], stats.as_dict()["waiting"]) == (1, 1)
+    assert stats.as_dict()["saturation"] == 0.25
+
+    stats.connection_check_out_failed(None)
+    stats.connection_checked_in(None)
+    assert (stats.as_dict()["in_use"], stats.as_dict()["waiting"]) == (0, 0)
+    assert stats.as_dict()["checkout_failed"] == 1
+
+
+def test_operation_classes_carry_their_write_concern(mongo):
+    ingest = get_collection("consumptions", "ingest")
+    billing = get_collection("subscriptions", "billing")
+
+    assert ingest.write_concern == WriteConcern(w=1, j=False)
+    assert billing.write_concern == WriteConcern(w="majority", j=True)
+    assert get_collection("consumptions", "ingest") is ingest
@@ -0,0 +1,58 @@
+import asyncio
+import pytest
+from bson import ObjectId
+from app.services.ai_service import AIService
+from app.services.prediction_scheduler import PredictionScheduler
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def requests(monkeypatch):
+    requests = []
+
+    async def fetch_ai_prediction(user_id):
+        requests.append([user_id])
+        return {"user_id": user_id}
+
+    async def fetch_ai_predictions(user_ids):
+        requests.append(list(user_ids))
+        return [{"user_id": user_id} for user_id in user_ids]
+
+    monkeypatch.setattr(AIService, "fetch_ai_prediction", fetch_ai_prediction)
+    monkeypatch.setattr(AIService, "fetch_ai_predictions", fetch_ai_predictions)
+    return requests
+
+
+async def test_requests_within_the_window_are_coalesced_and_batched(requests):
+    scheduler = PredictionScheduler(window=0.05, max_concurrency=2, max_queue=10, batch_size=10)
+    first, second = ObjectId(), ObjectId()
+    try:
+        assert scheduler.schedule(first)
+        assert scheduler.schedule(second)
+        assert not scheduler.schedule(first)
+        assert requests == []
+
+        await asyncio.sleep(0.1)
+        assert requests == [[first, second]]
+
+        # Once predicted, a new reading schedules a fresh prediction
+        assert scheduler.schedule(first)
+        await asyncio.sleep(0.1)
+        assert requests == [[first, second], [first]]
+    finally:
+        await scheduler.stop()
+
+    stats = scheduler.stats()
+    assert (stats["scheduled"], stats["coalesced"], stats["completed"]) == (3, 1, 3)
+
+
+async def test_full_queue_drops_new_users(requests):
+    scheduler = PredictionScheduler(window=0.05, max_concurrency=1, max_queue=1, batch_size=1)
+    try:
+        scheduler.schedule(ObjectId())
+        # The dispatcher has not run yet, so the queue still holds the first user
+        assert not scheduler.schedule(ObjectId())
+    finally:
+        await scheduler.stop()
+    assert scheduler.overflow == 1
@@ -0,0 +1,73 @@
+import pytest
+from fastapi import HTTPException
+from app.auth import _principal_cache, _resolve_user, create_stream_token
+from app.models import User
+from app.services.meter_service import MeterService
+from app.services.save_mode_service import SaveModeService
+from app.utils import create_access_token
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def user(mongo):
+    _principal_cache.clear()
+    MeterService._cache.clear()
+    user = User(
+        name="Owner",
+        email="owner@example.com",
+        hashed_password="x",
+        building_type="house",
+        meter_id="meter-1",
+    )
+    await mongo["users"].insert_one(user.dict(by_alias=True))
+    yield user
+    _principal_cache.clear()
+
+
+def _token(user):
+    return create_access_token(data={"sub": user.email, "uid": str(user.id)})
+
+
+async def test_principal_is_cached_until_the_user_changes(mongo, user):
+    token = _token(user)
+    first = await _resolve_user(token)
+    await mongo["users"].update_one({"_id": user.id}, {"$set": {"name": "Renamed"}})
+
+    # Served from the cache, so the direct write is not seen yet
+    assert (await _resolve_user(token)).name == first.name == "Owner"
+
+    assert await SaveModeService.enable_save_mode(user.id, "test")
+    resolved = await _resolve_user(token)
+    assert resolved.save_mode and resolved.name == "Renamed"
+
+
+async def test_cached_principal_needs_a_matching_email(mongo, user):
+    other = User(
+        name="Other",
+        email="other@example.com",
+        hashed_password="x",
+        building_type="house",
+        meter_id="meter-2",
+    )
+    await mongo["users"].insert_one(other.dict(by_alias=True))
+    await _resolve_user(_token(user))
+
+    mismatched = create_access_token(data={"sub": other.email, "uid": str(user.id)})
+    assert (await _resolve_user(mismatched)).id == other.id
+    assert (await _resolve_user(_token(user))).id == user.id
+
+
+async def test_tokens_without_uid_are_not_cached(mongo, user):
+    await _resolve_user(create_access_token(data={"sub": user.email}))
+    assert len(_principal_cache) == 0
+
+
+async def test_stream_tokens_only_resolve_with_their_scope(mongo, user):
+    stream_token = create_stream_token(user)
+
+    with pytest.raises(HTTPException):
+        await _resolve_user(stream_token)
+    assert (await _resolve_user(stream_token, scope="alerts:stream")).id == user.id
+    with pytest.raises(HTTPException):
+        await _resolve_user(_token(user), scope="alerts:stream")
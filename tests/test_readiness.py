@@ -0,0 +1,97 @@
+import asyncio
+import time
+import httpx
+import pytest
+from app.ai_client import ai_client
+from app.ai_stub import app as ai_stub_app
+from app.database import db
+from app.health import ReadinessProbe, readiness
+from app.main import app
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def ai_service(monkeypatch):
+    client = httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=ai_stub_app), base_url="http://ai"
+    )
+    monkeypatch.setattr(ai_client, "client", client)
+    return client
+
+
+@pytest.fixture
+def probe(monkeypatch):
+    monkeypatch.setattr(readiness, "_result", None)
+    monkeypatch.setattr(readiness, "_ai", None)
+    return readiness
+
+
+async def _get_ready():
+    async with httpx.AsyncClient(app=app, base_url="http://test") as client:
+        return await client.get("/ready")
+
+
+async def test_ready_when_dependencies_answer(mongo, ai_service, probe):
+    response = await _get_ready()
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["status"] == "ready"
+    assert body["checks"]["mongodb"]["ok"] and body["checks"]["ai_service"]["ok"]
+    assert body["checks"]["mongodb"]["latency_ms"] is not None
+
+
+async def test_ai_outage_only_degrades(mongo, probe, monkeypatch):
+    async def unreachable(request):
+        raise httpx.ConnectError("refused")
+
+    monkeypatch.setattr(
+        ai_client,
+        "client",
+        httpx.AsyncClient(transport=httpx.MockTransport(unreachable), base_url="http://ai"),
+    )
+    response = await _get_ready()
+
+    assert response.status_code == 200
+    assert response.json()["status"] == "degraded"
+    assert "ConnectError" in response.json()["checks"]["ai_service"]["error"]
+
+
+async def test_not_ready_without_mongodb_or_while_draining(mongo, ai_service, probe, monkeypatch):
+    monkeypatch.setattr(db, "client", None)
+    response = await _get_ready()
+    assert response.status_code == 503
+    assert response.json()["checks"]["mongodb"]["error"] == "not connected"
+
+    monkeypatch.setattr(probe, "draining", True)
+    response = await _get_ready()
+    assert response.status_code == 503
+    assert response.json()["status"] == "draining"
+
+
+async def test_concurrent_probes_share_one_evaluation(monkeypatch):
+    probe = ReadinessProbe()
+    evaluations = []
+
+    async def evaluate():
+        evaluations.append(1)
+        await asyncio.sleep(0.01)
+        probe._result = {"ready": True}
+        probe._checked_at = time.monotonic()
+        return probe._result
+
+    monkeypatch.setattr(probe, "_evaluate", evaluate)
+    results = await asyncio.gather(*(probe.check() for _ in range(5)))
+    await probe.check()
+
+    assert all(result == {"ready": True} for result in results)
+    assert len(evaluations) == 1
+
+
+async def test_liveness_needs_no_dependencies(monkeypatch):
+    monkeypatch.setattr(db, "client", None)
+    async with httpx.AsyncClient(app=app, base_url="http://test") as client:
+        response = await client.get("/health")
+    assert response.status_code == 200
+    assert response.json()["status"] == "alive"
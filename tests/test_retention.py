@@ -0,0 +1,112 @@
+import gzip
+from datetime import datetime, timedelta
+import mongomock_motor
+import pytest
+from bson import ObjectId, json_util
+from pymongo import ASCENDING, IndexModel
+from app.config import settings
+from app.health import readiness
+from app.indexes import INDEXES, RETENTION_DAYS, ensure_indexes, has_drift
+from app.services.retention_service import RetentionService
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def alerts_retained(monkeypatch):
+    monkeypatch.setitem(RETENTION_DAYS, "alerts", 30)
+    monkeypatch.setattr(settings, "EXPORT_BATCH_SIZE", 2)
+
+
+async def _insert_old_alerts(mongo, count):
+    timestamp = datetime.utcnow() - timedelta(days=60)
+    ids = [ObjectId() for _ in range(count)]
+    await mongo["alerts"].insert_many(
+        [
+            {"_id": _id, "user_id": ObjectId(), "timestamp": timestamp + timedelta(minutes=n)}
+            for n, _id in enumerate(ids)
+        ]
+    )
+    return ids
+
+
+def _archived_ids(path):
+    with gzip.open(path, "rt", encoding="utf-8") as archive_file:
+        return [json_util.loads(line)["_id"] for line in archive_file]
+
+
+async def test_archive_deletes_each_batch_once_written(mongo, tmp_path, alerts_retained):
+    ids = await _insert_old_alerts(mongo, 5)
+
+    result = await RetentionService.archive("alerts", directory=str(tmp_path), delete=True)
+
+    assert result["documents"] == result["deleted"] == 5
+    assert _archived_ids(result["file"]) == ids
+    assert await mongo["alerts"].count_documents({}) == 0
+
+
+async def test_failed_archive_keeps_deleted_documents_in_the_partial_file(
+    mongo, tmp_path, alerts_retained, monkeypatch
+):
+    ids = await _insert_old_alerts(mongo, 5)
+    to_list = mongomock_motor.AsyncCursor.to_list
+    calls = {"count": 0}
+
+    async def failing_to_list(self, length=None):
+        calls["count"] += 1
+        if calls["count"] == 2:
+            raise RuntimeError("cursor lost")
+        return await to_list(self, length)
+
+    monkeypatch.setattr(mongomock_motor.AsyncCursor, "to_list", failing_to_list)
+    with pytest.raises(RuntimeError):
+        await RetentionService.archive("alerts", directory=str(tmp_path), delete=True)
+
+    [partial] = tmp_path.iterdir()
+    assert partial.name.endswith(".partial")
+    assert _archived_ids(partial) == ids[:2]
+    assert await mongo["alerts"].count_documents({}) == 3
+
+
+async def test_archive_lag(mongo, tmp_path, alerts_retained):
+    lag = await RetentionService.archive_lag("alerts")
+    assert lag["archived_until"] is None and lag["lag_seconds"] is None
+
+    # A run with nothing to archive still moves the archive forward
+    result = await RetentionService.archive("alerts", directory=str(tmp_path))
+    assert result["file"] is None
+    lag = await RetentionService.archive_lag("alerts")
+    assert lag["lag_seconds"] <= -(settings.ARCHIVE_AHEAD_DAYS - 1) * 86400
+
+    assert await RetentionService.archive_lag("users") is None
+
+
+def test_retention_is_off_by_default():
+    assert settings.ALERT_RETENTION_DAYS == 0
+    assert settings.PREDICTION_RETENTION_DAYS == 0
+
+
+async def test_readiness_reports_unarchived_expiry(mongo, tmp_path, alerts_retained):
+    check = await readiness._check_retention()
+    assert not check["ok"] and "alerts" in check["collections"]
+
+    await RetentionService.archive("alerts", directory=str(tmp_path))
+    assert (await readiness._check_retention())["ok"]
+
+
+async def test_retention_index_is_dropped_once_retention_is_off(mongo, monkeypatch):
+    expiring = IndexModel([("timestamp", ASCENDING)], expireAfterSeconds=30 * 86400)
+    monkeypatch.setitem(INDEXES, "alerts", INDEXES["alerts"] + [expiring])
+    await ensure_indexes(mongo)
+    assert "timestamp_1" in await mongo["alerts"].index_information()
+
+    # RETENTION_DAYS set back to 0: the TTL index is no longer declared
+    monkeypatch.setitem(INDEXES, "alerts", INDEXES["alerts"][:-1])
+    check = await ensure_indexes(mongo, create=False)
+    assert check["alerts"]["unexpected"] == ["timestamp_1"]
+
+    report = await ensure_indexes(mongo)
+    assert report["alerts"]["dropped"] == ["timestamp_1"]
+    assert "timestamp_1" not in await mongo["alerts"].index_information()
+    check = await ensure_indexes(mongo, create=False)
+    assert not has_drift({"alerts": check["alerts"]})
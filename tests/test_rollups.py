@@ -0,0 +1,46 @@
+from datetime import datetime, timedelta, timezone
+import pytest
+from bson import ObjectId
+from app.services.rollup_service import RollupService
+
+pytestmark = pytest.mark.anyio
+
+
+def _document(user_id, timestamp, kwh=1.0):
+    return {
+        "_id": ObjectId(),
+        "user_id": user_id,
+        "timestamp": timestamp,
+        "power_usage_kwh": kwh,
+        "total_power_watt": kwh * 1000,
+    }
+
+
+async def test_mixed_naive_and_offset_timestamps_share_the_utc_period(mongo):
+    user_id = ObjectId()
+    plus_three = timezone(timedelta(hours=3))
+    documents = [
+        _document(user_id, datetime(2024, 1, 1, 10, 30)),
+        # 10:15 UTC, though its wall clock says 13:15
+        _document(user_id, datetime(2024, 1, 1, 13, 15, tzinfo=plus_three)),
+    ]
+
+    await RollupService.apply(documents)
+
+    hourly = await mongo["consumption_hourly"].find({"user_id": user_id}).to_list(None)
+    assert len(hourly) == 1
+    assert hourly[0]["period_start"] == datetime(2024, 1, 1, 10)
+    assert hourly[0]["count"] == 2
+    assert hourly[0]["first_timestamp"] == datetime(2024, 1, 1, 10, 15)
+
+
+async def test_offset_timestamp_lands_in_its_utc_day(mongo):
+    user_id = ObjectId()
+    # 2024-01-01 22:00 UTC
+    late = datetime(2024, 1, 2, 1, 0, tzinfo=timezone(timedelta(hours=3)))
+
+    await RollupService.apply([_document(user_id, late, kwh=2.0)])
+
+    daily = await mongo["consumption_daily"].find_one({"user_id": user_id})
+    assert daily["period_start"] == datetime(2024, 1, 1)
+    assert daily["kwh"] == 2.0
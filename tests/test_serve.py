@@ -0,0 +1,23 @@
+from app import serve
+
+
+def test_several_workers_need_shared_state(monkeypatch):
+    started = []
+    monkeypatch.setattr(serve.uvicorn, "run", lambda *args, **kwargs: started.append(kwargs))
+    monkeypatch.setattr(serve.settings, "STATE_BACKEND", "memory")
+
+    assert serve.main(["--workers", "2"]) == 2
+    assert started == []
+
+    assert serve.main(["--workers", "2", "--allow-unshared-state"]) == 0
+    assert serve.main(["--workers", "1"]) == 0
+    assert [run["workers"] for run in started] == [2, 1]
+
+
+def test_shared_state_allows_several_workers(monkeypatch):
+    started = []
+    monkeypatch.setattr(serve.uvicorn, "run", lambda *args, **kwargs: started.append(kwargs))
+    monkeypatch.setattr(serve.settings, "STATE_BACKEND", "redis")
+
+    assert serve.main(["--workers", "4"]) == 0
+    assert started[0]["workers"] == 4
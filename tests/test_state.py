@@ -0,0 +1,49 @@
+import asyncio
+import pytest
+from app.cache import TTLCache
+from app.redis_stub import RedisStub
+from app.state import RedisStateBackend
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def redis_url():
+    server = await RedisStub().serve("127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    yield f"redis://127.0.0.1:{port}/0"
+    server.close()
+    await server.wait_closed()
+
+
+@pytest.fixture
+async def workers(redis_url):
+    backends = [RedisStateBackend(redis_url, "test:") for _ in range(2)]
+    for backend in backends:
+        await backend.connect()
+    yield backends
+    for backend in backends:
+        await backend.close()
+
+
+async def test_a_key_is_claimed_by_one_worker(workers):
+    first, second = workers
+    assert await first.claim("prediction:1", ttl=5)
+    assert not await second.claim("prediction:1", ttl=5)
+    assert await second.claim("prediction:2", ttl=5)
+
+
+async def test_invalidations_reach_every_worker(workers):
+    caches = [TTLCache(maxsize=10, ttl=60) for _ in workers]
+    for backend, cache in zip(workers, caches):
+        backend.register_cache("user", cache)
+        cache.set("42", "cached")
+
+    workers[0].invalidate("user", "42")
+    for _ in range(100):
+        if caches[1].get("42") is None:
+            break
+        await asyncio.sleep(0.01)
+
+    assert [cache.get("42") for cache in caches] == [None, None]
+    assert workers[1].received == 1
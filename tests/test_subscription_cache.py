@@ -0,0 +1,72 @@
+from datetime import datetime, timedelta
+import mongomock_motor
+import pytest
+from bson import ObjectId
+from app.services.subscription_service import SubscriptionService
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def user_id(mongo):
+    SubscriptionService._active_cache.clear()
+    user_id = ObjectId()
+    await mongo["subscriptions"].insert_one(
+        {
+            "user_id": user_id,
+            "plan_id": "basic",
+            "plan_name": "Basic Plan",
+            "total_kwh": 50.0,
+            "remaining_kwh": 10.0,
+            "price": 10.0,
+            "start_date": datetime.utcnow(),
+            "end_date": datetime.utcnow() + timedelta(days=30),
+            "status": "active",
+            "alerts_triggered": [],
+        }
+    )
+    yield user_id
+    SubscriptionService._active_cache.clear()
+
+
+@pytest.fixture
+def reads(monkeypatch):
+    reads = []
+    find_one = mongomock_motor.AsyncMongoMockCollection.find_one
+
+    async def counted(self, *args, **kwargs):
+        reads.append(args)
+        return await find_one(self, *args, **kwargs)
+
+    monkeypatch.setattr(mongomock_motor.AsyncMongoMockCollection, "find_one", counted)
+    return reads
+
+
+async def test_deduction_keeps_the_cached_subscription_current(mongo, user_id, reads):
+    assert (await SubscriptionService.get_active_subscription(user_id)).remaining_kwh == 10.0
+    assert await SubscriptionService.deduct_energy(user_id, 4.0)
+    await SubscriptionService.deduct_energy_many({user_id: [1.0]})
+
+    assert (await SubscriptionService.get_active_subscription(user_id)).remaining_kwh == 5.0
+    assert await SubscriptionService.get_subscription_percentage(user_id) == 10.0
+    assert len(reads) == 1
+
+
+async def test_refused_deduction_drops_the_cached_subscription(mongo, user_id, reads):
+    await SubscriptionService.get_active_subscription(user_id)
+    await mongo["subscriptions"].update_one({"user_id": user_id}, {"$set": {"remaining_kwh": 50.0}})
+    assert (await SubscriptionService.get_active_subscription(user_id)).remaining_kwh == 10.0
+
+    # After a refused deduction the cached balance is not trusted
+    assert await SubscriptionService.deduct_energy(user_id, 60.0) is None
+    assert (await SubscriptionService.get_active_subscription(user_id)).remaining_kwh == 50.0
+    assert len(reads) == 2
+
+
+async def test_plan_change_drops_the_cached_subscription(mongo, user_id):
+    await SubscriptionService.get_active_subscription(user_id)
+
+    assert await SubscriptionService.upgrade_plan(user_id, "premium")
+
+    subscription = await SubscriptionService.get_active_subscription(user_id)
+    assert subscription.plan_id == "premium"
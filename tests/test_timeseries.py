@@ -0,0 +1,34 @@
+import pytest
+from app import timeseries
+
+pytestmark = pytest.mark.anyio
+
+
+class _Server:
+    def __init__(self, version):
+        self.version = version
+
+    async def server_info(self):
+        return {
+            "version": self.version,
+            "versionArray": [int(part) for part in self.version.split(".")] + [0],
+        }
+
+
+async def test_time_series_needs_a_server_that_deletes_by_id():
+    with pytest.raises(RuntimeError, match="7.0"):
+        await timeseries.check_server(_Server("6.0.12"))
+    await timeseries.check_server(_Server("7.0.2"))
+
+
+def test_stored_layout_round_trip(monkeypatch):
+    monkeypatch.setattr(timeseries.settings, "CONSUMPTIONS_TIMESERIES", True)
+    flat = {"_id": 1, "user_id": 2, "device_id": "d", "location": "home", "timestamp": 3}
+
+    stored = timeseries.to_stored(flat)
+    assert stored["meta"] == {"user_id": 2, "device_id": "d", "location": "home"}
+    assert timeseries.from_stored(stored) == flat
+    assert timeseries.stored_query({"user_id": 2, "timestamp": 3}) == {
+        "meta.user_id": 2,
+        "timestamp": 3,
+    }